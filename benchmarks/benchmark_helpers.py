@@ -1,5 +1,8 @@
 from collections import defaultdict
-from glob import iglob
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from glob import glob
+from itertools import islice
 
 import argparse
 import os
@@ -11,6 +14,8 @@ from lib.algorithms import PathFormulation, TEAVAR
 from lib.algorithms.abstract_formulation import OBJ_STRS
 from lib.partitioning import FMPartitioning, SpectralClustering
 from lib.config import TOPOLOGIES_DIR, TM_DIR
+from lib.problem import Problem
+from lib.traffic_matrix import TrafficMatrix
 
 PROBLEM_NAMES = [
     'B4.json',
@@ -40,64 +45,202 @@ PROBLEM_NAMES_AND_TM_MODELS = [
     (prob_name, tm_model) for prob_name in PROBLEM_NAMES for tm_model in TM_MODELS
 ]
 
-PROBLEMS = []
-GROUPED_BY_PROBLEMS = defaultdict(list)
-HOLDOUT_PROBLEMS = []
-GROUPED_BY_HOLDOUT_PROBLEMS = defaultdict(list)
 
-for problem_name in PROBLEM_NAMES:
+def topology_fname(problem_name, topologies_dir=TOPOLOGIES_DIR):
     if problem_name.endswith(".graphml"):
-        topo_fname = os.path.join(TOPOLOGIES_DIR, "topology-zoo", problem_name)
-    else:
-        topo_fname = os.path.join(TOPOLOGIES_DIR, problem_name)
-    for model in TM_MODELS:
-        for tm_fname in iglob(
-            "{}/{}/{}*_traffic-matrix.pkl".format(TM_DIR, model, problem_name)
-        ):
-            vals = os.path.basename(tm_fname)[:-4].split("_")
-            _, traffic_seed, scale_factor = vals[1], int(vals[2]), float(vals[3])
-            GROUPED_BY_PROBLEMS[(problem_name, model, scale_factor)].append(
-                (topo_fname, tm_fname)
-            )
-            PROBLEMS.append((problem_name, topo_fname, tm_fname))
-        for tm_fname in iglob(
-            "{}/{}/{}*_traffic-matrix.txt".format(TM_DIR, model, problem_name)
-        ):
-            vals = os.path.basename(tm_fname)[:-4].split("_")
-            _, traffic_seed, scale_factor = vals[1], int(vals[2]), float(vals[3])
-            GROUPED_BY_PROBLEMS[(problem_name, model, scale_factor)].append(
-                (topo_fname, tm_fname)
-            )
-            PROBLEMS.append((problem_name, topo_fname, tm_fname))
-
-        for tm_fname in iglob(
-            "{}/holdout/{}/{}*_traffic-matrix.pkl".format(
-                TM_DIR, model, problem_name
-            )
-        ):
-            vals = os.path.basename(tm_fname)[:-4].split("_")
-            _, traffic_seed, scale_factor = vals[1], int(vals[2]), float(vals[3])
-            GROUPED_BY_HOLDOUT_PROBLEMS[(problem_name, model, scale_factor)].append(
-                (topo_fname, tm_fname)
-            )
-            HOLDOUT_PROBLEMS.append((problem_name, topo_fname, tm_fname))
-
-GROUPED_BY_PROBLEMS = dict(GROUPED_BY_PROBLEMS)
-for key, vals in GROUPED_BY_PROBLEMS.items():
-    GROUPED_BY_PROBLEMS[key] = sorted(vals, 
-        key=lambda x: int(x[-1].split('_')[-3]))
-
-GROUPED_BY_HOLDOUT_PROBLEMS = dict(GROUPED_BY_HOLDOUT_PROBLEMS)
-for key, vals in GROUPED_BY_HOLDOUT_PROBLEMS.items():
-    GROUPED_BY_HOLDOUT_PROBLEMS[key] = sorted(vals, 
-        key=lambda x: int(x[-1].split('_')[-3]))
+        return os.path.join(topologies_dir, "topology-zoo", problem_name)
+    return os.path.join(topologies_dir, problem_name)
+
+
+# Order of the traffic matrices of a (problem, model, scale factor) group
+def tm_fname_key(tm_fname):
+    return int(tm_fname.split("_")[-3])
+
+
+def tm_fname_scale_factor(tm_fname):
+    return float(os.path.basename(tm_fname).split("_")[3])
+
+
+# Traffic matrix files of a model directory: .pkl and .txt files under tm_dir,
+# but only .pkl files under its holdout directory
+def tm_fname_exts(holdout):
+    return ["pkl"] if holdout else ["pkl", "txt"]
+
+
+# Lazy, sliceable stream of the problems of every traffic matrix under tm_dir
+# (or its holdout directory) of the given topologies, models and scale factors
+# ("all" for every one). Problems are ordered by topology, then model, then
+# scale factor, then tm_fname_key, which is also the order of PROBLEMS and
+# GROUPED_BY_PROBLEMS (see problem_tables). Iterating over it yields
+# (problem name, topology file, traffic matrix file, Problem) tuples:
+#   - a directory is only listed when the stream reaches it, and a traffic
+#     matrix is only loaded when it is about to be yielded
+#   - each topology is loaded once, and all the problems of its traffic
+#     matrices share it copy-on-write (see Problem.with_traffic_matrix)
+#   - unless prefetch is False, the next problem is loaded on a background
+#     thread while the caller works on the current one
+# stream[i:j] is the stream of problems i to j - 1, so stream[i:] resumes a
+# sweep at problem i; the problems before i are skipped without being loaded
+class ProblemStream(object):
+    def __init__(
+        self,
+        topos="all",
+        tm_models="all",
+        scale_factors="all",
+        *,
+        holdout=False,
+        tm_dir=TM_DIR,
+        topologies_dir=TOPOLOGIES_DIR,
+        start=0,
+        stop=None,
+        step=1,
+        prefetch=True,
+    ):
+        self.topos = PROBLEM_NAMES if topos == "all" else list(topos)
+        self.tm_models = TM_MODELS if tm_models == "all" else list(tm_models)
+        self.scale_factors = scale_factors
+        self.holdout = holdout
+        self.tm_dir = tm_dir
+        self.topologies_dir = topologies_dir
+        self.start = start
+        self.stop = stop
+        self.step = step
+        self.prefetch = prefetch
+        # the problem of the most recently loaded topology
+        self._topo_fname, self._topo_problem = None, None
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise Exception("ProblemStreams can only be sliced")
+        start, stop, step = index.start or 0, index.stop, index.step or 1
+        if start < 0 or (stop is not None and stop < 0) or step < 1:
+            raise Exception("ProblemStreams only support non-negative slices")
+        stream = ProblemStream(
+            self.topos,
+            self.tm_models,
+            self.scale_factors,
+            holdout=self.holdout,
+            tm_dir=self.tm_dir,
+            topologies_dir=self.topologies_dir,
+            start=self.start + start * self.step,
+            step=self.step * step,
+            prefetch=self.prefetch,
+        )
+        stops = [] if self.stop is None else [self.stop]
+        if stop is not None:
+            stops.append(self.start + stop * self.step)
+        stream.stop = min(stops) if stops else None
+        return stream
+
+    def _has_scale_factor(self, tm_fname):
+        if self.scale_factors == "all" or "all" in self.scale_factors:
+            return True
+        return tm_fname_scale_factor(tm_fname) in self.scale_factors
+
+    # (problem name, topology file, traffic matrix file) of every problem
+    def fnames(self):
+        tm_dir = os.path.join(self.tm_dir, "holdout") if self.holdout else self.tm_dir
+        for problem_name in self.topos:
+            topo_fname = topology_fname(problem_name, self.topologies_dir)
+            for model in self.tm_models:
+                tm_fnames = sorted(
+                    (
+                        tm_fname
+                        for ext in tm_fname_exts(self.holdout)
+                        for tm_fname in glob(
+                            "{}/{}/{}*_traffic-matrix.{}".format(
+                                tm_dir, model, problem_name, ext
+                            )
+                        )
+                        if self._has_scale_factor(tm_fname)
+                    ),
+                    key=lambda tm_fname: (
+                        tm_fname_scale_factor(tm_fname),
+                        tm_fname_key(tm_fname),
+                    ),
+                )
+                for tm_fname in tm_fnames:
+                    yield problem_name, topo_fname, tm_fname
+
+    def __iter__(self):
+        fnames = islice(self.fnames(), self.start, self.stop, self.step)
+        if not self.prefetch:
+            for problem_name, topo_fname, tm_fname in fnames:
+                yield problem_name, topo_fname, tm_fname, self._load(
+                    topo_fname, tm_fname
+                )
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # submit the next problem before yielding the current one
+            current = None
+            for next_fnames in fnames:
+                next_problem = executor.submit(self._load, *next_fnames[1:])
+                if current is not None:
+                    yield current[0] + (current[1].result(),)
+                current = (next_fnames, next_problem)
+            if current is not None:
+                yield current[0] + (current[1].result(),)
+
+    # Only the problem of the most recent topology is kept, since the
+    # problems of a topology are consecutive
+    def _load(self, topo_fname, tm_fname):
+        if self._topo_fname != topo_fname:
+            problem = Problem.from_file(topo_fname, tm_fname)
+            # compute the arrays that every copy shares now, on this thread
+            problem.topology, problem.capacities
+            self._topo_fname, self._topo_problem = topo_fname, problem
+            return problem.copy()
+        return self._topo_problem.with_traffic_matrix(
+            TrafficMatrix.from_file(tm_fname)
+        )
+
+
+# PROBLEMS and GROUPED_BY_PROBLEMS (or, if holdout is True, HOLDOUT_PROBLEMS
+# and GROUPED_BY_HOLDOUT_PROBLEMS) of the traffic matrices under tm_dir:
+#   - PROBLEMS: (problem name, topology file, traffic matrix file) of every
+#     problem, in the order of ProblemStream
+#   - GROUPED_BY_PROBLEMS: (topology file, traffic matrix file) of the problems
+#     of every (problem name, model, scale factor), in the same order
+# They are listed on the first call, not when this module is imported
+@lru_cache(maxsize=None)
+def problem_tables(holdout=False, tm_dir=TM_DIR):
+    problems = []
+    grouped_by_problems = defaultdict(list)
+    for problem_name, topo_fname, tm_fname in ProblemStream(
+        holdout=holdout, tm_dir=tm_dir
+    ).fnames():
+        model = os.path.basename(os.path.dirname(tm_fname))
+        grouped_by_problems[
+            (problem_name, model, tm_fname_scale_factor(tm_fname))
+        ].append((topo_fname, tm_fname))
+        problems.append((problem_name, topo_fname, tm_fname))
+    return problems, dict(grouped_by_problems)
+
+
+_PROBLEM_TABLES = {
+    "PROBLEMS": (False, 0),
+    "GROUPED_BY_PROBLEMS": (False, 1),
+    "HOLDOUT_PROBLEMS": (True, 0),
+    "GROUPED_BY_HOLDOUT_PROBLEMS": (True, 1),
+}
+
+
+# Module attributes PROBLEMS, GROUPED_BY_PROBLEMS, HOLDOUT_PROBLEMS and
+# GROUPED_BY_HOLDOUT_PROBLEMS, built by problem_tables on first access
+def __getattr__(name):
+    if name in _PROBLEM_TABLES:
+        holdout, index = _PROBLEM_TABLES[name]
+        return problem_tables(holdout)[index]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 # This should be called when `many_problems` is False
 def get_problem(args):
-    if (args.topo, args.tm_model, args.scale_factor) not in GROUPED_BY_PROBLEMS:
+    grouped_by_problems = problem_tables()[1]
+    if (args.topo, args.tm_model, args.scale_factor) not in grouped_by_problems:
         raise Exception('Traffic matrices not found')
-    topo_fname, tm_fname = GROUPED_BY_PROBLEMS[
+    topo_fname, tm_fname = grouped_by_problems[
         (args.topo, args.tm_model, args.scale_factor)
     ][args.slice]
     return [(args.topo, topo_fname, tm_fname)]
@@ -109,7 +252,7 @@ def get_problems(args):
     for (
         (problem_name, tm_model, scale_factor),
         topo_and_tm_fnames,
-    ) in GROUPED_BY_PROBLEMS.items():
+    ) in problem_tables()[1].items():
         for topo_fname, tm_fname in topo_and_tm_fnames:
             if (
                 ("all" in args.topos or problem_name in args.topos)
@@ -122,6 +265,21 @@ def get_problems(args):
     return problems[args.slice_start:min([len(problems), args.slice_stop])]
 
 
+# The problems of get_problems, in the same order, as a ProblemStream that
+# loads each one (and each topology once) while the previous one is solved
+def get_problem_stream(args):
+    stream = ProblemStream(
+        [name for name in PROBLEM_NAMES if "all" in args.topos or name in args.topos],
+        [
+            model
+            for model in TM_MODELS
+            if "all" in args.tm_models or model in args.tm_models
+        ],
+        args.scale_factors,
+    )
+    return stream[args.slice_start : args.slice_stop]
+
+
 class AlgoClsAction(argparse.Action):
     def __init__(self, option_strings, dest, nargs=None, **kwargs):
         if nargs is not None:
@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+
+from glob import glob
+import argparse
+import os
+import re
+import shutil
+import sys
+
+sys.path.append("..")
+
+from lib.algorithms.path_formulation import PATHS_DIR
+from lib.config import TOPOLOGIES_DIR
+from lib.path_store import convert_paths_pickle, path_store_dir, paths_fname
+from lib.problem import Problem
+from lib.topology import Topology
+
+# One-shot conversion of the pickled path dicts under topologies/paths/path-form
+# to path stores (see lib.path_store). If the topology a pickle was computed for
+# can be found, the edge ids of every path are stored too.
+
+
+# Pickles are named "<problem name>-<num paths>-paths_edge-disjoint-<edge
+# disjoint>_dist-metric-<dist metric>-dict.pkl", and the problem name is the
+# basename of its topology file
+PICKLE_FNAME_RE = re.compile(
+    r"(.+)-(\d+)-paths_edge-disjoint-(True|False)_dist-metric-(.+)-dict\.pkl"
+)
+
+
+def pickle_problem_name(pkl_fname):
+    return os.path.basename(pkl_fname).split("-paths_")[0].rsplit("-", 1)[0]
+
+
+# (num paths, edge disjoint, dist metric) of the paths in pkl_fname, or None if
+# its name does not say
+def pickle_path_settings(pkl_fname):
+    match = PICKLE_FNAME_RE.fullmatch(os.path.basename(pkl_fname))
+    if match is None:
+        return None
+    return int(match.group(2)), match.group(3) == "True", match.group(4)
+
+
+def read_topology(pkl_fname):
+    problem_name = pickle_problem_name(pkl_fname)
+    for topo_fname in [
+        os.path.join(TOPOLOGIES_DIR, problem_name),
+        os.path.join(TOPOLOGIES_DIR, "topology-zoo", problem_name),
+    ]:
+        if not os.path.exists(topo_fname):
+            continue
+        if topo_fname.endswith(".json"):
+            return Problem._read_graph_json(topo_fname)
+        if topo_fname.endswith(".graphml"):
+            return Problem._read_graph_graphml(topo_fname)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "pkl_fnames",
+        nargs="*",
+        help="pickled path dicts to convert (default: all of them in {})".format(
+            PATHS_DIR
+        ),
+    )
+    parser.add_argument(
+        "--overwrite", action="store_true", help="replace existing path stores"
+    )
+    args = parser.parse_args()
+
+    pkl_fnames = args.pkl_fnames or sorted(
+        glob(os.path.join(PATHS_DIR, "*-dict.pkl"))
+    )
+    for pkl_fname in pkl_fnames:
+        G = read_topology(pkl_fname)
+        path_settings = pickle_path_settings(pkl_fname)
+        store_dir = path_store_dir(pkl_fname)
+        if G is not None and path_settings is not None:
+            # Path stores are keyed by the fingerprints of their topology and
+            # of its edge weights (see PathFormulation.paths_full_fname), not
+            # by the problem's name
+            store_dir = path_store_dir(
+                paths_fname(
+                    os.path.dirname(pkl_fname),
+                    Topology.from_graph(G).fingerprint,
+                    G,
+                    *path_settings,
+                )
+            )
+        if os.path.isdir(store_dir):
+            if not args.overwrite:
+                print("Skipping {}; {} exists".format(pkl_fname, store_dir))
+                continue
+            shutil.rmtree(store_dir)
+        convert_paths_pickle(pkl_fname, store_dir, G)
+        print(
+            "Converted {} to {}{}".format(
+                pkl_fname, store_dir, "" if G is not None else " (no edge ids)"
+            )
+        )
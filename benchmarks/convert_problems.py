@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+
+from glob import glob
+import argparse
+import os
+import sys
+
+sys.path.append("..")
+
+from lib.config import TOPOLOGIES_DIR, TM_DIR
+from lib.problem import Problem, problem_bundle_dir
+
+# One-shot conversion of the traffic matrices under traffic-matrices, and the
+# topologies they were generated for, to problem bundles (see
+# Problem.save_bundle), which Problem.from_file then loads instead. Traffic
+# matrices for .dot topologies are skipped, since those are parsed two ways.
+
+
+# Traffic matrices are named "<problem name>_<model>_...", and the problem
+# name is the basename of its topology file
+def topology_fname(tm_fname):
+    problem_name = os.path.basename(tm_fname).split("_")[0]
+    for topo_fname in [
+        os.path.join(TOPOLOGIES_DIR, problem_name),
+        os.path.join(TOPOLOGIES_DIR, "topology-zoo", problem_name),
+    ]:
+        if os.path.exists(topo_fname) and not topo_fname.endswith(".dot"):
+            return topo_fname
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "tm_fnames",
+        nargs="*",
+        help="traffic matrices to convert (default: all of them in {})".format(
+            TM_DIR
+        ),
+    )
+    parser.add_argument(
+        "--sparse",
+        action="store_true",
+        help="store the traffic matrices in sparse mode",
+    )
+    parser.add_argument(
+        "--overwrite", action="store_true", help="replace existing bundles"
+    )
+    args = parser.parse_args()
+
+    tm_fnames = args.tm_fnames or sorted(
+        fname
+        for ext in ["pkl", "txt"]
+        for fname in glob(
+            os.path.join(TM_DIR, "**", "*_traffic-matrix.{}".format(ext)),
+            recursive=True,
+        )
+    )
+    for tm_fname in tm_fnames:
+        bundle_dir = problem_bundle_dir(tm_fname)
+        if os.path.isdir(bundle_dir) and not args.overwrite:
+            print("Skipping {}; {} exists".format(tm_fname, bundle_dir))
+            continue
+        topo_fname = topology_fname(tm_fname)
+        if topo_fname is None:
+            print("Skipping {}; topology not found".format(tm_fname))
+            continue
+        problem = Problem.from_file(topo_fname, tm_fname, use_bundle=False)
+        if args.sparse:
+            problem.traffic_matrix.sparsify()
+        problem.save_bundle(bundle_dir, tm_fname, overwrite=args.overwrite)
+        print("Converted {} to {}".format(tm_fname, bundle_dir))
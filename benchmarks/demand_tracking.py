@@ -11,6 +11,7 @@ sys.path.append("..")
 from lib.constants import NUM_CORES
 from lib.algorithms import PathFormulation, NcfEpi, POP as PopAlgo
 from lib.problem import Problem
+from lib.problem_sequence import ProblemSequence
 from lib.graph_utils import compute_in_or_out_flow
 
 RESULTS_FILE_PLACEHOLDER = "demand-tracking-{}-{}-{}.csv"
@@ -20,43 +21,27 @@ TM_MODEL = "uniform"
 SCALE_FACTOR = 32.0
 
 
-def generate_sequence_of_tms(
-    seed_prob, num_tms, rel_delta_abs_mean, rel_delta_std, seed=1
-):
-    problems = [seed_prob]
-    mean_load = np.mean(seed_prob.traffic_matrix.tm)
-    # The mean and std arguments are relative to this traffic matrix;
-    # we scale them by the actual mean of the seed TM
-    delta_mean = rel_delta_abs_mean * mean_load
-    delta_std = rel_delta_std * mean_load
-
-    np.random.seed(seed)
-    while len(problems) < num_tms:
-        new_prob = problems[-1].copy()
-        # Change each demand by delta mean on average, with a spread of delta_std
-        perturb_mean = np.random.normal(delta_mean, delta_std)
-        perturb_mean *= np.random.choice([-1, 1])
-        new_prob.traffic_matrix.perturb_matrix(perturb_mean, delta_std)
-        problems.append(new_prob)
-
-    return problems
-
-
 class PFWarmStart(object):
     def __init__(self):
         num_paths, edge_disjoint, dist_metric = PATH_FORM_HYPERPARAMS
         self.pf_warm = PathFormulation.new_total_flow(
             num_paths=num_paths, edge_disjoint=edge_disjoint, dist_metric=dist_metric
         )
+        # Build the model over all node pairs, so that it can be re-solved
+        # in place even when a demand drops to (or rises from) zero
         self.pf_warm._warm_start_mode = True
-        self.warm_yet = False
-
-    def solve(self, problem):
-        if self.warm_yet:
-            self.pf_warm.solve_warm_start(problem)
+        # index of the last problem solved
+        self.last_solved = None
+
+    # Only the demands that changed since the last problem solved are
+    # written into the model
+    def solve(self, problems, i):
+        if self.last_solved is not None:
+            delta = problems.delta(i, prev=self.last_solved)
+            self.pf_warm.resolve(problems[i], delta=delta)
         else:
-            self.pf_warm.solve(problem)
-            self.warm_yet = True
+            self.pf_warm.solve(problems[i])
+        self.last_solved = i
 
     @property
     def sol_dict(self):
@@ -78,8 +63,8 @@ class PF(object):
             num_paths=num_paths, edge_disjoint=edge_disjoint, dist_metric=dist_metric
         )
 
-    def solve(self, problem):
-        self.pf.solve(problem)
+    def solve(self, problems, i):
+        self.pf.solve(problems[i])
 
     @property
     def sol_dict(self):
@@ -105,8 +90,8 @@ class NCFlow(object):
         )
         self.partitioner = partition_cls(num_parts)
 
-    def solve(self, problem):
-        self.ncflow.solve(problem, self.partitioner)
+    def solve(self, problems, i):
+        self.ncflow.solve(problems[i], self.partitioner)
 
     @property
     def sol_dict(self):
@@ -139,8 +124,8 @@ class POP(object):
             dist_metric=dist_metric,
         )
 
-    def solve(self, problem):
-        self.pop.solve(problem)
+    def solve(self, problems, i):
+        self.pop.solve(problems[i])
 
     @property
     def sol_dict(self):
@@ -200,6 +185,10 @@ def demand_tracking(
         problems[0].name, residual_factor, algo.name
     )
     print(results_fname)
+    # The residual demand of a step is added to the next step's traffic
+    # matrix, which writes to the sequence's matrices; write to a copy of
+    # them, so that problems is left as it was
+    problems = problems.copy()
     with open(results_fname, "w") as w:
         print_(RESULTS_HEADER, file=w)
 
@@ -207,9 +196,8 @@ def demand_tracking(
         curr_sol_dict = None
 
         while i < len(problems):
-            problem = problems[i]
             print_("\nProblem {}".format(i))
-            algo.solve(problem)
+            algo.solve(problems, i)
             runtime = algo.runtime
             while runtime > time_per_prob and i < len(problems):
                 satisfied_demand, residual_tm = compute_satisfied_demand(
@@ -245,20 +233,15 @@ def demand_tracking(
 
 
 def print_delta_norms(problems):
-    first_prob = problems[0]
-    prev_tm = first_prob.traffic_matrix.tm
-    prev_norm = np.linalg.norm(prev_tm)
+    prev_norm = np.linalg.norm(problems.tms[0])
 
     delta_norm_norms = []
-    for problem in problems[1:]:
-        tm = problem.traffic_matrix.tm
-        delta_tm = tm - prev_tm
-        delta_norm = np.linalg.norm(delta_tm)
+    for i in range(1, len(problems)):
+        delta_norm = np.linalg.norm(problems.delta(i).change)
         delta_norm_norm = delta_norm / prev_norm
         print(delta_norm_norm)
         delta_norm_norms.append(delta_norm_norm)
-        prev_tm = tm
-        prev_norm = np.linalg.norm(tm)
+        prev_norm = np.linalg.norm(problems.tms[i])
 
     print("Mean:", np.mean(delta_norm_norms))
 
@@ -293,7 +276,7 @@ if __name__ == "__main__":
     num_tms = 25
     time_per_prob = 5 * 60
 
-    problems = generate_sequence_of_tms(
+    problems = ProblemSequence.from_perturbations(
         seed_prob, num_tms, rel_delta_abs_mean=0.25, rel_delta_std=0.5
     )
 
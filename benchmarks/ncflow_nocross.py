@@ -149,14 +149,25 @@ def benchmark(problems, output_csv):
 ###
                         partition_vector = partitioner.partition(problem)
 
-                        # zero out cross-partition commodities and edge capacity
-                        for p in range(num_partitions_to_set):
-                            for u in problem.G.nodes:
-                                for v in problem.G.nodes:
-                                    if partition_vector[u] != partition_vector[v]:
-                                        problem.traffic_matrix.tm[u,v] = 0
-                                        if (u,v) in problem.G.edges:
-                                            problem.G[u][v]['capacity'] = 0
+                        # zero out cross-partition commodities and edge capacity;
+                        # through the tm and capacities setters, so that the
+                        # commodity lists and the capacity vector follow
+                        partition_vector = np.asarray(partition_vector)
+                        same_partition = (
+                            partition_vector[:, None] == partition_vector[None, :]
+                        )
+                        tm = problem.traffic_matrix.tm_view
+                        problem.traffic_matrix.tm = (
+                            tm.multiply(same_partition)
+                            if problem.traffic_matrix.is_sparse
+                            else tm * same_partition
+                        )
+                        capacities = problem.capacities.copy()
+                        capacities[
+                            partition_vector[problem.topology.src]
+                            != partition_vector[problem.topology.dst]
+                        ] = 0.0
+                        problem.set_capacities(capacities)
 ###                    
 
                         ncflow.solve(problem, partitioner)
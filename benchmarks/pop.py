@@ -4,7 +4,12 @@ import traceback
 import pickle
 import os
 from itertools import product
-from benchmark_helpers import get_args_and_problems, print_, PATH_FORM_HYPERPARAMS
+from benchmark_helpers import (
+    get_args_and_problems,
+    get_problem_stream,
+    print_,
+    PATH_FORM_HYPERPARAMS,
+)
 
 import sys
 from benchmarks.benchmark_helpers import AlgoClsAction
@@ -13,7 +18,6 @@ sys.path.append("..")
 
 from lib.constants import NUM_CORES
 from lib.algorithms import POP, Objective, PathFormulation, TEAVAR
-from lib.problem import Problem
 from lib.graph_utils import check_feasibility
 
 
@@ -41,6 +45,7 @@ HEADERS = [
     "objective",
     "obj_val",
     "runtime",
+    "wall_time",
 ]
 PLACEHOLDER = ",".join("{}" for _ in HEADERS)
 
@@ -63,8 +68,7 @@ def benchmark(problems, output_csv, args):
 
     with open(output_csv, "a") as results:
         print_(",".join(HEADERS), file=results)
-        for problem_name, topo_fname, tm_fname in problems:
-            problem = Problem.from_file(topo_fname, tm_fname)
+        for problem_name, topo_fname, tm_fname, problem in problems:
             print_(problem.name, tm_fname)
             traffic_seed = problem.traffic_matrix.seed
             total_demand = problem.total_demand
@@ -165,6 +169,7 @@ def benchmark(problems, output_csv, args):
                             obj,
                             pop.obj_val,
                             pop.runtime_est(NUM_CORES),
+                            pop.wall_time,
                         )
                         print_(result_line, file=results)
 
@@ -238,4 +243,4 @@ if __name__ == "__main__":
         for problem in problems:
             print(problem)
     else:
-        benchmark(problems, output_csv, args)
+        benchmark(get_problem_stream(args), output_csv, args)
@@ -39,6 +39,7 @@ HEADERS = [
     "objective",
     "obj_val",
     "runtime",
+    "wall_time",
 ]
 PLACEHOLDER = ",".join("{}" for _ in HEADERS)
 SPLIT_METHOD = "random"
@@ -148,6 +149,7 @@ def benchmark(problems, output_csv, obj):
                             obj,
                             pop.obj_val,
                             pop.runtime_est(NUM_CORES),
+                            pop.wall_time,
                         )
                         print_(result_line, file=results)
 
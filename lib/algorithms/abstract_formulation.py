@@ -51,13 +51,6 @@ class AbstractFormulation(object):
         self._solver = self._construct_lp(fixed_total_flows)
         return self._solver.solve_lp(**args)
 
-    def solve_warm_start(self, problem):
-        assert self._warm_start_mode
-        for k, (_, _, d_k) in problem.sparse_commodity_list:
-            constr = self._demand_constrs[k]
-            constr.rhs = d_k
-        self._solver.solve_lp()
-
     @property
     def problem(self):
         return self._problem
@@ -7,6 +7,17 @@ class NCFlowAbstract(AbstractFormulation):
     def runtime(self):
         return self.runtime_est(14)  # Hardcoded for GCR machines
 
+    # [(stage, key, SolveStats), ...] for every LP solved; key is as in
+    # runtime_dict (None for R1 and R3)
+    def solve_stats_records(self):
+        records = []
+        for stage, stats in self._solve_stats_dict.items():
+            if isinstance(stats, dict):
+                records += [(stage, key, s) for key, s in stats.items()]
+            else:
+                records.append((stage, None, stats))
+        return records
+
     def runtime_est(self, num_threads, breakdown=False):
 
         rts = self._runtime_dict
@@ -1,10 +1,16 @@
 from ...config import TOPOLOGIES_DIR
+from ...lp_backend import ModelPool
 from ..abstract_formulation import AbstractFormulation, Objective
-from ...path_utils import find_paths, graph_copy_with_edge_weights, remove_cycles
+from ...path_utils import (
+    find_paths_from_source,
+    graph_copy_with_edge_weights,
+    remove_cycles,
+)
 from ...graph_utils import (
     compute_residual_problem,
     path_to_edge_list,
     assert_flow_conservation,
+    check_capacities,
 )
 from .ncflow_single_iter import NCFlowSingleIter as NcfSi
 from .counter import Counter
@@ -70,13 +76,14 @@ class NCFlowEdgePerIter(AbstractFormulation):
         self.edge_disjoint = edge_disjoint
         self.dist_metric = dist_metric
         self._args = args
+        # shared by the NCFlowSingleIter of every iteration
+        self._model_pool = ModelPool(args.get("lp_backend"))
         self.max_num_iters = self.MAX_NUM_ITERS
         self.iter_time = []
 
     def divide_problem_into_partitions(self, problem, partition_vector):
         G_meta_no_edges = nx.DiGraph()
         orig_G = problem.G
-        commodity_list = problem.commodity_list
 
         for partition_id in np.unique(partition_vector):
             nodes = np.argwhere(partition_vector == partition_id).flatten()
@@ -97,9 +104,7 @@ class NCFlowEdgePerIter(AbstractFormulation):
             )
 
         subgraph_dict = defaultdict(nx.DiGraph)
-        intra_commods_dict = defaultdict(list)
         meta_edge_dict = defaultdict(list)
-        meta_commodity_dict = defaultdict(list)
 
         for u, u_meta in enumerate(partition_vector):
             G_subgraph = subgraph_dict[u_meta]
@@ -140,23 +145,9 @@ class NCFlowEdgePerIter(AbstractFormulation):
                 meta_to_virt_dict[v_meta]
             )
 
-        # For each s_k, t_k, d_k in the commodity list:
-        #   If s_k and t_k belong to different partitions: // meta-commodity
-        #       Add commodity to meta-commodity dict for meta(s_k), meta(t_k)
-        #   Else: // intra flow
-        #       Add commodity to subgraph commodity list for meta(s_k)
-        for k, (s_k, t_k, d_k) in commodity_list:
-            s_k_meta = partition_vector[s_k]
-            t_k_meta = partition_vector[t_k]
-            if s_k_meta != t_k_meta:
-                meta_commodity_dict[(s_k_meta, t_k_meta)].append((k, (s_k, t_k, d_k)))
-            else:
-                intra_commods_dict[s_k_meta].append((k, (s_k, t_k, d_k)))
-
-        meta_commodity_dict = {
-            (k_meta, (u, v, sum([d_i for (_, (_, _, d_i)) in c_l]))): c_l
-            for k_meta, ((u, v), c_l) in enumerate(meta_commodity_dict.items())
-        }
+        meta_commodity_dict, intra_commods_dict = self._group_commodities(
+            problem, partition_vector
+        )
 
         self.G_meta_no_edges = G_meta_no_edges
         self.meta_edge_dict = meta_edge_dict
@@ -176,7 +167,61 @@ class NCFlowEdgePerIter(AbstractFormulation):
         self.meta_to_virt_dict = meta_to_virt_dict
         self.virt_to_meta_dict = virt_to_meta_dict
 
+    # Group the commodities of problem by the partitions of their source and
+    # target:
+    #   If s_k and t_k belong to different partitions: // meta-commodity
+    #       Add commodity to meta-commodity dict for meta(s_k), meta(t_k)
+    #   Else: // intra flow
+    #       Add commodity to subgraph commodity list for meta(s_k)
+    # Meta-commodities are numbered in order of their first commodity, and
+    # keyed by (k_meta, (s_k_meta, t_k_meta, total demand)). The partitions of
+    # all the commodities are looked up at once from the commodity table
+    def _group_commodities(self, problem, partition_vector):
+        table = problem.commodity_table
+        commodity_list = problem.commodity_list
+        num_parts = int(partition_vector.max()) + 1 if len(partition_vector) else 0
+        src_meta = partition_vector[table.src]
+        dst_meta = partition_vector[table.dst]
+        is_inter = src_meta != dst_meta
+
+        # Group commod_ids by keys: [(first commodity id, array of commodity
+        # ids), ...], with the groups in order of first appearance
+        def group_by(commod_ids, keys):
+            _, first, group = np.unique(keys, return_index=True, return_inverse=True)
+            # renumber the groups in order of first appearance
+            group_order = np.argsort(first)
+            rank = np.empty_like(group_order)
+            rank[group_order] = np.arange(len(group_order))
+            group = rank[group.ravel()]
+            first_ids = commod_ids[first[group_order]].tolist()
+            grouped_ids = commod_ids[np.argsort(group, kind="stable")]
+            bounds = np.cumsum(np.bincount(group, minlength=len(first)))[:-1]
+            return zip(first_ids, np.split(grouped_ids, bounds))
+
+        meta_commodity_dict = {}
+        inter_ids = np.flatnonzero(is_inter)
+        for k_meta, (k_first, group_ids) in enumerate(
+            group_by(
+                inter_ids,
+                src_meta[inter_ids].astype(np.int64) * num_parts + dst_meta[inter_ids],
+            )
+        ):
+            c_l = [commodity_list[k] for k in group_ids.tolist()]
+            total_demand = sum([d_i for (_, (_, _, d_i)) in c_l])
+            meta_commodity_dict[
+                (k_meta, (src_meta[k_first], dst_meta[k_first], total_demand))
+            ] = c_l
+
+        intra_commods_dict = defaultdict(list)
+        intra_ids = np.flatnonzero(~is_inter)
+        for k_first, group_ids in group_by(intra_ids, src_meta[intra_ids]):
+            intra_commods_dict[src_meta[k_first]] = [
+                commodity_list[k] for k in group_ids.tolist()
+            ]
+        return meta_commodity_dict, intra_commods_dict
+
     def init_data_structures(self):
+        self._residual_cap_targets = {}
         self.G_metas = [self.G_meta_no_edges.copy() for _ in range(self.max_num_iters)]
         self.r2_G_hats = [
             [G_subgraph.copy() for G_subgraph in self.subgraphs]
@@ -210,48 +255,55 @@ class NCFlowEdgePerIter(AbstractFormulation):
                 G_hat_v_meta.add_node(u_hat_in)
                 G_hat_v_meta.add_edge(u_hat_in, v, capacity=cap)
 
+    # The capacity attribute dicts of the edges of G_meta and of every r2_G_hat
+    # for iter, and the ids of the edges of the original topology whose
+    # capacities they take. These do not change across residual problems, so
+    # they are computed once per iter
+    def _residual_capacity_targets(self, iter, topology):
+        if iter not in self._residual_cap_targets:
+            edge_datas, orig_edges = [], []
+            for u_meta, v_meta, data in self.G_metas[iter].edges(data=True):
+                edge_datas.append(data)
+                orig_edges.append(self.selected_inter_edges[iter][(u_meta, v_meta)])
+
+            for meta_node_id, r2_G_hat in enumerate(self.r2_G_hats[iter]):
+                for u, v, data in r2_G_hat.edges(data=True):
+                    orig_u, orig_v = u, v
+                    if u in self.virt_to_meta_dict:
+                        orig_u = self.selected_inter_edges[iter][
+                            (self.virt_to_meta_dict[u], meta_node_id)
+                        ][0]
+                    if v in self.virt_to_meta_dict:
+                        orig_v = self.selected_inter_edges[iter][
+                            (meta_node_id, self.virt_to_meta_dict[v])
+                        ][1]
+                    edge_datas.append(data)
+                    orig_edges.append((orig_u, orig_v))
+
+            orig_us, orig_vs = zip(*orig_edges) if orig_edges else ((), ())
+            self._residual_cap_targets[iter] = (
+                edge_datas,
+                topology.edge_ids(orig_us, orig_vs),
+            )
+        return self._residual_cap_targets[iter]
+
     def update_data_structures_for_residual_problem(self, iter, residual_problem):
-        # First update G_meta and selected_inter_edges
-        for u_meta, v_meta in self.G_metas[iter].edges:
-            u, v = self.selected_inter_edges[iter][(u_meta, v_meta)]
-            new_cap = residual_problem.G[u][v]["capacity"]
-            self.G_metas[iter][u_meta][v_meta]["capacity"] = new_cap
-
-        # Next, update each individual r2_G_hat
-        for meta_node_id, r2_G_hat in enumerate(self.r2_G_hats[iter]):
-            for u, v in r2_G_hat.edges():
-                orig_u, orig_v = u, v
-                if u in self.virt_to_meta_dict:
-                    orig_u = self.selected_inter_edges[iter][
-                        (self.virt_to_meta_dict[u], meta_node_id)
-                    ][0]
-                if v in self.virt_to_meta_dict:
-                    orig_v = self.selected_inter_edges[iter][
-                        (meta_node_id, self.virt_to_meta_dict[v])
-                    ][1]
-                r2_G_hat[u][v]["capacity"] = residual_problem.G[orig_u][orig_v][
-                    "capacity"
-                ]
+        # First update the capacities of G_meta and of each individual r2_G_hat
+        edge_datas, orig_edge_ids = self._residual_capacity_targets(
+            iter, residual_problem.topology
+        )
+        new_caps = residual_problem.capacities[orig_edge_ids].tolist()
+        for data, new_cap in zip(edge_datas, new_caps):
+            data["capacity"] = new_cap
 
         # Finally, update:
         #   meta_commodity_dict
         #   meta_commodity_list
         #   intra_commods
         #   commod_id_to_meta_commod_id
-        intra_commods_dict = defaultdict(list)
-        meta_commodity_dict = defaultdict(list)
-        for k, (s_k, t_k, d_k) in residual_problem.commodity_list:
-            s_k_meta = self._partition_vector[s_k]
-            t_k_meta = self._partition_vector[t_k]
-            if s_k_meta != t_k_meta:
-                meta_commodity_dict[(s_k_meta, t_k_meta)].append((k, (s_k, t_k, d_k)))
-            else:
-                intra_commods_dict[s_k_meta].append((k, (s_k, t_k, d_k)))
-
-        meta_commodity_dict = {
-            (k_meta, (u, v, sum([d_i for (_, (_, _, d_i)) in c_l]))): c_l
-            for k_meta, ((u, v), c_l) in enumerate(meta_commodity_dict.items())
-        }
+        meta_commodity_dict, intra_commods_dict = self._group_commodities(
+            residual_problem, self._partition_vector
+        )
         self.commod_id_to_meta_commod_id = {
             commod_key[0]: meta_commod_key[0]
             for meta_commod_key, c_l in meta_commodity_dict.items()
@@ -304,11 +356,13 @@ class NCFlowEdgePerIter(AbstractFormulation):
     ############
     # R1 PATHS #
     ############
+    # R1 and R2 paths are keyed by the problem's fingerprint (see
+    # Problem.fingerprint), since they depend on its capacities too
     @staticmethod
     def r1_paths_full_fname(
-        problem_name, hash_partition_str, num_paths, edge_disjoint, dist_metric
+        problem_fingerprint, hash_partition_str, num_paths, edge_disjoint, dist_metric
     ):
-        paths_dir = R1_PATHS_DIR.format(problem_name, hash_partition_str)
+        paths_dir = R1_PATHS_DIR.format(problem_fingerprint, hash_partition_str)
         if not os.path.exists(paths_dir):
             os.makedirs(paths_dir)
         return os.path.join(
@@ -322,7 +376,7 @@ class NCFlowEdgePerIter(AbstractFormulation):
     # afterwards
     def compute_r1_paths(self):
         full_fname = NCFlowEdgePerIter.r1_paths_full_fname(
-            self.problem.name,
+            self.problem.fingerprint(),
             self.hash_partition(0),
             self._num_paths,
             self.edge_disjoint,
@@ -334,11 +388,15 @@ class NCFlowEdgePerIter(AbstractFormulation):
 
         from_nodes = set([node for node, degree in G_meta.out_degree() if degree > 0])
         to_nodes = set([node for node, degree in G_meta.in_degree() if degree > 0])
-        for s_k_meta, t_k_meta in product(from_nodes, to_nodes):
-            if s_k_meta != t_k_meta:
-                paths = find_paths(
-                    G_meta, s_k_meta, t_k_meta, self._num_paths, self.edge_disjoint
-                )
+        for s_k_meta in from_nodes:
+            paths_from_s_k = find_paths_from_source(
+                G_meta,
+                s_k_meta,
+                [t_k_meta for t_k_meta in to_nodes if t_k_meta != s_k_meta],
+                self._num_paths,
+                self.edge_disjoint,
+            )
+            for t_k_meta, paths in paths_from_s_k.items():
                 paths_dict[(s_k_meta, t_k_meta)] = paths
 
         self._print("saving R1 paths to pickle file: ", full_fname)
@@ -348,7 +406,7 @@ class NCFlowEdgePerIter(AbstractFormulation):
 
     def get_all_r1_paths(self):
         full_fname = NCFlowEdgePerIter.r1_paths_full_fname(
-            self.problem.name,
+            self.problem.fingerprint(),
             self.hash_partition(0),
             self._num_paths,
             self.edge_disjoint,
@@ -386,13 +444,13 @@ class NCFlowEdgePerIter(AbstractFormulation):
     @staticmethod
     def r2_paths_full_fname(
         meta_node_id,
-        problem_name,
+        problem_fingerprint,
         hash_partition_str,
         num_paths,
         edge_disjoint,
         dist_metric,
     ):
-        paths_dir = R2_PATHS_DIR.format(problem_name, hash_partition_str)
+        paths_dir = R2_PATHS_DIR.format(problem_fingerprint, hash_partition_str)
         if not os.path.exists(paths_dir):
             os.makedirs(paths_dir)
         return os.path.join(
@@ -405,7 +463,7 @@ class NCFlowEdgePerIter(AbstractFormulation):
     def compute_r2_paths_for_meta_node(self, meta_node_id, iter):
         full_fname = NCFlowEdgePerIter.r2_paths_full_fname(
             meta_node_id,
-            self.problem.name,
+            self.problem.fingerprint(),
             self.hash_partition(iter),
             self._num_paths,
             self.edge_disjoint,
@@ -421,18 +479,24 @@ class NCFlowEdgePerIter(AbstractFormulation):
         to_nodes = set(subgraph_nodes).union(all_v_hat_out)
 
         paths_dict = {}
-        for s, t in product(from_nodes, to_nodes):
-            if s != t:
-                try:
-                    paths_dict[(s, t)] = find_paths(
-                        G_hat_weighted,
-                        s,
-                        t,
-                        self._num_paths,
-                        disjoint=self.edge_disjoint,
-                    )
-                except Exception as e:
-                    self._print(e)
+        for s in from_nodes:
+            targets = [t for t in to_nodes if t != s]
+            try:
+                paths_from_s = find_paths_from_source(
+                    G_hat_weighted,
+                    s,
+                    targets,
+                    self._num_paths,
+                    disjoint=self.edge_disjoint,
+                    skip_no_path=True,
+                )
+            except Exception as e:
+                self._print(e)
+                paths_from_s = {}
+            for t in targets:
+                if t in paths_from_s:
+                    paths_dict[(s, t)] = paths_from_s[t]
+                else:
                     self._print("can't find paths: ", s, " -> ", t)
         self._print("Saving R2 paths to pickle file:", full_fname)
         with open(full_fname, "wb") as w:
@@ -442,7 +506,7 @@ class NCFlowEdgePerIter(AbstractFormulation):
     def get_all_r2_paths_for_meta_node(self, meta_node_id, iter):
         full_fname = NCFlowEdgePerIter.r2_paths_full_fname(
             meta_node_id,
-            self.problem.name,
+            self.problem.fingerprint(),
             self.hash_partition(iter),
             self._num_paths,
             self.edge_disjoint,
@@ -589,6 +653,7 @@ class NCFlowEdgePerIter(AbstractFormulation):
                     DEBUG=self.DEBUG,
                     VERBOSE=self.VERBOSE,
                     out=self.out,
+                    model_pool=self._model_pool,
                     **self._args
                 )
             else:
@@ -600,6 +665,7 @@ class NCFlowEdgePerIter(AbstractFormulation):
                     DEBUG=self.DEBUG,
                     VERBOSE=self.VERBOSE,
                     out=log,
+                    model_pool=self._model_pool,
                     **self._args
                 )
 
@@ -707,7 +773,6 @@ class NCFlowEdgePerIter(AbstractFormulation):
         obj_val = 0.0
         EPS = 1e-3
 
-        G_copy = self.problem.G.copy()
         self._print("checking flow conservation")
         for nc in self._ncflows:
             for commod_key, flow_list in nc.sol_dict.items():
@@ -715,11 +780,6 @@ class NCFlowEdgePerIter(AbstractFormulation):
                 # assert demand constraints
                 assert flow_for_commod <= commod_key[-1][-1] + EPS
                 obj_val += flow_for_commod
-                for (u, v), flow_val in flow_list:
-                    G_copy[u][v]["capacity"] -= flow_val
-                    # if G_copy[u][v]['capacity'] < 0.0:
-                    #     print(u, v, G_copy[u][v]['capacity'])
-                    assert G_copy[u][v]["capacity"] > -EPS
 
         assert (
             abs(obj_val - self.obj_val) <= EPS * self.obj_val or obj_val < self.obj_val
@@ -728,18 +788,11 @@ class NCFlowEdgePerIter(AbstractFormulation):
             print("delta in obj_val:", self.obj_val - obj_val)
 
         self._print("checking capacity constraints")
-        edge_percent_cap_remaining = []
-        for u, v, cap in G_copy.edges.data("capacity"):
-            # if G_copy[u][v]['capacity'] < 0.0:
-            #     print(u, v, G_copy[u][v]['capacity'])
-            assert G_copy[u][v]["capacity"] > -EPS
-            if self.problem.G[u][v]["capacity"] == 0.0:
-                continue
-            edge_percent_cap_remaining.append(
-                (u, v, cap / self.problem.G[u][v]["capacity"])
-            )
-
-        bottleneck_edges = sorted(edge_percent_cap_remaining, key=lambda x: x[-1])
+        bottleneck_edges = check_capacities(
+            self.problem,
+            [flow_list for nc in self._ncflows for flow_list in nc.sol_dict.values()],
+            EPS,
+        )
         self._print("Bottleneck edges")
         for min_u, min_v, min_cap in bottleneck_edges[:20]:
             min_u_meta_node = self._partition_vector[min_u]
@@ -950,3 +1003,12 @@ class NCFlowEdgePerIter(AbstractFormulation):
 
     def runtime_est(self, num_threads):
         return sum(nc.runtime_est(num_threads) for nc in self._ncflows)
+
+    # [(iter, stage, key, SolveStats), ...] for every LP solved in every
+    # iteration; see NCFlowSingleIter.solve_stats_records
+    def solve_stats_records(self):
+        return [
+            (iter, stage, key, stats)
+            for iter, nc in enumerate(self._ncflows)
+            for stage, key, stats in nc.solve_stats_records()
+        ]
@@ -6,19 +6,28 @@ from ...graph_utils import (
     path_to_edge_list,
     neighbors_and_flows,
     assert_flow_conservation,
+    check_capacities,
 )
+from ...lp_backend import LESS_EQUAL, MAXIMIZE, ModelPool
 from ...lp_solver import LpSolver, Method
+from ...path_utils import (
+    edge_capacities_and_incidence,
+    incidence_from_lists,
+    path_commod_incidence,
+    path_edge_incidence_from_paths,
+    path_flows_to_sol_dict,
+    path_flows_to_sol_mat,
+)
 from ...utils import waterfall_memoized
 
-from gurobipy import GRB, Model, quicksum
 from collections import defaultdict
-from itertools import product
+from itertools import chain, product
 
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
 import time
 
-import re
 import sys
 
 
@@ -32,25 +41,36 @@ class NCFlowSingleIter(NCFlowAbstract):
             out = sys.stdout
         return cls(objective=Objective.TOTAL_FLOW, DEBUG=False, VERBOSE=False, out=out)
 
-    def __init__(self, *, objective, DEBUG, VERBOSE, out):
+    def __init__(
+        self, *, objective, DEBUG, VERBOSE, out, lp_backend=None, model_pool=None
+    ):
         super().__init__(objective, DEBUG=DEBUG, VERBOSE=VERBOSE, out=out)
         self.r2_min_max_util = True
+        self._lp_backend = lp_backend
+        # Each kind of LP (R1, R2, ...) reuses one model: every LP is solved
+        # and its solution extracted before the next one of its kind is built
+        if model_pool is None:
+            model_pool = ModelPool(lp_backend)
+        self._model_pool = model_pool
 
     ###############
     # EXTRACT SOL #
     ###############
 
+    # The reconciliation LP has one variable per (edge, meta-commodity) pair,
+    # in row-major order
     def extract_reconciliation_sol_as_dict(
-        self, model, meta_commodity_list, edges_list
+        self, solver, meta_commodity_list, edges_list
     ):
+        flows = solver.primal_values().reshape(
+            len(edges_list), len(meta_commodity_list)
+        )
         l = []
-        for var in model.getVars():
-            if var.varName.startswith("f[") and var.x > EPS:
-                e, sol_k = self._extract_inds_from_var_name(var.varName)
-                u, v = edges_list[e]
-                k, (s_k, t_k, d_k) = meta_commodity_list[sol_k]
+        for e, sol_k in np.argwhere(flows > EPS).tolist():
+            u, v = edges_list[e]
+            k, (s_k, t_k, d_k) = meta_commodity_list[sol_k]
 
-                l.append((u, v, k, s_k, t_k, d_k, var.x))
+            l.append((u, v, k, s_k, t_k, d_k, float(flows[e, sol_k])))
 
         sol_dict_def = defaultdict(list)
         for u, v, k, s_k, t_k, d_k, flow in l:
@@ -60,8 +80,10 @@ class NCFlowSingleIter(NCFlowAbstract):
         # Net-zero flows are set to empty list
         return self._create_sol_dict(sol_dict_def, meta_commodity_list)
 
+    # r2_var_flows: [(path id, multi-commodity id, flow), ...] for every R2
+    # variable with non-zero flow; see _r2_var_flows
     def extract_r2_sol_as_dict(
-        self, model, multi_commodity_list, intra_commodity_list, all_paths
+        self, r2_var_flows, multi_commodity_list, intra_commodity_list, all_paths
     ):
 
         meta_sol_dict_def = defaultdict(list)
@@ -97,13 +119,8 @@ class NCFlowSingleIter(NCFlowAbstract):
         if self.VERBOSE:
             self._print("--> amcd: ", active_meta_commodity_dict)
 
-        for var in model.getVars():
-            if not var.varName.startswith("fp") or var.x <= EPS:
-                continue
-            match = re.match(r"fp(\d+)_mc(\d+)", var.varName)
-            p, mc = int(match.group(1)), int(match.group(2))
-
-            mc_id_to_path_id_to_flow[mc][p] = var.x
+        for p, mc, flow in r2_var_flows:
+            mc_id_to_path_id_to_flow[mc][p] = flow
 
             srcs, targets, total_demand, commod_ids = multi_commodity_list[mc]
             srcs_are_virtual = srcs[0] in self.virt_to_meta_dict
@@ -125,7 +142,7 @@ class NCFlowSingleIter(NCFlowAbstract):
                 meta_commod_key = self.meta_commodity_list[k_meta]
 
                 meta_sol_dict_def[meta_commod_key] += [
-                    (edge, var.x) for edge in path_to_edge_list(all_paths[p])
+                    (edge, flow) for edge in path_to_edge_list(all_paths[p])
                 ]
             else:
                 # purely local flow
@@ -133,29 +150,29 @@ class NCFlowSingleIter(NCFlowAbstract):
                     assert len(srcs) == 1 and len(targets) == 1 and len(commod_ids) == 1
                 commod_key = (commod_ids[0], (srcs[0], targets[0], total_demand))
                 intra_sol_dict_def[commod_key] += [
-                    (edge, var.x) for edge in path_to_edge_list(all_paths[p])
+                    (edge, flow) for edge in path_to_edge_list(all_paths[p])
                 ]
 
             # more book-keeping for additional reconciliation
             if srcs_are_virtual and not targets_are_virtual:
                 r2_targets_in_flow_lists_def[tuple(commod_ids)] += [
-                    (edge, var.x) for edge in path_to_edge_list(all_paths[p])
+                    (edge, flow) for edge in path_to_edge_list(all_paths[p])
                 ]
                 k_meta = self.commod_id_to_meta_commod_id[commod_ids[0]]
                 assert len(targets) == 1
                 target = targets[0]
                 other_meta_node = self.meta_commodity_list[k_meta][1][0]
-                self.r2_total_flow_in[target][other_meta_node] += var.x
+                self.r2_total_flow_in[target][other_meta_node] += flow
 
             if targets_are_virtual and not srcs_are_virtual:
                 r2_srcs_out_flow_lists_def[tuple(commod_ids)] += [
-                    (edge, var.x) for edge in path_to_edge_list(all_paths[p])
+                    (edge, flow) for edge in path_to_edge_list(all_paths[p])
                 ]
                 k_meta = self.commod_id_to_meta_commod_id[commod_ids[0]]
                 assert len(srcs) == 1
                 source = srcs[0]
                 other_meta_node = self.meta_commodity_list[k_meta][1][1]
-                self.r2_total_flow_out[source][other_meta_node] += var.x
+                self.r2_total_flow_out[source][other_meta_node] += flow
 
         if self.VERBOSE:
             self._print("r2_total_flow_in=", self.r2_total_flow_in)
@@ -181,80 +198,107 @@ class NCFlowSingleIter(NCFlowAbstract):
             mc_id_to_path_id_to_flow,
         )
 
-    def extract_r2_sol_as_mat(self, model, G, num_commodities, all_paths):
+    def extract_r2_sol_as_mat(self, r2_var_flows, G, num_commodities, all_paths):
         edge_idx = {edge: e for e, edge in enumerate(G.edges)}
         sol_mat = np.zeros((len(edge_idx), num_commodities), dtype=np.float32)
-        for var in model.getVars():
-            if var.varName.startswith("fp") and var.x > EPS:
-                match = re.match(r"fp(\d+)_mc(\d+)", var.varName)
-                p, mc = int(match.group(1)), int(match.group(2))
-                for edge in path_to_edge_list(all_paths[p]):
-                    sol_mat[edge_idx[edge], mc] += var.x
+        for p, mc, flow in r2_var_flows:
+            for edge in path_to_edge_list(all_paths[p]):
+                sol_mat[edge_idx[edge], mc] += flow
 
         return sol_mat
 
+    # Read the R2 solution in one bulk query; var_keys[i] is the (path id,
+    # multi-commodity id) pair of the i-th variable, as returned by _r2_lp
+    def _r2_var_flows(self, solver, var_keys):
+        flows = solver.primal_values(len(var_keys))
+        nonzero = np.flatnonzero(flows > EPS)
+        return list(
+            zip(
+                var_keys[nonzero, 0].tolist(),
+                var_keys[nonzero, 1].tolist(),
+                flows[nonzero].tolist(),
+            )
+        )
+
+    # In the R1 and R3 LPs, the path variables f[0], ..., f[P-1] are the first
+    # variables in the model, so we read all their values in one bulk query
     def extract_sol_as_dict(
-        self, model, commodity_list, path_id_to_commod_id, all_paths
+        self, solver, commodity_list, path_id_to_commod_id, all_paths
     ):
-        sol_dict_def = defaultdict(list)
-        for var in model.getVars():
-            if var.varName.startswith("f[") and var.x > EPS:
-                match = re.match(r"f\[(\d+)\]", var.varName)
-                p = int(match.group(1))
-                k, (s_k, t_k, d_k) = commodity_list[path_id_to_commod_id[p]]
-
-                sol_dict_def[(k, (s_k, t_k, d_k))] += [
-                    (edge, var.x) for edge in path_to_edge_list(all_paths[p])
-                ]
+        path_flows = solver.primal_values(len(all_paths))
+        sol_dict_def = path_flows_to_sol_dict(
+            path_flows,
+            np.flatnonzero(path_flows > EPS),
+            all_paths,
+            path_id_to_commod_id,
+            commodity_list,
+        )
 
         return self._create_sol_dict(sol_dict_def, commodity_list)
 
-    def extract_sol_by_paths(self, model, commodity_list, path_id_to_commod_id):
+    def extract_sol_by_paths(self, solver, commodity_list, path_id_to_commod_id):
+        path_flows = solver.primal_values(len(path_id_to_commod_id))
         sol_paths_def = defaultdict(dict)
-        for var in model.getVars():
-            if var.varName.startswith("f[") and var.x > EPS:
-                match = re.match(r"f\[(\d+)\]", var.varName)
-                path_id = int(match.group(1))
-                k, (s_k, t_k, d_k) = commodity_list[path_id_to_commod_id[path_id]]
-                if k not in sol_paths_def:
-                    sol_paths_def[k] = {}
-                sol_paths_def[k][path_id] = var.x
+        path_ids = np.flatnonzero(path_flows > EPS)
+        for path_id, flow in zip(path_ids.tolist(), path_flows[path_ids].tolist()):
+            k, (s_k, t_k, d_k) = commodity_list[path_id_to_commod_id[path_id]]
+            sol_paths_def[k][path_id] = flow
 
         return sol_paths_def
 
-    def extract_sol_as_mat(self, model, G, path_id_to_commod_id, all_paths):
+    def extract_sol_as_mat(self, solver, G, path_id_to_commod_id, all_paths):
+        path_flows = solver.primal_values(len(all_paths))
+        # ignore flows below EPS, like extract_sol_as_dict does
+        path_flows[path_flows <= EPS] = 0.0
         edge_idx = {edge: e for e, edge in enumerate(G.edges)}
-        sol_mat = np.zeros(
-            (len(edge_idx), len(set(path_id_to_commod_id.values()))), dtype=np.float32
+        return path_flows_to_sol_mat(
+            path_flows,
+            path_edge_incidence_from_paths(all_paths, edge_idx),
+            [path_id_to_commod_id[p] for p in range(len(all_paths))],
+            len(set(path_id_to_commod_id.values())),
         )
-        for var in model.getVars():
-            if var.varName.startswith("f[") and var.x > EPS:
-                match = re.match(r"f\[(\d+)\]", var.varName)
-                p = int(match.group(1))
-                k = path_id_to_commod_id[p]
-                for edge in path_to_edge_list(all_paths[p]):
-                    sol_mat[edge_idx[edge], k] += var.x
-
-        return sol_mat
 
     ##################
     # LP FORMULATION #
     ##################
 
-    def _define_max_util_obj(self, m, path_vars, commodities, GAMMA=1e-3):
-        obj = quicksum(path_vars)
+    # Add rows x[var_ids[i]] - x[max_var_ids[i]] <= 0
+    def _add_max_constrs(self, m, var_ids, max_var_ids):
+        num_rows = len(var_ids)
+        A = sp.csr_matrix(
+            (
+                np.concatenate([np.ones(num_rows), -np.ones(num_rows)]),
+                (
+                    np.tile(np.arange(num_rows), 2),
+                    np.concatenate([var_ids, max_var_ids]),
+                ),
+            ),
+            shape=(num_rows, m.num_vars),
+        )
+        return m.add_constrs(A, np.arange(m.num_vars), LESS_EQUAL, np.zeros(num_rows))
+
+    # Returns the (var ids, coefficients) of the objective
+    def _define_max_util_obj(self, m, path_var_ids, commodities, GAMMA=1e-3):
         if self.VERBOSE:
             self._print("GAMMA for path: {}".format(GAMMA))
-        max_util_vars = m.addVars(
-            len(commodities), vtype=GRB.CONTINUOUS, lb=0.0, name="z"
+        max_util_var_ids = m.add_vars(len(commodities), lb=0.0, name="z")
+        self._add_max_constrs(
+            m,
+            np.array([path_var_ids[p] for rest in commodities for p in rest[-1]]),
+            np.array(
+                [
+                    max_util_var_ids[k]
+                    for k, rest in enumerate(commodities)
+                    for _ in rest[-1]
+                ]
+            ),
+        )
+        return (
+            np.concatenate([path_var_ids, max_util_var_ids]),
+            np.concatenate(
+                [np.ones(len(path_var_ids)), np.full(len(commodities), -GAMMA)]
+            ),
         )
-        m.update()
-        for k, rest in enumerate(commodities):
-            path_ids = rest[-1]
-            for p in path_ids:
-                m.addConstr(path_vars[p] <= max_util_vars[k])
-        obj -= GAMMA * quicksum(max_util_vars)
-        return obj
 
     def _r1_lp(self, paths_dict, meta_commodity_list):
         if self.VERBOSE:
@@ -314,28 +358,29 @@ class NCFlowSingleIter(NCFlowAbstract):
         if self.DEBUG:
             assert len(self._r1_paths) == path_i
 
-        m = Model("max-flow: R1")
+        m = self._model_pool.get("r1", "max-flow: R1")
 
         # Create variables: one for each path
-        path_vars = m.addVars(path_i, vtype=GRB.CONTINUOUS, lb=0.0, name="f")
+        path_vars = m.add_vars(path_i, lb=0.0, name="f")
 
         # Set objective
         if self.VERBOSE:
             self._print("Not applying min max util in R1")
-        obj = quicksum(path_vars)
-
-        m.setObjective(obj, GRB.MAXIMIZE)
+        m.set_objective(path_vars, 1.0, MAXIMIZE)
 
         # Add demand constraints
-        for _, d_k, path_ids in commodities:
-            m.addConstr(quicksum(path_vars[p] for p in path_ids) <= d_k)
+        m.add_constrs(
+            path_commod_incidence(commodities, path_i),
+            path_vars,
+            LESS_EQUAL,
+            [d_k for _, d_k, _ in commodities],
+        )
 
         # Add edge capacity constraints
-        for u, v, c_e in self.G_meta.edges.data("capacity"):
-            if (u, v) in edge_to_paths:
-                paths = edge_to_paths[(u, v)]
-                constr_vars = [path_vars[p] for p in paths]
-                m.addConstr(quicksum(constr_vars) <= c_e)
+        caps, edge_mat = edge_capacities_and_incidence(
+            self.G_meta, edge_to_paths, path_i
+        )
+        m.add_constrs(edge_mat, path_vars, LESS_EQUAL, caps)
 
         return LpSolver(m, None, self.DEBUG, self.VERBOSE, self.out)
 
@@ -532,73 +577,81 @@ class NCFlowSingleIter(NCFlowAbstract):
             self._print("--> all_paths:", all_paths)
             self._print("--> path_id_to_multi_commod_ids:", path_id_to_multi_commod_ids)
 
-        m = Model("max-flow: R2, metanode {}".format(curr_meta_node))
-        path_id_to_commod_id_to_var = defaultdict(dict)
-        mc_id_to_path_id_to_var = defaultdict(dict)
-        mc_id_to_path_ids = defaultdict(list)
+        # One variable per (path id, multi-commodity id) pair, in path order
+        var_keys = np.array(
+            [
+                (path_id, multi_commod_id)
+                for path_id, multi_commod_ids in enumerate(path_id_to_multi_commod_ids)
+                for multi_commod_id in multi_commod_ids
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        num_vars = len(var_keys)
         if self.VERBOSE or debug_r2:
-            seen_var_ids = set()
-        all_vars = []
-        for path_id, multi_commod_ids in enumerate(path_id_to_multi_commod_ids):
-            for multi_commod_id in multi_commod_ids:
-                gb_var = m.addVar(
-                    vtype=GRB.CONTINUOUS,
-                    lb=0.0,
-                    name="fp{}_mc{}".format(path_id, multi_commod_id),
-                )
-
-                if self.VERBOSE or debug_r2:
-                    assert (path_id, multi_commod_id) not in seen_var_ids
-                    seen_var_ids.add((path_id, multi_commod_id))
+            assert len(set(map(tuple, var_keys.tolist()))) == num_vars
+        path_id_to_commod_id_to_var = defaultdict(dict)
+        mc_id_to_var_ids = defaultdict(list)
+        for var_id, (path_id, multi_commod_id) in enumerate(var_keys.tolist()):
+            path_id_to_commod_id_to_var[path_id][multi_commod_id] = var_id
+            mc_id_to_var_ids[multi_commod_id].append(var_id)
 
-                path_id_to_commod_id_to_var[path_id][multi_commod_id] = gb_var
-                mc_id_to_path_ids[multi_commod_id].append(path_id)
-                mc_id_to_path_id_to_var[multi_commod_id][path_id] = gb_var
-                all_vars.append(gb_var)
-        m.update()
+        m = self._model_pool.get(
+            "r2", "max-flow: R2, metanode {}".format(curr_meta_node)
+        )
+        all_vars = m.add_vars(num_vars, lb=0.0, name="fp")
 
         # Set objective
         if min_max_util:
             if self.VERBOSE or debug_r2:
                 self._print("Applying min max util in R2")
-            obj = quicksum(all_vars)
             GAMMA = 1e-2 / max(
                 1.0, max([demand for _, _, demand, _ in multi_commodity_list])
             )
             if self.VERBOSE or debug_r2:
                 self._print("GAMMA for path: {}".format(GAMMA))
 
-            for k in mc_id_to_path_id_to_var.keys():
-                max_path_var = m.addVar(
-                    vtype=GRB.CONTINUOUS, lb=0.0, name="maxp_mcid{}".format(k)
-                )
-                for var in mc_id_to_path_id_to_var[k].values():
-                    m.addConstr(var <= max_path_var)
-                obj -= GAMMA * max_path_var
-            m.update()
+            # One max path flow variable per multi-commodity
+            max_path_vars = m.add_vars(len(mc_id_to_var_ids), lb=0.0, name="maxp")
+            self._add_max_constrs(
+                m,
+                np.array(list(chain.from_iterable(mc_id_to_var_ids.values()))),
+                np.repeat(
+                    max_path_vars,
+                    [len(var_ids) for var_ids in mc_id_to_var_ids.values()],
+                ),
+            )
+            m.set_objective(
+                np.concatenate([all_vars, max_path_vars]),
+                np.concatenate(
+                    [np.ones(num_vars), np.full(len(max_path_vars), -GAMMA)]
+                ),
+                MAXIMIZE,
+            )
         else:
             if self.VERBOSE or debug_r2:
                 self._print("Not applying min max util in R2")
-            obj = quicksum(all_vars)
-
-        m.setObjective(obj, GRB.MAXIMIZE)
+            m.set_objective(all_vars, 1.0, MAXIMIZE)
 
         # Add demand constraints
-        for multi_commod_id, (_, _, demand, _) in enumerate(multi_commodity_list):
-            m.addConstr(
-                quicksum(mc_id_to_path_id_to_var[multi_commod_id].values()) <= demand
-            )
+        m.add_constrs(
+            incidence_from_lists(
+                [mc_id_to_var_ids[mc_id] for mc_id in range(len(multi_commodity_list))],
+                num_vars,
+            ),
+            all_vars,
+            LESS_EQUAL,
+            [demand for _, _, demand, _ in multi_commodity_list],
+        )
 
         # Add edge capacity constraints
-        for u, v, c_e in G_hat.edges.data("capacity"):
-            if (u, v) in edge_to_path_ids:
-                path_ids = edge_to_path_ids[(u, v)]
-                constr_vars = [
-                    var
-                    for p in path_ids
-                    for var in path_id_to_commod_id_to_var[p].values()
-                ]
-                m.addConstr(quicksum(constr_vars) <= c_e)
+        caps, edge_mat = edge_capacities_and_incidence(
+            G_hat, edge_to_path_ids, len(all_paths)
+        )
+        path_var_mat = sp.csr_matrix(
+            (np.ones(num_vars), (var_keys[:, 0], np.arange(num_vars))),
+            shape=(len(all_paths), num_vars),
+        )
+        m.add_constrs(edge_mat @ path_var_mat, all_vars, LESS_EQUAL, caps)
 
         # Add meta-flow constraints
         meta_edge_inds = {
@@ -607,6 +660,7 @@ class NCFlowSingleIter(NCFlowAbstract):
             if edge[0] == curr_meta_node or edge[-1] == curr_meta_node
         }
 
+        meta_flow_rows, meta_flows = [], []
         for k_meta, multi_commod_ids_list in meta_commod_to_multi_commod_ids.items():
             if self.VERBOSE or debug_r2:
                 self._print(
@@ -630,13 +684,15 @@ class NCFlowSingleIter(NCFlowAbstract):
                                 )
                             )
                     else:
-                        constr_vars = [
-                            path_id_to_commod_id_to_var[p][multi_commod_id]
-                            for p in v_hat_in_paths[v_hat_in]
-                            for multi_commod_id in path_id_to_multi_commod_ids[p]
-                            if multi_commod_id in multi_commod_ids_list
-                        ]
-                        m.addConstr(quicksum(constr_vars) <= meta_in_flow)
+                        meta_flow_rows.append(
+                            [
+                                path_id_to_commod_id_to_var[p][multi_commod_id]
+                                for p in v_hat_in_paths[v_hat_in]
+                                for multi_commod_id in path_id_to_multi_commod_ids[p]
+                                if multi_commod_id in multi_commod_ids_list
+                            ]
+                        )
+                        meta_flows.append(meta_in_flow)
             if t_k_meta != curr_meta_node:
                 for v_hat_out in all_v_hat_out:
                     v_meta = self.virt_to_meta_dict[v_hat_out]
@@ -654,13 +710,21 @@ class NCFlowSingleIter(NCFlowAbstract):
                                 )
                             )
                     else:
-                        constr_vars = [
-                            path_id_to_commod_id_to_var[p][multi_commod_id]
-                            for p in v_hat_out_paths[v_hat_out]
-                            for multi_commod_id in path_id_to_multi_commod_ids[p]
-                            if multi_commod_id in multi_commod_ids_list
-                        ]
-                        m.addConstr(quicksum(constr_vars) <= meta_out_flow)
+                        meta_flow_rows.append(
+                            [
+                                path_id_to_commod_id_to_var[p][multi_commod_id]
+                                for p in v_hat_out_paths[v_hat_out]
+                                for multi_commod_id in path_id_to_multi_commod_ids[p]
+                                if multi_commod_id in multi_commod_ids_list
+                            ]
+                        )
+                        meta_flows.append(meta_out_flow)
+        m.add_constrs(
+            incidence_from_lists(meta_flow_rows, num_vars),
+            all_vars,
+            LESS_EQUAL,
+            meta_flows,
+        )
 
         if self.VERBOSE or debug_r2:
             model_output_file = "r2_m" + str(curr_meta_node) + ".lp"
@@ -671,7 +735,7 @@ class NCFlowSingleIter(NCFlowAbstract):
             LpSolver(m, None, self.DEBUG, self.VERBOSE, self.out),
             multi_commodity_list,
             all_paths,
-            dict(mc_id_to_path_ids),
+            var_keys,
         )
 
     def _r3_lp(self, meta_commodities, constrain_r3_by_r1=True):
@@ -706,33 +770,33 @@ class NCFlowSingleIter(NCFlowAbstract):
         if self.DEBUG:
             assert len(all_paths) == path_i
 
-        m = Model("max-flow: R3")
+        m = self._model_pool.get("r3", "max-flow: R3")
         # Create variables: one for each path
-        path_vars = m.addVars(path_i, vtype=GRB.CONTINUOUS, lb=0.0, name="f")
+        path_vars = m.add_vars(path_i, lb=0.0, name="f")
 
         # Set objective
-        obj = quicksum(path_vars)
         if self.VERBOSE:
             self._print("Not applying min max util in R3")
-        obj = quicksum(path_vars)
-
-        m.setObjective(obj, GRB.MAXIMIZE)
+        m.set_objective(path_vars, 1.0, MAXIMIZE)
 
         if self.VERBOSE:
             self._print("#paths =", path_i)
             self._print(commodities)
 
-        # Add demand constraints
+        # Demand and per-meta-edge constraints, as rows of path ids
+        rows, rhs = [], []
         for k_meta, s_k, t_k, d_k, path_ids in commodities:
             if self.VERBOSE:
                 self._print("doing meta: ", k_meta)
-            m.addConstr(quicksum(path_vars[p] for p in path_ids) <= d_k)
+            # Add demand constraints
+            rows.append(path_ids)
+            rhs.append(d_k)
 
             # Add edge commod cap constraints per meta-edge
             vars_per_meta_edge = defaultdict(list)
             for r3_path_id in path_ids:
                 for u_meta, v_meta in path_to_edge_list(self._r3_paths[r3_path_id]):
-                    vars_per_meta_edge[(u_meta, v_meta)].append(path_vars[r3_path_id])
+                    vars_per_meta_edge[(u_meta, v_meta)].append(r3_path_id)
 
             meta_commod_key = self.meta_commodity_list[k_meta]
             for (u_meta, v_meta), edge_vars in vars_per_meta_edge.items():
@@ -754,14 +818,13 @@ class NCFlowSingleIter(NCFlowAbstract):
                                 u_meta, v_meta, recon_flow
                             )
                         )
-                m.addConstr(quicksum(edge_vars) <= recon_flow)
+                rows.append(edge_vars)
+                rhs.append(recon_flow)
+        m.add_constrs(incidence_from_lists(rows, path_i), path_vars, LESS_EQUAL, rhs)
 
         # Add edge capacity constraints
-        for u, v, c_e in G.edges.data("capacity"):
-            if (u, v) in edge_to_paths:
-                paths = edge_to_paths[(u, v)]
-                constr_vars = [path_vars[p] for p in paths]
-                m.addConstr(quicksum(constr_vars) <= c_e)
+        caps, edge_mat = edge_capacities_and_incidence(G, edge_to_paths, path_i)
+        m.add_constrs(edge_mat, path_vars, LESS_EQUAL, caps)
 
         if self.VERBOSE or debug_r3:
             model_output_file = "r3.lp"
@@ -838,17 +901,15 @@ class NCFlowSingleIter(NCFlowAbstract):
             (u_meta, v_meta)] = time.time() - start_time
 
         # 2) Construct model
-        m = Model(
-            "Reconciliation, meta-nodes {} (out) and {} (in)".format(u_meta, v_meta)
+        m = self._model_pool.get(
+            "reconciliation",
+            "Reconciliation, meta-nodes {} (out) and {} (in)".format(u_meta, v_meta),
         )
 
-        commod_vars = m.addVars(
-            len(edges_list),
-            len(common_meta_commods),
-            vtype=GRB.CONTINUOUS,
-            lb=0.0,
-            name="f",
-        )
+        # One variable per (edge, meta-commodity) pair: variable e * K + k
+        num_commods = len(common_meta_commods)
+        commod_vars = m.add_vars(len(edges_list) * num_commods, lb=0.0, name="f")
+        flow_rows, flows = [], []
 
         tot_u_flow = dict()
         tot_v_flow = dict()
@@ -888,10 +949,8 @@ class NCFlowSingleIter(NCFlowAbstract):
                 outgoing_edge_idxs = [
                     edge_idx[(u_src, v)] for v in G_u_meta_v_meta.successors(u_src)
                 ]
-                m.addConstr(
-                    quicksum(commod_vars[e, k] for e in outgoing_edge_idxs) <= outflow,
-                    "outflow_u{}_mk{}".format(u_src, k_meta),
-                )
+                flow_rows.append([e * num_commods + k for e in outgoing_edge_idxs])
+                flows.append(outflow)
 
                 tot_u_flow[k_meta] += outflow
 
@@ -910,23 +969,30 @@ class NCFlowSingleIter(NCFlowAbstract):
                 incoming_edge_idxs = [
                     edge_idx[(u, v_sink)] for u in G_u_meta_v_meta.predecessors(v_sink)
                 ]
-
-                m.addConstr(
-                    quicksum(commod_vars[e, k] for e in incoming_edge_idxs) <= inflow,
-                    "inflow_v{}_mk{}".format(v_sink, k_meta),
-                )
+                flow_rows.append([e * num_commods + k for e in incoming_edge_idxs])
+                flows.append(inflow)
 
                 tot_v_flow[k_meta] += inflow
 
+        m.add_constrs(
+            incidence_from_lists(flow_rows, len(commod_vars)),
+            commod_vars,
+            LESS_EQUAL,
+            flows,
+        )
+
         # edge capacity constraints
-        for e, (u, v, c_e) in enumerate(edges_list):
-            m.addConstr(
-                commod_vars.sum(e, "*") <= c_e, "cap_e{}_u{}_v{}".format(e, u, v)
-            )
+        m.add_constrs(
+            sp.kron(
+                sp.identity(len(edges_list)), np.ones((1, num_commods)), format="csr"
+            ),
+            commod_vars,
+            LESS_EQUAL,
+            [c_e for _, _, c_e in edges_list],
+        )
 
         # Set objective: maximize total flow
-        obj = quicksum(commod_vars)
-        m.setObjective(obj, GRB.MAXIMIZE)
+        m.set_objective(commod_vars, 1.0, MAXIMIZE)
 
         if self.VERBOSE:
             self._print("--> total_u_flow=", sum(tot_u_flow.values()), "; ", tot_u_flow)
@@ -965,60 +1031,52 @@ class NCFlowSingleIter(NCFlowAbstract):
         commod_id_to_ind = {k: i for i, k in enumerate(all_commod_ids)}
         u_meta, v_meta = meta_commod_key[-1][0], meta_commod_key[-1][1]
 
-        m = Model(
-            "Kirchoff's Law, meta-nodes {} (out) and {} (in)".format(u_meta, v_meta)
+        m = self._model_pool.get(
+            "kirchoffs",
+            "Kirchoff's Law, meta-nodes {} (out) and {} (in)".format(u_meta, v_meta),
         )
 
-        commod_vars = m.addVars(
-            len(all_commod_ids), vtype=GRB.CONTINUOUS, lb=0.0, name="f"
-        )
+        commod_vars = m.add_vars(len(all_commod_ids), lb=0.0, name="f")
 
-        obj = quicksum(commod_vars)
-        m.setObjective(obj, GRB.MAXIMIZE)
+        m.set_objective(commod_vars, 1.0, MAXIMIZE)
 
         # Demand constraints
-        for k, (_, _, d_k) in commodity_list:
-            if self.VERBOSE:
+        if self.VERBOSE:
+            for k, (_, _, d_k) in commodity_list:
                 self._print(k, d_k)
-            m.addConstr(commod_vars[commod_id_to_ind[k]] <= d_k)
+        m.add_constrs(
+            sp.identity(len(all_commod_ids), format="csr"),
+            commod_vars,
+            LESS_EQUAL,
+            [d_k for _, (_, _, d_k) in commodity_list],
+        )
 
         # Kirchoff constraints
-        src_out_flows = self.r2_src_out_flows[(u_meta, v_meta)]
-        for commod_ids, total_flow in src_out_flows.items():
-            if self.VERBOSE:
-                self._print(commod_ids, total_flow)
-            if total_flow <= 0.0:
-                total_flow = 0.0
-            m.addConstr(
-                quicksum([commod_vars[commod_id_to_ind[k]] for k in commod_ids])
-                <= total_flow
-            )
-
-        target_in_flows = self.r2_target_in_flows[(u_meta, v_meta)]
-        for commod_ids, total_flow in target_in_flows.items():
-            if self.VERBOSE:
-                self._print(commod_ids, total_flow)
-            if total_flow <= 0.0:
-                total_flow = 0.0
-            m.addConstr(
-                quicksum([commod_vars[commod_id_to_ind[k]] for k in commod_ids])
-                <= total_flow
-            )
+        rows, total_flows = [], []
+        for flows_per_commod_ids in (
+            self.r2_src_out_flows[(u_meta, v_meta)],
+            self.r2_target_in_flows[(u_meta, v_meta)],
+        ):
+            for commod_ids, total_flow in flows_per_commod_ids.items():
+                if self.VERBOSE:
+                    self._print(commod_ids, total_flow)
+                if total_flow <= 0.0:
+                    total_flow = 0.0
+                rows.append([commod_id_to_ind[k] for k in commod_ids])
+                total_flows.append(total_flow)
+        m.add_constrs(
+            incidence_from_lists(rows, len(all_commod_ids)),
+            commod_vars,
+            LESS_EQUAL,
+            total_flows,
+        )
 
         return LpSolver(m, None, self.DEBUG, self.VERBOSE, self.out)
 
-    def _extract_kirchoffs_sol(self, model, commodity_list):
-        flow_dict = {}
-        for var in model.getVars():
-            match = re.match(r"f\[(\d+)\]", var.varName)
-            i = int(match.group(1))
-            k, _ = commodity_list[i]
-            if var.x < EPS:
-                flow_dict[k] = 0.0
-            else:
-                flow_dict[k] = var.x
-
-        return flow_dict
+    def _extract_kirchoffs_sol(self, solver, commodity_list):
+        flows = solver.primal_values()
+        flows[flows < EPS] = 0.0
+        return {k: flow for (k, _), flow in zip(commodity_list, flows.tolist())}
 
     def divide_into_multi_commod_flows(
         self, multi_commod_flow_lists, src_or_target_idx
@@ -1049,6 +1107,17 @@ class NCFlowSingleIter(NCFlowAbstract):
     # END KIRCHOFFS #
     #################
 
+    # Keep the runtime and telemetry of a solved LP. key identifies the LP in
+    # stages that solve many (the meta-node for R2, the pair of meta-nodes for
+    # reconciliation and Kirchoff's), and is None for R1 and R3
+    def _record_solve(self, stage, key, solver):
+        if key is None:
+            self._runtime_dict[stage] = solver.stats.runtime
+            self._solve_stats_dict[stage] = solver.stats
+        else:
+            self._runtime_dict[stage][key] = solver.stats.runtime
+            self._solve_stats_dict.setdefault(stage, {})[key] = solver.stats
+
     def solve(
         self,
         problem,
@@ -1084,6 +1153,7 @@ class NCFlowSingleIter(NCFlowAbstract):
 
         # R1
         self._runtime_dict = {}
+        self._solve_stats_dict = {}
         self._synctime_dict = {"r2":{}, "reconciliation":{}, "kirchoffs":{}}
         if self.VERBOSE:
             self._print("R1")
@@ -1091,14 +1161,14 @@ class NCFlowSingleIter(NCFlowAbstract):
         r1_solver = self._r1_lp(r1_paths_dict, self.meta_commodity_list)
         r1_solver.gurobi_out = self.out.name.replace(".txt", "-r1.txt")
         r1_solver.solve_lp(r1_method)
-        self._runtime_dict["r1"] = r1_solver.model.Runtime
+        self._record_solve("r1", None, r1_solver)
         self.r1_obj_val = r1_solver.obj_val
         start_time = time.time()
         self.r1_sol_mat = self.extract_sol_as_mat(
-            r1_solver.model, self.G_meta, self._r1_path_to_commod, self._r1_paths
+            r1_solver, self.G_meta, self._r1_path_to_commod, self._r1_paths
         )
         self.r1_sol_dict = self.extract_sol_as_dict(
-            r1_solver.model,
+            r1_solver,
             self.meta_commodity_list,
             self._r1_path_to_commod,
             self._r1_paths,
@@ -1120,7 +1190,9 @@ class NCFlowSingleIter(NCFlowAbstract):
         self.r2_sols_mats = []
         self.intra_sols_dicts = []
         self.intra_obj_vals = [0.0 for _ in self.G_meta.nodes]
-        self.r2_models = []
+        # per meta-node, [(path id, multi-commodity id, flow), ...] for the
+        # non-zero R2 variables
+        self.r2_var_flows = []
         self.r2_mc_lists = []
         self.r2_paths = []
 
@@ -1144,7 +1216,7 @@ class NCFlowSingleIter(NCFlowAbstract):
                 r2_solver,
                 multi_commodity_list,
                 r2_all_paths,
-                mc_id_to_path_ids,
+                r2_var_keys,
             ) = self._r2_lp(
                 meta_node_id,
                 r2_paths_dict,
@@ -1166,11 +1238,12 @@ class NCFlowSingleIter(NCFlowAbstract):
                     ".txt", "-r2-{}.txt".format(meta_node_id)
                 )
                 r2_solver.solve_lp(r2_method, num_threads=1)
-                self.r2_models.append(r2_solver.model)
+                r2_var_flows = self._r2_var_flows(r2_solver, r2_var_keys)
+                self.r2_var_flows.append(r2_var_flows)
                 self.r2_mc_lists.append(multi_commodity_list)
 
                 self.r2_paths.append(r2_all_paths)
-                self._runtime_dict["r2"][meta_node_id] = r2_solver.model.Runtime
+                self._record_solve("r2", meta_node_id, r2_solver)
 
                 # Once we solve the first group, those flows do not need to be
                 # passed to R3; the reconciled flow should be the final
@@ -1185,7 +1258,7 @@ class NCFlowSingleIter(NCFlowAbstract):
                     meta_sol_dict,
                     mc_id_to_path_id_to_flow,
                 ) = self.extract_r2_sol_as_dict(
-                    r2_solver.model,
+                    r2_var_flows,
                     multi_commodity_list,
                     intra_commods_lists[meta_node_id],
                     r2_all_paths,
@@ -1199,7 +1272,7 @@ class NCFlowSingleIter(NCFlowAbstract):
                     )
 
                 r2_sol_mat = self.extract_r2_sol_as_mat(
-                    r2_solver.model, G_hat, len(multi_commodity_list), r2_all_paths
+                    r2_var_flows, G_hat, len(multi_commodity_list), r2_all_paths
                 )
                 self.r2_sols_mats.append(r2_sol_mat)
                 # time of getting r2 solution dict for next steps
@@ -1224,7 +1297,7 @@ class NCFlowSingleIter(NCFlowAbstract):
             else:
                 if self.VERBOSE:
                     self._print("Meta node {} has no R2 commodities")
-                self.r2_models.append(None)
+                self.r2_var_flows.append(None)
                 self.r2_mc_lists.append([])
                 self.r2_paths.append([])
                 self._runtime_dict["r2"][meta_node_id] = 0.0
@@ -1285,15 +1358,15 @@ class NCFlowSingleIter(NCFlowAbstract):
                 ".txt", "-reconciliation-{}-{}.txt".format(u_meta, v_meta)
             )
             reconciliation_solver.solve_lp(reconciliation_method, num_threads=1)
-            self._runtime_dict["reconciliation"][
-                (u_meta, v_meta)
-            ] = reconciliation_solver.model.Runtime
+            self._record_solve(
+                "reconciliation", (u_meta, v_meta), reconciliation_solver
+            )
             self.G_u_meta_v_metas.append(G_u_meta_v_meta)
 
             # Extract reconciliation solution
             start_time = time.time()
             reconciliation_sol_dict = self.extract_reconciliation_sol_as_dict(
-                reconciliation_solver.model,
+                reconciliation_solver,
                 meta_commod_u_out_v_in,
                 list(G_u_meta_v_meta.edges),
             )
@@ -1381,12 +1454,10 @@ class NCFlowSingleIter(NCFlowAbstract):
                         s_k_meta, t_k_meta, kirchoffs_solver.obj_val
                     )
                 )
-            self._runtime_dict["kirchoffs"][
-                (s_k_meta, t_k_meta)
-            ] = kirchoffs_solver.model.Runtime
+            self._record_solve("kirchoffs", (s_k_meta, t_k_meta), kirchoffs_solver)
             start_time = time.time()
             flow_per_commod = self._extract_kirchoffs_sol(
-                kirchoffs_solver.model, orig_commod_list_in_k_meta
+                kirchoffs_solver, orig_commod_list_in_k_meta
             )
 
             adjusted_meta_demand = 0.0
@@ -1412,10 +1483,10 @@ class NCFlowSingleIter(NCFlowAbstract):
         r3_solver = self._r3_lp(adjusted_meta_commodity_list)
         r3_solver.gurobi_out = self.out.name.replace(".txt", "-r3.txt")
         r3_solver.solve_lp()
-        self._runtime_dict["r3"] = r3_solver.model.Runtime
+        self._record_solve("r3", None, r3_solver)
         start_time = time.time()
         self.r3_sol_dict = self.extract_sol_as_dict(
-            r3_solver.model,
+            r3_solver,
             adjusted_meta_commodity_list,
             self._r3_path_to_commod,
             self._r3_paths,
@@ -1445,7 +1516,7 @@ class NCFlowSingleIter(NCFlowAbstract):
 
         if self.DEBUG:
             self.r3_sol_paths = self.extract_sol_by_paths(
-                r3_solver.model, adjusted_meta_commodity_list, self._r3_path_to_commod
+                r3_solver, adjusted_meta_commodity_list, self._r3_path_to_commod
             )
             for x_k_meta in sorted(self.r3_sol_paths.keys()):
                 self._print(
@@ -1488,6 +1559,11 @@ class NCFlowSingleIter(NCFlowAbstract):
     def runtime_dict(self):
         return self._runtime_dict
 
+    # Same layout as runtime_dict, with the SolveStats of every LP
+    @property
+    def solve_stats_dict(self):
+        return self._solve_stats_dict
+
     @property
     def obj_val(self):
         return self._obj_val
@@ -1569,8 +1645,8 @@ class NCFlowSingleIter(NCFlowAbstract):
                     (u_meta, v_meta)
                 ] += (meta_flow_val / r3_meta_flow)
 
-        for meta_node_id, model in enumerate(self.r2_models):
-            if model is None:
+        for meta_node_id, r2_var_flows in enumerate(self.r2_var_flows):
+            if r2_var_flows is None:
                 continue
             multi_commodity_list = self.r2_mc_lists[meta_node_id]
             r2_all_paths = self.r2_paths[meta_node_id]
@@ -1579,11 +1655,7 @@ class NCFlowSingleIter(NCFlowAbstract):
 
             commod_ids_to_path_id_to_r2_flow = defaultdict(dict)
 
-            for var in model.getVars():
-                if not var.varName.startswith("fp") or var.x <= EPS:
-                    continue
-                match = re.match(r"fp(\d+)_mc(\d+)", var.varName)
-                r2_path_id, mc_id = int(match.group(1)), int(match.group(2))
+            for r2_path_id, mc_id, r2_flow in r2_var_flows:
                 srcs, targets, _, commod_ids = multi_commodity_list[mc_id]
                 commod_ids = tuple(commod_ids)
 
@@ -1599,7 +1671,7 @@ class NCFlowSingleIter(NCFlowAbstract):
                     # Store fraction of flow sent on this path
                     d_k = commod_key[-1][-1]
                     self._sol_dict_as_paths[commod_key][meta_node_id][path] = (
-                        var.x / d_k
+                        r2_flow / d_k
                     )
                     continue
 
@@ -1627,7 +1699,7 @@ class NCFlowSingleIter(NCFlowAbstract):
                 commod_ids_to_meta_edge_to_path_ids[commod_ids][
                     (u_meta, v_meta)
                 ].append(r2_path_id)
-                commod_ids_to_path_id_to_r2_flow[commod_ids][r2_path_id] = var.x
+                commod_ids_to_path_id_to_r2_flow[commod_ids][r2_path_id] = r2_flow
 
             for (
                 commod_ids,
@@ -1713,8 +1785,8 @@ class NCFlowSingleIter(NCFlowAbstract):
                     (u_meta, v_meta)
                 ] += (meta_flow_val / r3_meta_flow)
 
-        for meta_node_id, model in enumerate(self.r2_models):
-            if model is None:
+        for meta_node_id, r2_var_flows in enumerate(self.r2_var_flows):
+            if r2_var_flows is None:
                 continue
             multi_commodity_list = self.r2_mc_lists[meta_node_id]
             r2_all_paths = self.r2_paths[meta_node_id]
@@ -1723,11 +1795,7 @@ class NCFlowSingleIter(NCFlowAbstract):
 
             commod_ids_to_path_id_to_r2_flow = defaultdict(dict)
 
-            for var in model.getVars():
-                if not var.varName.startswith("fp") or var.x <= EPS:
-                    continue
-                match = re.match(r"fp(\d+)_mc(\d+)", var.varName)
-                r2_path_id, mc_id = int(match.group(1)), int(match.group(2))
+            for r2_path_id, mc_id, r2_flow in r2_var_flows:
                 srcs, targets, _, commod_ids = multi_commodity_list[mc_id]
                 commod_ids = tuple(commod_ids)
 
@@ -1761,7 +1829,7 @@ class NCFlowSingleIter(NCFlowAbstract):
                 commod_ids_to_meta_edge_to_path_ids[commod_ids][
                     (u_meta, v_meta)
                 ].append(r2_path_id)
-                commod_ids_to_path_id_to_r2_flow[commod_ids][r2_path_id] = var.x
+                commod_ids_to_path_id_to_r2_flow[commod_ids][r2_path_id] = r2_flow
 
             for (
                 commod_ids,
@@ -1827,18 +1895,12 @@ class NCFlowSingleIter(NCFlowAbstract):
         self._print("Checking feasiblity of NCFlowSingleIter")
         obj_val = 0.0
 
-        G_copy = self.problem.G.copy()
         self._print("checking flow conservation")
         for commod_key, flow_list in self.sol_dict.items():
             flow_for_commod = assert_flow_conservation(flow_list, commod_key)
             # assert demand constraints
             assert flow_for_commod <= commod_key[-1][-1] + EPS
             obj_val += flow_for_commod
-            for (u, v), flow_val in flow_list:
-                G_copy[u][v]["capacity"] -= flow_val
-                # if G_copy[u][v]['capacity'] < 0.0:
-                #     print(u, v, G_copy[u][v]['capacity'])
-                assert G_copy[u][v]["capacity"] > -EPS
 
         assert (
             abs(obj_val - self.obj_val) <= EPS * self.obj_val or obj_val < self.obj_val
@@ -1847,18 +1909,7 @@ class NCFlowSingleIter(NCFlowAbstract):
             print("delta in obj_val:", self.obj_val - obj_val)
 
         self._print("checking capacity constraints")
-        edge_percent_cap_remaining = []
-        for u, v, cap in G_copy.edges.data("capacity"):
-            # if G_copy[u][v]['capacity'] < 0.0:
-            #     print(u, v, G_copy[u][v]['capacity'])
-            assert G_copy[u][v]["capacity"] > -EPS
-            if self.problem.G[u][v]["capacity"] == 0.0:
-                continue
-            edge_percent_cap_remaining.append(
-                (u, v, cap / self.problem.G[u][v]["capacity"])
-            )
-
-        bottleneck_edges = sorted(edge_percent_cap_remaining, key=lambda x: x[-1])
+        bottleneck_edges = check_capacities(self.problem, self.sol_dict.values(), EPS)
         print("Bottleneck edges")
         for min_u, min_v, min_cap in bottleneck_edges[:20]:
             min_u_meta_node = self._partition_vector[min_u]
@@ -1,16 +1,32 @@
 import os
-import pickle
-import re
 from collections import defaultdict
 
 import numpy as np
-from gurobipy import GRB, Model, quicksum
+import scipy.sparse as sp
 
+from ..commodity_table import CommodityTable
 from ..config import TOPOLOGIES_DIR
 from ..constants import NUM_CORES
 from ..graph_utils import path_to_edge_list
-from ..lp_solver import LpSolver
-from ..path_utils import find_paths, graph_copy_with_edge_weights, remove_cycles
+from ..lp_backend import (
+    EQUAL,
+    GREATER_EQUAL,
+    LESS_EQUAL,
+    MAXIMIZE,
+    MINIMIZE,
+    ModelPool,
+)
+from ..lp_solver import LpSolver, Method
+from ..path_utils import (
+    IncidenceEdgeToPaths,
+    compute_all_paths,
+    path_commod_incidence,
+    path_edge_incidence_from_paths,
+    path_flows_to_sol_dict,
+    path_flows_to_sol_mat,
+    problem_edge_capacities_and_incidence,
+)
+from ..path_store import PathList, PathStore, paths_fname, read_path_store_or_compute
 from .abstract_formulation import AbstractFormulation, Objective
 
 PATHS_DIR = os.path.join(TOPOLOGIES_DIR, "paths", "path-form")
@@ -95,7 +111,8 @@ class PathFormulation(AbstractFormulation):
         dist_metric="inv-cap",
         DEBUG=False,
         VERBOSE=False,
-        out=None
+        out=None,
+        lp_backend=None
     ):
         super().__init__(objective, DEBUG, VERBOSE, out)
         if dist_metric != "inv-cap" and dist_metric != "min-hop":
@@ -107,14 +124,26 @@ class PathFormulation(AbstractFormulation):
         self._num_paths = num_paths
         self.edge_disjoint = edge_disjoint
         self.dist_metric = dist_metric
+        # name of the LP backend (see lib.lp_backend); None means LP_BACKEND
+        self._lp_backend = lp_backend
+        # every solve empties and refills the same model
+        self._model_pool = ModelPool(lp_backend)
 
     # flow caps = [((k1, ..., kn), f1), ...]
-    def _construct_path_lp(self, G, edge_to_paths, num_total_paths, sat_flows=[]):
+    def _construct_path_lp(self, edge_to_paths, num_total_paths, sat_flows=[]):
         self._print("Constructing Path LP")
-        m = Model("max-flow: path formulation")
+        m = self._model_pool.get("path-lp", "max-flow: path formulation")
 
         # Create variables: one for each path
-        path_vars = m.addVars(num_total_paths, vtype=GRB.CONTINUOUS, lb=0.0, name="f")
+        path_vars = m.add_vars(num_total_paths, lb=0.0, name="f")
+
+        # Every constraint is a row of the path-edge or path-commodity
+        # incidence matrix, so we add them in bulk instead of one at a time
+        lp_edge_ids, caps, edge_mat = problem_edge_capacities_and_incidence(
+            self._problem, edge_to_paths, num_total_paths
+        )
+        commod_mat = path_commod_incidence(self.commodities, num_total_paths)
+        demands = np.array([d_k for _, d_k, _ in self.commodities], dtype=np.float64)
 
         # Set objective
         if (
@@ -124,120 +153,112 @@ class PathFormulation(AbstractFormulation):
             self._print("{} objective".format(self._objective))
 
             if self._objective == Objective.MIN_MAX_LINK_UTIL:
-                max_link_util_var = m.addVar(
-                    vtype=GRB.CONTINUOUS, lb=0.0, ub=1.0, name="z"
-                )
+                max_link_util_var = m.add_vars(1, lb=0.0, ub=1.0, name="z")
             else:
                 # max link util can exceed 1.0
-                max_link_util_var = m.addVar(vtype=GRB.CONTINUOUS, lb=0.0, name="z")
-
-            m.setObjective(max_link_util_var, GRB.MINIMIZE)
-            # Add edge util constraints
-            for u, v, c_e in G.edges.data("capacity"):
-                if (u, v) in edge_to_paths:
-                    paths = edge_to_paths[(u, v)]
-                    constr_vars = [path_vars[p] for p in paths]
-                    if c_e == 0.0:
-                        m.addConstr(quicksum(constr_vars) <= 0.0)
-                    else:
-                        m.addConstr(quicksum(constr_vars) / c_e <= max_link_util_var)
+                max_link_util_var = m.add_vars(1, lb=0.0, name="z")
+
+            m.set_objective(max_link_util_var, 1.0, MINIMIZE)
+            # Add edge util constraints: sum(f_p) - c_e * z <= 0. The capacity
+            # is the coefficient of z (instead of dividing by it) so that
+            # resolve can update it in place, and so that zero-capacity edges
+            # become sum(f_p) <= 0
+            self._capacity_constrs = m.add_constrs(
+                sp.hstack([edge_mat, -caps.reshape(-1, 1)], format="csr"),
+                np.concatenate([path_vars, max_link_util_var]),
+                LESS_EQUAL,
+                np.zeros(len(caps)),
+            )
+            self._max_link_util_var = max_link_util_var[0]
 
             # Add demand equality constraints
-            commod_id_to_path_inds = {}
-            self._demand_constrs = []
-            for k, d_k, path_ids in self.commodities:
-                commod_id_to_path_inds[k] = path_ids
-                self._demand_constrs.append(
-                    m.addConstr(quicksum(path_vars[p] for p in path_ids) == d_k)
-                )
+            self._demand_constrs = m.add_constrs(commod_mat, path_vars, EQUAL, demands)
 
         else:
             if self._objective == Objective.TOTAL_FLOW:
                 self._print("TOTAL FLOW objective")
-                obj = quicksum(path_vars)
+                m.set_objective(path_vars, 1.0, MAXIMIZE)
             elif self._objective == Objective.MAX_CONCURRENT_FLOW:
                 self._print("MAX CONCURRENT FLOW objective")
-                self.alpha = m.addVar(vtype=GRB.CONTINUOUS, lb=0.0, ub=1.0, name="a")
-                m.update()
-                for k, d_k, path_ids in self.commodities:
-                    m.addConstr(
-                        quicksum(path_vars[p] for p in path_ids) / d_k >= self.alpha
-                    )
-                obj = self.alpha
-            m.setObjective(obj, GRB.MAXIMIZE)
+                self.alpha = m.add_vars(1, lb=0.0, ub=1.0, name="a")
+                # sum(f_p) - d_k * alpha >= 0
+                self._mcf_constrs = m.add_constrs(
+                    sp.hstack([commod_mat, -demands.reshape(-1, 1)], format="csr"),
+                    np.concatenate([path_vars, self.alpha]),
+                    GREATER_EQUAL,
+                    np.zeros(len(demands)),
+                )
+                m.set_objective(self.alpha, 1.0, MAXIMIZE)
 
             # Add edge capacity constraints
-            for u, v, c_e in G.edges.data("capacity"):
-                if (u, v) in edge_to_paths:
-                    paths = edge_to_paths[(u, v)]
-                    constr_vars = [path_vars[p] for p in paths]
-                    m.addConstr(quicksum(constr_vars) <= c_e)
+            self._capacity_constrs = m.add_constrs(
+                edge_mat, path_vars, LESS_EQUAL, caps
+            )
             # Add demand constraints
-            commod_id_to_path_inds = {}
-            self._demand_constrs = []
-            for k, d_k, path_ids in self.commodities:
-                commod_id_to_path_inds[k] = path_ids
-                self._demand_constrs.append(
-                    m.addConstr(quicksum(path_vars[p] for p in path_ids) <= d_k)
-                )
+            self._demand_constrs = m.add_constrs(
+                commod_mat, path_vars, LESS_EQUAL, demands
+            )
+
+        # Kept so that resolve only has to touch the values that changed
+        self._lp_edge_ids = lp_edge_ids
+        self._lp_caps, self._lp_demands = caps, demands
 
         # Flow cap constraints
-        for fixed_commods, flow_value in sat_flows:
-            constr_vars = [
-                path_vars[p] for k in fixed_commods for p in commod_id_to_path_inds[k]
-            ]
-            m.addConstr(quicksum(constr_vars) >= 0.99 * flow_value)
+        if len(sat_flows) > 0:
+            commod_id_to_row = {k: i for i, (k, _, _) in enumerate(self.commodities)}
+            fixed_rows, fixed_cols = [], []
+            for i, (fixed_commods, _) in enumerate(sat_flows):
+                for k in fixed_commods:
+                    fixed_rows.append(i)
+                    fixed_cols.append(commod_id_to_row[k])
+            fixed_mat = sp.csr_matrix(
+                (np.ones(len(fixed_rows)), (fixed_rows, fixed_cols)),
+                shape=(len(sat_flows), len(self.commodities)),
+            )
+            m.add_constrs(
+                fixed_mat @ commod_mat,
+                path_vars,
+                GREATER_EQUAL,
+                np.array([0.99 * flow_value for _, flow_value in sat_flows]),
+            )
 
         if self.DEBUG:
             m.write("pf_debug.lp")
         return LpSolver(m, None, self.DEBUG, self.VERBOSE, self.out)
 
+    # Paths are keyed by the fingerprints of the topology and of its edge
+    # weights (see paths_fname), not by the problem's name, so problems with
+    # other capacities get their own paths (see read_path_store_or_compute)
     @staticmethod
     def paths_full_fname(problem, num_paths, edge_disjoint, dist_metric):
-        return os.path.join(
+        return paths_fname(
             PATHS_DIR,
-            "{}-{}-paths_edge-disjoint-{}_dist-metric-{}-dict.pkl".format(
-                problem.name, num_paths, edge_disjoint, dist_metric
-            ),
+            problem.topology.fingerprint,
+            problem.G,
+            num_paths,
+            edge_disjoint,
+            dist_metric,
         )
 
     @staticmethod
     def compute_paths(problem, num_paths, edge_disjoint, dist_metric):
-        paths_dict = {}
-        G = graph_copy_with_edge_weights(problem.G, dist_metric)
-        for s_k in G.nodes:
-            for t_k in G.nodes:
-                if s_k == t_k:
-                    continue
-                paths = find_paths(G, s_k, t_k, num_paths, edge_disjoint)
-                paths_no_cycles = [remove_cycles(path) for path in paths]
-                paths_dict[(s_k, t_k)] = paths_no_cycles
-        return paths_dict
+        return compute_all_paths(problem.G, num_paths, edge_disjoint, dist_metric)
 
     @staticmethod
     def read_paths_from_disk_or_compute(problem, num_paths, edge_disjoint, dist_metric):
-        paths_fname = PathFormulation.paths_full_fname(
+        pkl_fname = PathFormulation.paths_full_fname(
             problem, num_paths, edge_disjoint, dist_metric
         )
-        print("Loading paths from pickle file", paths_fname)
-
-        try:
-            with open(paths_fname, "rb") as f:
-                paths_dict = pickle.load(f)
-                for key, paths in paths_dict.items():
-                    paths_no_cycles = [remove_cycles(path) for path in paths]
-                    paths_dict[key] = paths_no_cycles
-                print("paths_dict size:", len(paths_dict))
-                return paths_dict
-        except FileNotFoundError:
-            print("Unable to find {}".format(paths_fname))
-            paths_dict = PathFormulation.compute_paths(
+        return read_path_store_or_compute(
+            pkl_fname,
+            problem.G,
+            lambda: PathFormulation.compute_paths(
                 problem, num_paths, edge_disjoint, dist_metric
-            )
-            print("Saving paths to pickle file")
-            with open(paths_fname, "wb") as w:
-                pickle.dump(paths_dict, w)
-            return paths_dict
+            ),
+            num_paths,
+            edge_disjoint,
+            dist_metric,
+        )
 
     def get_paths(self, problem):
         if not hasattr(self, "_paths_dict"):
@@ -252,26 +273,163 @@ class PathFormulation(AbstractFormulation):
 
     def solve(self, problem, num_threads=NUM_CORES):
         self._problem = problem
+        self._invalidate_sol_caches()
         self._solver = self._construct_lp([])
         return self._solver.solve_lp(num_threads=num_threads)
 
-    def pre_solve(self, problem=None):
+    # Re-solve the model built by the last call to solve for a new traffic
+    # matrix and/or new edge capacities, without rebuilding it. Either pass a
+    # new problem on the same topology, or a new tm (num_nodes x num_nodes
+    # array) and/or capacities (one per edge, in problem.G.edges order), which
+    # are written into the current problem. Only the demands and capacities
+    # that changed are updated in the model, and the previous simplex basis is
+    # used as a warm start. If the new problem has commodities that the model
+    # does not have paths for, the model is rebuilt from scratch.
+    # Instead of a tm, a DemandDelta (see lib.problem_sequence) from the
+    # traffic matrix the model was last solved for can be passed: it is
+    # written into the problem's traffic matrix, and only its demands are
+    # looked up in the model, without scanning the whole traffic matrix.
+    def resolve(
+        self,
+        problem=None,
+        tm=None,
+        capacities=None,
+        num_threads=NUM_CORES,
+        method=Method.DUAL_SIMPLEX,
+        delta=None,
+    ):
+        if not hasattr(self, "_solver"):
+            raise Exception("resolve called before solve; no model to re-solve")
         if problem is None:
             problem = self.problem
+        if tm is not None:
+            problem.traffic_matrix.tm = np.array(tm, dtype=np.float64)
+        if capacities is not None:
+            problem.set_capacities(capacities)
+
+        commodity_table = None
+        if delta is not None:
+            delta.apply(problem.traffic_matrix)
+            commodity_table = self._commodity_table_after(delta)
+        if commodity_table is None:
+            commodity_table = self._problem_commodity_table(problem)
+        if (
+            not self._can_update_path_lp()
+            or not problem.topology.has_same_edges(self._problem.topology)
+            or not np.array_equal(commodity_table.src, self._commodity_table.src)
+            or not np.array_equal(commodity_table.dst, self._commodity_table.dst)
+        ):
+            self._print("cannot update the model in place; rebuilding it")
+            return self.solve(problem, num_threads=num_threads)
+
+        self._problem = problem
+        self._commodity_table = commodity_table
+        if delta is None:
+            self.commodity_list = self._problem_commodity_list(problem)
+        else:
+            self.commodity_list = commodity_table.as_list()
+        self._invalidate_sol_caches()
+        backend = self._solver.backend
+        basis = backend.get_basis()
+
+        demands = commodity_table.demand.astype(np.float64)
+        changed = np.flatnonzero(demands != self._lp_demands)
+        backend.set_rhs(self._demand_constrs[changed], demands[changed])
+        if self._objective == Objective.MAX_CONCURRENT_FLOW:
+            backend.set_coeffs(
+                self._mcf_constrs[changed], self.alpha[0], -demands[changed]
+            )
+        self.commodities = [
+            (k, d_k, path_ids)
+            for (k, _, path_ids), d_k in zip(self.commodities, demands.tolist())
+        ]
 
-        self.commodity_list = (
-            problem.sparse_commodity_list
-            if self._warm_start_mode
-            else problem.commodity_list
+        caps = problem.capacities[self._lp_edge_ids]
+        changed = np.flatnonzero(caps != self._lp_caps)
+        if (
+            self._objective == Objective.MIN_MAX_LINK_UTIL
+            or self._objective == Objective.COMPUTE_DEMAND_SCALE_FACTOR
+        ):
+            backend.set_coeffs(
+                self._capacity_constrs[changed],
+                self._max_link_util_var,
+                -caps[changed],
+            )
+        else:
+            backend.set_rhs(self._capacity_constrs[changed], caps[changed])
+        self._lp_caps, self._lp_demands = caps, demands
+
+        if basis is not None:
+            backend.set_basis(basis)
+        return self._solver.solve_lp(method=method, num_threads=num_threads)
+
+    # The model's commodities with the demands of delta, or None if delta
+    # adds a commodity that the model does not have, or (outside of warm start
+    # mode, where zero demands are not commodities) removes one
+    def _commodity_table_after(self, delta):
+        ids = self._commodity_table.ids_of(delta.src, delta.dst)
+        if np.any(ids < 0) or (
+            not self._warm_start_mode and np.any(delta.new_demand == 0)
+        ):
+            return None
+        demand = self._commodity_table.demand.copy()
+        demand[ids] = delta.new_demand
+        return CommodityTable(
+            self._commodity_table.src, self._commodity_table.dst, demand
         )
+
+    def solve_warm_start(self, problem):
+        assert self._warm_start_mode
+        return self.resolve(problem)
+
+    def _can_update_path_lp(self):
+        return True
+
+    def _invalidate_sol_caches(self):
+        for attr in [
+            "_path_flows",
+            "_sol_dict",
+            "_runtime",
+            "_obj_val",
+            "_total_flow",
+            "_min_frac_flow",
+            "_max_link_util",
+        ]:
+            if hasattr(self, attr):
+                delattr(self, attr)
+
+    # In warm start mode, every pair of nodes is a commodity (with a zero
+    # demand if it has no traffic), so that the LP can be re-solved for any TM
+    def _problem_commodity_table(self, problem):
+        if self._warm_start_mode:
+            return problem.sparse_commodity_table
+        return problem.commodity_table
+
+    def _problem_commodity_list(self, problem):
+        if self._warm_start_mode:
+            return problem.sparse_commodity_list
+        return problem.commodity_list
+
+    def pre_solve(self, problem=None):
+        if problem is None:
+            problem = self.problem
+
+        self._commodity_table = self._problem_commodity_table(problem)
+        self.commodity_list = self._problem_commodity_list(problem)
+        paths_dict = self.get_paths(problem)
+        if (
+            isinstance(paths_dict, PathStore)
+            and paths_dict.edge_ids is not None
+            and len(paths_dict.capacities) == problem.topology.num_edges
+        ):
+            return self._pre_solve_from_store(problem, paths_dict)
+
         self.commodities = []
         edge_to_paths = defaultdict(list)
         self._path_to_commod = {}
         self._all_paths = []
-
-        paths_dict = self.get_paths(problem)
         path_i = 0
-        for k, (s_k, t_k, d_k) in self.commodity_list:
+        for k, s_k, t_k, d_k in self._commodity_table.rows():
             paths = paths_dict[(s_k, t_k)]
             path_ids = []
             for path in paths:
@@ -291,48 +449,83 @@ class PathFormulation(AbstractFormulation):
         self._print("pre_solve done")
         return dict(edge_to_paths), path_i
 
+    # Same as pre_solve, for paths in a PathStore with edge ids: the paths of
+    # all the commodities are looked up at once, and the path-edge incidence
+    # is read from the store's edge ids. The paths of the LP are a PathList,
+    # path_to_commod is an array, and edge_to_paths an IncidenceEdgeToPaths
+    def _pre_solve_from_store(self, problem, paths):
+        commodity_table = self._commodity_table
+        pairs = paths.pair_indices(commodity_table.src, commodity_table.dst)
+        if np.any(pairs < 0):
+            i = int(np.argmax(pairs < 0))
+            raise KeyError((int(commodity_table.src[i]), int(commodity_table.dst[i])))
+        starts = paths.pair_offsets[pairs]
+        num_commod_paths = paths.pair_offsets[pairs + 1] - starts
+        # the paths of commodity k are path_offsets[k] to path_offsets[k + 1]
+        path_offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+        np.cumsum(num_commod_paths, out=path_offsets[1:])
+        num_paths = int(path_offsets[-1])
+        # id in paths of every path of the LP
+        store_path_ids = np.repeat(
+            starts - path_offsets[:-1], num_commod_paths
+        ) + np.arange(num_paths)
+
+        self._path_to_commod = np.repeat(np.arange(len(pairs)), num_commod_paths)
+        self._all_paths = PathList(paths, store_path_ids)
+        self.commodities = [
+            (k, d_k, list(range(start, stop)))
+            for k, (d_k, start, stop) in enumerate(
+                zip(
+                    commodity_table.demand,
+                    path_offsets[:-1].tolist(),
+                    path_offsets[1:].tolist(),
+                )
+            )
+        ]
+        edge_to_paths = IncidenceEdgeToPaths(
+            paths.path_edge_incidence(store_path_ids),
+            problem.edges_list,
+            problem.edge_idx,
+        )
+
+        self._print("pre_solve done")
+        return edge_to_paths, num_paths
+
     def _construct_lp(self, sat_flows=[]):
         edge_to_paths, num_paths = self.pre_solve()
-        return self._construct_path_lp(
-            self._problem.G, edge_to_paths, num_paths, sat_flows
-        )
+        return self._construct_path_lp(edge_to_paths, num_paths, sat_flows)
+
+    # Flow on every path, read from the model with one bulk query; the path
+    # variables are the first variables added by _construct_path_lp
+    @property
+    def path_flows(self):
+        if not hasattr(self, "_path_flows"):
+            self._path_flows = self._solver.primal_values(len(self._all_paths))
+        return self._path_flows
 
     @property
     def sol_dict(self):
         if not hasattr(self, "_sol_dict"):
-            sol_dict_def = defaultdict(list)
-            for var in self.model.getVars():
-                if var.varName.startswith("f[") and var.x != 0.0:
-                    match = re.match(r"f\[(\d+)\]", var.varName)
-                    p = int(match.group(1))
-                    sol_dict_def[self.commodity_list[self._path_to_commod[p]]] += [
-                        (edge, var.x) for edge in path_to_edge_list(self._all_paths[p])
-                    ]
-
-            # Set zero-flow commodities to be empty lists
-            self._sol_dict = {}
-            sol_dict_def = dict(sol_dict_def)
-            for commod_key in self.problem.commodity_list:
-                if commod_key in sol_dict_def:
-                    self._sol_dict[commod_key] = sol_dict_def[commod_key]
-                else:
-                    self._sol_dict[commod_key] = []
+            path_flows = self.path_flows
+            sol_dict_def = path_flows_to_sol_dict(
+                path_flows,
+                np.flatnonzero(path_flows != 0.0),
+                self._all_paths,
+                self._path_to_commod,
+                self.commodity_list,
+            )
+            self._sol_dict = self._create_sol_dict(sol_dict_def, self.commodity_list)
 
         return self._sol_dict
 
     @property
     def sol_mat(self):
-        edge_idx = self.problem.edge_idx
-        sol_mat = np.zeros((len(edge_idx), len(self._path_to_commod)), dtype=np.float32)
-        for var in self.model.getVars():
-            if var.varName.startswith("f[") and var.x != 0.0:
-                match = re.match(r"f\[(\d+)\]", var.varName)
-                p = int(match.group(1))
-                k = self._path_to_commod[p]
-                for edge in path_to_edge_list(self._all_paths[p]):
-                    sol_mat[edge_idx[edge], k] += var.x
-
-        return sol_mat
+        return path_flows_to_sol_mat(
+            self.path_flows,
+            path_edge_incidence_from_paths(self._all_paths, self.problem.edge_idx),
+            [self._path_to_commod[p] for p in range(len(self._all_paths))],
+            len(self.commodity_list),
+        )
 
     @classmethod
     # Return total number of fib entries and max for any node in topology
@@ -366,5 +559,10 @@ class PathFormulation(AbstractFormulation):
     @property
     def runtime(self):
         if not hasattr(self, "_runtime"):
-            self._runtime = self._solver.model.Runtime
+            self._runtime = self._solver.runtime
         return self._runtime
+
+    # SolveStats of the last (re)solve
+    @property
+    def solve_stats(self):
+        return self._solver.stats
@@ -1,6 +1,10 @@
+import multiprocessing
 import os
+import time
 from collections import defaultdict
 
+import numpy as np
+
 from lib.graph_utils import compute_residual_problem
 
 from ..config import TOPOLOGIES_DIR
@@ -8,10 +12,12 @@ from ..constants import NUM_CORES
 from ..partitioning.pop import (
     BaselineSplitter,
     GenericSplitter,
+    PreclusterCache,
     RandomSplitter,
     RandomSplitter2,
     SmartSplitter,
 )
+from ..path_utils import path_flows_to_sol_dict
 from ..runtime_utils import parallelized_rt
 from .abstract_formulation import Objective
 from .path_formulation import PathFormulation
@@ -112,6 +118,9 @@ class POP(PathFormulation):
         DEBUG=False,
         VERBOSE=False,
         out=None,
+        lp_backend=None,
+        num_workers=1,
+        precluster_workers=None,
         **addl_kwargs,
     ):
         super().__init__(
@@ -122,11 +131,26 @@ class POP(PathFormulation):
             DEBUG=DEBUG,
             VERBOSE=VERBOSE,
             out=out,
+            lp_backend=lp_backend,
         )
         self._num_subproblems = num_subproblems
         self._split_method = split_method
         self._split_fraction = split_fraction
         self._algo_cls = algo_cls
+        # With num_workers > 1 (None for NUM_CORES or one per CPU, whichever
+        # is fewer), subproblems are solved on a pool of that many processes;
+        # by default, they are solved one after the other in this process. A
+        # pool is started for every solve, and each worker gets a copy of the
+        # paths dict, which costs more than the subproblems take to solve on
+        # small topologies; it only pays off for subproblems that take long to
+        # solve
+        if num_workers is None:
+            num_workers = min(NUM_CORES, os.cpu_count() or 1)
+        self._num_workers = max(min(num_workers, num_subproblems), 1)
+        # Preclusters of the "cluster" split method are fitted on
+        # precluster_workers processes and reused by every split of a problem
+        # with the same topology and paths (see PreclusterCache)
+        self._precluster_cache = PreclusterCache(num_workers=precluster_workers)
         self._addl_kwargs = addl_kwargs
 
     def split_problems(self, problem, num_subproblems):
@@ -155,6 +179,7 @@ class POP(PathFormulation):
                     pf_original,
                     self._split_method,
                     self._split_fraction,
+                    precluster_cache=self._precluster_cache,
                 )
         else:
             raise Exception("Invalid split_method {}".format(self._split_method))
@@ -167,89 +192,189 @@ class POP(PathFormulation):
 
     def solve(self, problem):
         self._problem = problem
+        self._invalidate_sol_caches()
         # List of subproblems that have not been solved yet. Each time, we solve a subproblem,
         # we'll remove an index from it
         unsolved_subproblem_indices = list(range(self._num_subproblems))
         # Initialize all the PF objects for each subproblem index. Even if the subproblem changes
         # from one iteration to the next of the outer while loop, we'll keep the same PF object
-
-        self._algos = [
-            self._algo_cls(
-                objective=self._objective,
-                num_paths=self._num_paths,
-                DEBUG=self.DEBUG,
-                VERBOSE=self.VERBOSE,
-                **self._addl_kwargs,
-            )
-            for _ in range(self._num_subproblems)
-        ]
+        # (Only used when solving the subproblems in this process)
+        self._algos = (
+            [
+                self._algo_cls(**self._algo_kwargs())
+                for _ in range(self._num_subproblems)
+            ]
+            if self._num_workers == 1
+            else None
+        )
         self._paths_dict = self.get_paths(problem)
         # Initialize this to be a list of Nones; each time we solve a subproblem, we'll replace None
         # with the solved subproblem
         self._subproblem_list = [None for i in range(self._num_subproblems)]
+        # sol_dict of every solved subproblem
+        self._sol_dicts = [None for _ in range(self._num_subproblems)]
+        # SolveStats of every solve of each subproblem, infeasible ones included
+        self._solve_stats = [[] for _ in range(self._num_subproblems)]
         unsolved_subproblems = self.split_problems(problem, self._num_subproblems)
-        leftover_capacities = defaultdict(float)
-
-        self.iter = 0
-        while len(unsolved_subproblem_indices) > 0:
-            self._print("WHILE LOOP, ITER {}".format(self.iter))
-            num_subproblems_in_iter = len(unsolved_subproblem_indices)
-            subproblems_to_remove = []
-            for i in unsolved_subproblem_indices:
-                self._print("SUBPROBLEM {}, ITER {}".format(i, self.iter))
-                subproblem = unsolved_subproblems[i]
-                print(
-                    "SUBPROBLEM {}, total demand: {}".format(i, subproblem.total_demand)
-                )
-                algo = self._algos[i]
-                algo._paths_dict = self._paths_dict
-                obj_val = algo.solve(
-                    subproblem,
-                    # Force Gurobi to use a single thread
-                    num_threads=max(NUM_CORES // num_subproblems_in_iter, 1),
-                )
-                if obj_val is not None:
-                    # If the subproblem was solved, then we'll replace the None in the list with
-                    # the solved subproblem
-                    self._subproblem_list[i] = subproblem
-                    # We also queue the index for removal from the list of unsolved subproblem indices
-                    subproblems_to_remove.append(i)
-                    # Finally, we compute the residual by subproblem subtracting the solved subproblem
-                    # from it
-                    residual_subproblem = compute_residual_problem(
-                        subproblem, algo.sol_dict
-                    )
-                    for u, v, cap in residual_subproblem.G.edges.data("capacity"):
-                        leftover_capacities[(u, v)] += cap
+        leftover_capacities = np.zeros(problem.topology.num_edges)
 
+        start_time = time.time()
+        pool = None
+        if self._num_workers > 1:
+            pool = multiprocessing.Pool(
+                self._num_workers,
+                initializer=_init_subproblem_worker,
+                initargs=(self._algo_cls, self._algo_kwargs(), self._paths_dict),
+            )
+        try:
+            self.iter = 0
+            while len(unsolved_subproblem_indices) > 0:
+                self._print("WHILE LOOP, ITER {}".format(self.iter))
+                for i in unsolved_subproblem_indices:
+                    print(
+                        "SUBPROBLEM {}, total demand: {}".format(
+                            i, unsolved_subproblems[i].total_demand
+                        )
+                    )
+                if pool is None:
+                    solutions = self._solve_subproblems_serially(
+                        unsolved_subproblems, unsolved_subproblem_indices
+                    )
                 else:
-                    self._print(
-                        "SUBPROBLEM {}, ITER {} is infeasible".format(i, self.iter)
+                    solutions = self._solve_subproblems_in_parallel(
+                        pool, unsolved_subproblems, unsolved_subproblem_indices
                     )
-            for i in subproblems_to_remove:
-                unsolved_subproblem_indices.remove(i)
-            self.iter += 1
-            if len(unsolved_subproblem_indices) == 0:
-                break
-            # Add the leftover capacities to the remaining subproblems
-            for (u, v), extra_cap in leftover_capacities.items():
-                extra_cap_per_remaining_subproblem = extra_cap / len(
+
+                subproblems_to_remove = []
+                for i in unsolved_subproblem_indices:
+                    subproblem = unsolved_subproblems[i]
+                    obj_val, solve_stats, sol_dict = solutions[i]
+                    self._solve_stats[i].append(solve_stats)
+                    if obj_val is not None:
+                        # If the subproblem was solved, then we'll replace the None in the list with
+                        # the solved subproblem
+                        self._subproblem_list[i] = subproblem
+                        self._sol_dicts[i] = sol_dict
+                        # We also queue the index for removal from the list of unsolved subproblem indices
+                        subproblems_to_remove.append(i)
+                        # Finally, we compute the residual by subproblem subtracting the solved subproblem
+                        # from it
+                        residual_subproblem = compute_residual_problem(
+                            subproblem, sol_dict
+                        )
+                        leftover_capacities += residual_subproblem.capacities
+
+                    else:
+                        self._print(
+                            "SUBPROBLEM {}, ITER {} is infeasible".format(i, self.iter)
+                        )
+                for i in subproblems_to_remove:
+                    unsolved_subproblem_indices.remove(i)
+                self.iter += 1
+                if len(unsolved_subproblem_indices) == 0:
+                    break
+                # Add the leftover capacities to the remaining subproblems
+                extra_cap_per_remaining_subproblem = leftover_capacities / len(
                     unsolved_subproblem_indices
                 )
                 for i in unsolved_subproblem_indices:
-                    unsolved_subproblems[i].G[u][v][
-                        "capacity"
-                    ] += extra_cap_per_remaining_subproblem
+                    unsolved_subproblems[i].set_capacities(
+                        unsolved_subproblems[i].capacities
+                        + extra_cap_per_remaining_subproblem
+                    )
+        finally:
+            self._wall_time = time.time() - start_time
+            if pool is not None:
+                pool.close()
+                pool.join()
 
         assert len(unsolved_subproblem_indices) == 0
         assert len([p for p in self._subproblem_list if p is None]) == 0
 
+    # Keyword arguments of the algo_cls object of each subproblem
+    def _algo_kwargs(self):
+        algo_kwargs = dict(self._addl_kwargs)
+        # Only pass the LP backend along if one was requested, since not every
+        # algo_cls takes it
+        if self._lp_backend is not None:
+            algo_kwargs["lp_backend"] = self._lp_backend
+        return dict(
+            objective=self._objective,
+            num_paths=self._num_paths,
+            DEBUG=self.DEBUG,
+            VERBOSE=self.VERBOSE,
+            **algo_kwargs,
+        )
+
+    # {i: (obj_val, SolveStats, sol_dict)} for every subproblem index i in
+    # indices, solved one after the other with this POP's algos
+    def _solve_subproblems_serially(self, subproblems, indices):
+        solutions = {}
+        for i in indices:
+            self._print("SUBPROBLEM {}, ITER {}".format(i, self.iter))
+            algo = self._algos[i]
+            algo._paths_dict = self._paths_dict
+            obj_val = algo.solve(
+                subproblems[i],
+                # Force Gurobi to use a single thread
+                num_threads=max(NUM_CORES // len(indices), 1),
+            )
+            solutions[i] = (
+                obj_val,
+                algo.solve_stats,
+                algo.sol_dict if obj_val is not None else None,
+            )
+        return solutions
+
+    # Same as _solve_subproblems_serially, on pool: the subproblems are
+    # dispatched longest first (by the runtime of their previous solves, or
+    # else their number of commodities), the order that runtime_est assumes,
+    # and the NUM_CORES threads are split evenly among the busy workers
+    def _solve_subproblems_in_parallel(self, pool, subproblems, indices):
+        def expected_runtime(i):
+            if len(self._solve_stats[i]) > 0:
+                return sum(stats.runtime for stats in self._solve_stats[i])
+            return len(subproblems[i].commodity_list)
+
+        num_threads = max(NUM_CORES // min(self._num_workers, len(indices)), 1)
+        pending = {
+            i: pool.apply_async(
+                _solve_subproblem_in_worker, (subproblems[i], num_threads)
+            )
+            for i in sorted(indices, key=expected_runtime, reverse=True)
+        }
+        solutions = {}
+        for i, result in pending.items():
+            obj_val, solve_stats, solution = result.get()
+            if isinstance(solution, tuple):
+                solution = self._path_flows_to_sol_dict(subproblems[i], *solution)
+            solutions[i] = (obj_val, solve_stats, solution)
+        return solutions
+
+    # sol_dict of subproblem from the compact solution returned by
+    # _compact_solution
+    def _path_flows_to_sol_dict(
+        self, subproblem, warm_start_mode, commod_ids, path_indices, flows
+    ):
+        commodity_list = (
+            subproblem.sparse_commodity_list
+            if warm_start_mode
+            else subproblem.commodity_list
+        )
+        paths = [
+            self._paths_dict[commodity_list[k][-1][:2]][j]
+            for k, j in zip(commod_ids.tolist(), path_indices.tolist())
+        ]
+        sol_dict_def = path_flows_to_sol_dict(
+            flows, np.arange(len(flows)), paths, commod_ids.tolist(), commodity_list
+        )
+        return self._create_sol_dict(sol_dict_def, commodity_list)
+
     @property
     def sol_dict(self):
         if not hasattr(self, "_sol_dict"):
-            sol_dicts = [pf.sol_dict for pf in self._algos]
             merged_sol_dict = defaultdict(list)
-            for sol_dict in sol_dicts:
+            for sol_dict in self._sol_dicts:
                 for (_, (src, target, _)), flow_list in sol_dict.items():
                     merged_sol_dict[(src, target)] += flow_list
             self._sol_dict = {
@@ -265,9 +390,76 @@ class POP(PathFormulation):
             "sol_mat needs to be implemented in the subclass: {}".format(self.__class__)
         )
 
+    # A subproblem's runtime is the sum over all of its solves
     def runtime_est(self, num_threads):
-        return parallelized_rt([pf.runtime for pf in self._algos], num_threads)
+        return parallelized_rt(
+            [sum(stats.runtime for stats in solves) for solves in self._solve_stats],
+            num_threads,
+        )
 
     @property
     def runtime(self):
-        return sum([pf.runtime for pf in self._algos])
+        return sum(stats.runtime for solves in self._solve_stats for stats in solves)
+
+    # Measured wall-clock time of solving the subproblems, to compare with
+    # runtime_est
+    @property
+    def wall_time(self):
+        return self._wall_time
+
+    # [[SolveStats, ...], ...]: the solves of each subproblem, in order
+    @property
+    def solve_stats(self):
+        return self._solve_stats
+
+
+# Algorithm class, its keyword arguments and the paths dict of the
+# subproblem workers, set once per process
+_worker_algo_cls = None
+_worker_algo_kwargs = None
+_worker_paths_dict = None
+
+
+def _init_subproblem_worker(algo_cls, algo_kwargs, paths_dict):
+    global _worker_algo_cls, _worker_algo_kwargs, _worker_paths_dict
+    _worker_algo_cls, _worker_algo_kwargs = algo_cls, algo_kwargs
+    _worker_paths_dict = paths_dict
+
+
+def _solve_subproblem_in_worker(subproblem, num_threads):
+    algo = _worker_algo_cls(**_worker_algo_kwargs)
+    algo._paths_dict = _worker_paths_dict
+    obj_val = algo.solve(subproblem, num_threads=num_threads)
+    if obj_val is None:
+        return obj_val, algo.solve_stats, None
+    return obj_val, algo.solve_stats, _compact_solution(algo)
+
+
+# The solution of algo, a solved path formulation, as (warm start mode,
+# commodity ids, path indices, flows), with one array entry per path with a
+# non-zero flow: path path_indices[i] (in its paths dict entry) of commodity
+# commod_ids[i] carries flows[i]. Commodity ids index the commodity list algo
+# used: in warm start mode, its problem's sparse_commodity_list, and otherwise
+# its commodity_list (see PathFormulation._problem_commodity_list). Algorithms
+# whose sol_dict is not built from path flows return their sol_dict instead
+def _compact_solution(algo):
+    if type(algo).sol_dict is not PathFormulation.sol_dict:
+        return algo.sol_dict
+    path_flows = algo.path_flows
+    path_ids = np.flatnonzero(path_flows != 0.0)
+    first_path_ids = np.array(
+        [
+            path_ids_k[0] if len(path_ids_k) > 0 else 0
+            for _, _, path_ids_k in algo.commodities
+        ],
+        dtype=np.int64,
+    )
+    commod_ids = np.array(
+        [algo._path_to_commod[p] for p in path_ids.tolist()], dtype=np.int64
+    )
+    return (
+        algo._warm_start_mode,
+        commod_ids,
+        path_ids - first_path_ids[commod_ids],
+        path_flows[path_ids],
+    )
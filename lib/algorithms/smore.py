@@ -1,12 +1,16 @@
 from ..lp_solver import LpSolver
 from ..graph_utils import path_to_edge_list, compute_in_or_out_flow
-from ..path_utils import remove_cycles
+from ..path_utils import (
+    path_edge_incidence_from_paths,
+    path_flows_to_sol_dict,
+    path_flows_to_sol_mat,
+    remove_cycles,
+)
 from ..config import TOPOLOGIES_DIR
 from .abstract_formulation import AbstractFormulation, Objective
 from gurobipy import GRB, Model, quicksum
 from collections import defaultdict
 import numpy as np
-import re
 import os
 import pickle
 import sys
@@ -184,51 +188,47 @@ class SMORE(AbstractFormulation):
             self._print("Constructing SMORE LP")
             return self._construct_smore_lp(self.problem.G, edge_to_paths, num_paths)
 
+    # Flow on every path, read from the model with one bulk query; the path
+    # variables are the first variables added to both LPs
+    @property
+    def path_flows(self):
+        if not hasattr(self, "_path_flows"):
+            path_flows = self._solver.primal_values(len(self._all_paths))
+            if self._objective == Objective.MIN_MAX_LINK_UTIL:
+                # SMORE's path variables are fractions of each commodity's demand
+                commodity_list = self.problem.commodity_list
+                path_flows *= [
+                    commodity_list[self._path_to_commod[p]][-1][-1]
+                    for p in range(len(self._all_paths))
+                ]
+            self._path_flows = path_flows
+        return self._path_flows
+
     @property
     def sol_dict(self):
         if not hasattr(self, "_sol_dict"):
-            sol_dict_def = defaultdict(list)
-            for var in self.model.getVars():
-                if var.varName.startswith("f[") and var.x != 0.0:
-                    match = re.match(r"f\[(\d+)\]", var.varName)
-                    p = int(match.group(1))
-                    commod_key = self.problem.commodity_list[self._path_to_commod[p]]
-                    d_k = commod_key[-1][-1]
-                    flow_val = (
-                        var.x * d_k
-                        if self._objective == Objective.MIN_MAX_LINK_UTIL
-                        else var.x
-                    )
-                    sol_dict_def[commod_key] += [
-                        (edge, flow_val)
-                        for edge in path_to_edge_list(self._all_paths[p])
-                    ]
-
-            # Set zero-flow commodities to be empty lists
-            self._sol_dict = {}
-            sol_dict_def = dict(sol_dict_def)
-            for commod_key in self.problem.commodity_list:
-                if commod_key in sol_dict_def:
-                    self._sol_dict[commod_key] = sol_dict_def[commod_key]
-                else:
-                    self._sol_dict[commod_key] = []
+            path_flows = self.path_flows
+            sol_dict_def = path_flows_to_sol_dict(
+                path_flows,
+                np.flatnonzero(path_flows != 0.0),
+                self._all_paths,
+                self._path_to_commod,
+                self.problem.commodity_list,
+            )
+            self._sol_dict = self._create_sol_dict(
+                sol_dict_def, self.problem.commodity_list
+            )
 
         return self._sol_dict
 
     @property
     def sol_mat(self):
-        edge_idx = self.problem.edge_idx
-        sol_mat = np.zeros((len(edge_idx), len(self._path_to_commod)), dtype=np.float32)
-        for var in self.model.getVars():
-            if var.varName.startswith("f[") and var.x != 0.0:
-                match = re.match(r"f\[(\d+)\]", var.varName)
-                p = int(match.group(1))
-                commod_key = self.problem.commodity_list[self._path_to_commod[p]]
-                k, d_k = commod_key[0], commod_key[-1][-1]
-                for edge in path_to_edge_list(self._all_paths[p]):
-                    sol_mat[edge_idx[edge], k] += var.x * d_k
-
-        return sol_mat
+        return path_flows_to_sol_mat(
+            self.path_flows,
+            path_edge_incidence_from_paths(self._all_paths, self.problem.edge_idx),
+            [self._path_to_commod[p] for p in range(len(self._all_paths))],
+            len(self.problem.commodity_list),
+        )
 
     @property
     def total_flow(self):
@@ -2,12 +2,18 @@ import os
 from itertools import chain
 from collections import defaultdict
 
-from gurobipy import GRB, Model, quicksum
+import numpy as np
+import scipy.sparse as sp
 
 from lib.algorithms.abstract_formulation import Objective
 
 from ..config import TOPOLOGIES_DIR
+from ..lp_backend import GREATER_EQUAL, LESS_EQUAL, MINIMIZE
 from ..lp_solver import LpSolver
+from ..path_utils import (
+    path_commod_incidence,
+    problem_edge_capacities_and_incidence,
+)
 from .path_formulation import PathFormulation
 
 PATHS_DIR = os.path.join(TOPOLOGIES_DIR, "paths", "path-form")
@@ -28,6 +34,7 @@ class TEAVAR(PathFormulation):
         DEBUG=False,
         VERBOSE=False,
         out=None,
+        lp_backend=None,
         objective=None,  # this argument has to be here so that it matches the signature of the superclass
     ):
         super().__init__(
@@ -38,6 +45,7 @@ class TEAVAR(PathFormulation):
             DEBUG=DEBUG,
             VERBOSE=VERBOSE,
             out=out,
+            lp_backend=lp_backend,
         )
         assert len(failure_scenarios) == len(failure_probs)
         self._availability = availability
@@ -67,7 +75,12 @@ class TEAVAR(PathFormulation):
             self.failed_paths_per_scenario.append(failed_path_ids_dict)
         return edge_to_paths, num_paths
 
-    def _construct_path_lp(self, G, edge_to_paths, num_total_paths, sat_flows=[]):
+    # The demands scale the path coefficients of every scenario constraint,
+    # so resolve rebuilds the model instead of updating it in place
+    def _can_update_path_lp(self):
+        return False
+
+    def _construct_path_lp(self, edge_to_paths, num_total_paths, sat_flows=[]):
         failure_probs = self._failure_probs
         failure_scenarios = self.failed_paths_per_scenario
         beta = self._availability
@@ -75,45 +88,70 @@ class TEAVAR(PathFormulation):
         num_commodities = len(self.commodities)
 
         # Taken from page 5 of http://teavar.csail.mit.edu/paper.pdf
-        m = Model("TEAVAR")
+        m = self._model_pool.get("path-lp", "TEAVAR")
         # Create variables
-        path_vars = m.addVars(num_total_paths, vtype=GRB.CONTINUOUS, lb=0.0, name="f")
+        path_vars = m.add_vars(num_total_paths, lb=0.0, name="f")
         # TEAVAR-specific variables
-        alpha = m.addVar(vtype=GRB.CONTINUOUS, lb=0.0, name="a")
-        scenario_vars = m.addVars(num_scenarios, vtype=GRB.CONTINUOUS, lb=0.0, name="s")
-        scenario_commodity_vars = m.addVars(
-            num_scenarios, num_commodities, vtype=GRB.CONTINUOUS, lb=0.0, name="sf"
+        alpha = m.add_vars(1, lb=0.0, name="a")
+        scenario_vars = m.add_vars(num_scenarios, lb=0.0, name="s")
+        # ordered by (scenario, commodity)
+        scenario_commodity_vars = m.add_vars(
+            num_scenarios * num_commodities, lb=0.0, name="sf"
         )
-        m.update()
-        weighted_losses = [
-            fp * scenario_vars[s] for (fp, s) in zip(failure_probs, scenario_vars)
-        ]
-        m.setObjective(
-            alpha + (1 / (1 - beta)) * quicksum(weighted_losses), GRB.MINIMIZE
+        m.set_objective(
+            np.concatenate([alpha, scenario_vars]),
+            np.concatenate([[1.0], np.array(failure_probs) / (1 - beta)]),
+            MINIMIZE,
         )
 
-        self._demand_constrs = []
-        # Add scenario constraints
-        for s in scenario_vars:
-            scenario_var = scenario_vars[s]
-            for k, d_k, path_ids in self.commodities:
-                # Demand constraints
-                self._demand_constrs.append(
-                    m.addConstr(quicksum(path_vars[p] for p in path_ids) <= d_k)
-                )
-                flow_in_scenario_vars = [
-                    failure_scenarios[s][p] * path_vars[p] for p in path_ids
-                ]
-                commodity_loss = 1 - quicksum(flow_in_scenario_vars) / d_k
-                m.addConstr(scenario_commodity_vars[s, k] >= commodity_loss)
-                m.addConstr(scenario_var + alpha >= scenario_commodity_vars[s, k])
+        _, caps, edge_mat = problem_edge_capacities_and_incidence(
+            self._problem, edge_to_paths, num_total_paths
+        )
+        commod_mat = path_commod_incidence(self.commodities, num_total_paths)
+        demands = np.array([d_k for _, d_k, _ in self.commodities], dtype=np.float64)
+
+        # Demand constraints
+        self._demand_constrs = m.add_constrs(commod_mat, path_vars, LESS_EQUAL, demands)
+
+        # Add scenario constraints. The loss of commodity k in scenario s is
+        # 1 - (flow on paths that survive s) / d_k, i.e.
+        # sf[s, k] + sum(valid_s[p] * f_p) / d_k >= 1
+        frac_mat = sp.diags(1.0 / demands) @ commod_mat
+        scenario_frac_mats = []
+        for failed_paths in failure_scenarios:
+            valid_paths = np.ones(num_total_paths)
+            valid_paths[[p for p, valid in failed_paths.items() if valid == 0]] = 0.0
+            scenario_frac_mats.append(frac_mat @ sp.diags(valid_paths))
+        num_rows = num_scenarios * num_commodities
+        m.add_constrs(
+            sp.hstack(
+                [sp.vstack(scenario_frac_mats), sp.identity(num_rows)], format="csr"
+            ),
+            np.concatenate([path_vars, scenario_commodity_vars]),
+            GREATER_EQUAL,
+            np.ones(num_rows),
+        )
+        # s_s + alpha - sf[s, k] >= 0
+        scenario_ids = np.repeat(np.arange(num_scenarios), num_commodities)
+        m.add_constrs(
+            sp.hstack(
+                [
+                    np.ones((num_rows, 1)),
+                    sp.csr_matrix(
+                        (np.ones(num_rows), (np.arange(num_rows), scenario_ids)),
+                        shape=(num_rows, num_scenarios),
+                    ),
+                    -sp.identity(num_rows),
+                ],
+                format="csr",
+            ),
+            np.concatenate([alpha, scenario_vars, scenario_commodity_vars]),
+            GREATER_EQUAL,
+            np.zeros(num_rows),
+        )
 
         # Add edge capacity constraints
-        for u, v, c_e in G.edges.data("capacity"):
-            if (u, v) in edge_to_paths:
-                paths = edge_to_paths[(u, v)]
-                constr_vars = [path_vars[p] for p in paths]
-                m.addConstr(quicksum(constr_vars) <= c_e)
+        m.add_constrs(edge_mat, path_vars, LESS_EQUAL, caps)
 
         if self.DEBUG:
             m.write("teavar_debug.lp")
@@ -1,18 +1,17 @@
 import os
-import pickle
-import re
 from collections import defaultdict
 import time
 
 import numpy as np
-from gurobipy import GRB, Model, quicksum
 
 from ..config import TOPOLOGIES_DIR
 from ..constants import NUM_CORES
 from ..graph_utils import path_to_edge_list
-from ..lp_solver import LpSolver
-from ..path_utils import find_paths, graph_copy_with_edge_weights, remove_cycles
+from ..lp_backend import ModelPool
+from ..path_utils import compute_all_paths, path_flows_to_sol_dict
+from ..path_store import paths_fname, read_path_store_or_compute
 from .abstract_formulation import AbstractFormulation, Objective
+from .path_formulation import PathFormulation
 
 PATHS_DIR = os.path.join(TOPOLOGIES_DIR, "paths", "path-form")
 
@@ -101,7 +100,8 @@ class TopFormulation(AbstractFormulation):
         dist_metric="inv-cap",
         DEBUG=False,
         VERBOSE=False,
-        out=None
+        out=None,
+        lp_backend=None
     ):
         super().__init__(objective, DEBUG, VERBOSE, out)
         if dist_metric != "inv-cap" and dist_metric != "min-hop":
@@ -114,137 +114,44 @@ class TopFormulation(AbstractFormulation):
         self._top_percentage = top_percentage
         self.edge_disjoint = edge_disjoint
         self.dist_metric = dist_metric
+        self._lp_backend = lp_backend
+        self._model_pool = ModelPool(lp_backend)
 
     # flow caps = [((k1, ..., kn), f1), ...]
-    def _construct_path_lp(self, G, edge_to_paths, num_total_paths, sat_flows=[]):
-        self._print("Constructing Path LP")
-        m = Model("max-flow: path formulation")
-
-        # Create variables: one for each path
-        path_vars = m.addVars(num_total_paths, vtype=GRB.CONTINUOUS, lb=0.0, name="f")
-
-        # Set objective
-        if (
-            self._objective == Objective.MIN_MAX_LINK_UTIL
-            or self._objective == Objective.COMPUTE_DEMAND_SCALE_FACTOR
-        ):
-            self._print("{} objective".format(self._objective))
-
-            if self._objective == Objective.MIN_MAX_LINK_UTIL:
-                max_link_util_var = m.addVar(
-                    vtype=GRB.CONTINUOUS, lb=0.0, ub=1.0, name="z"
-                )
-            else:
-                # max link util can exceed 1.0
-                max_link_util_var = m.addVar(vtype=GRB.CONTINUOUS, lb=0.0, name="z")
-
-            m.setObjective(max_link_util_var, GRB.MINIMIZE)
-            # Add edge util constraints
-            for u, v, c_e in G.edges.data("capacity"):
-                if (u, v) in edge_to_paths:
-                    paths = edge_to_paths[(u, v)]
-                    constr_vars = [path_vars[p] for p in paths]
-                    if c_e == 0.0:
-                        m.addConstr(quicksum(constr_vars) <= 0.0)
-                    else:
-                        m.addConstr(quicksum(constr_vars) / c_e <= max_link_util_var)
-
-            # Add demand equality constraints
-            commod_id_to_path_inds = {}
-            self._demand_constrs = []
-            for k, d_k, path_ids in self.commodities:
-                commod_id_to_path_inds[k] = path_ids
-                self._demand_constrs.append(
-                    m.addConstr(quicksum(path_vars[p] for p in path_ids) == d_k)
-                )
-
-        else:
-            if self._objective == Objective.TOTAL_FLOW:
-                self._print("TOTAL FLOW objective")
-                obj = quicksum(path_vars)
-            elif self._objective == Objective.MAX_CONCURRENT_FLOW:
-                self._print("MAX CONCURRENT FLOW objective")
-                self.alpha = m.addVar(vtype=GRB.CONTINUOUS, lb=0.0, ub=1.0, name="a")
-                m.update()
-                for k, d_k, path_ids in self.commodities:
-                    m.addConstr(
-                        quicksum(path_vars[p] for p in path_ids) / d_k >= self.alpha
-                    )
-                obj = self.alpha
-            m.setObjective(obj, GRB.MAXIMIZE)
-
-            # Add edge capacity constraints
-            for u, v, c_e in G.edges.data("capacity"):
-                if (u, v) in edge_to_paths:
-                    paths = edge_to_paths[(u, v)]
-                    constr_vars = [path_vars[p] for p in paths]
-                    m.addConstr(quicksum(constr_vars) <= c_e)
-            # Add demand constraints
-            commod_id_to_path_inds = {}
-            self._demand_constrs = []
-            for k, d_k, path_ids in self.commodities:
-                commod_id_to_path_inds[k] = path_ids
-                self._demand_constrs.append(
-                    m.addConstr(quicksum(path_vars[p] for p in path_ids) <= d_k)
-                )
-
-        # Flow cap constraints
-        for fixed_commods, flow_value in sat_flows:
-            constr_vars = [
-                path_vars[p] for k in fixed_commods for p in commod_id_to_path_inds[k]
-            ]
-            m.addConstr(quicksum(constr_vars) >= 0.99 * flow_value)
-
-        if self.DEBUG:
-            m.write("pf_debug.lp")
-        return LpSolver(m, None, self.DEBUG, self.VERBOSE, self.out)
+    # Same path LP as PathFormulation, so we reuse its matrix-form builder
+    _construct_path_lp = PathFormulation._construct_path_lp
 
+    # Same paths as PathFormulation (see PathFormulation.paths_full_fname)
     @staticmethod
     def paths_full_fname(problem, num_paths, edge_disjoint, dist_metric):
-        return os.path.join(
+        return paths_fname(
             PATHS_DIR,
-            "{}-{}-paths_edge-disjoint-{}_dist-metric-{}-dict.pkl".format(
-                problem.name, num_paths, edge_disjoint, dist_metric
-            ),
+            problem.topology.fingerprint,
+            problem.G,
+            num_paths,
+            edge_disjoint,
+            dist_metric,
         )
 
     @staticmethod
     def compute_paths(problem, num_paths, edge_disjoint, dist_metric):
-        paths_dict = {}
-        G = graph_copy_with_edge_weights(problem.G, dist_metric)
-        for s_k in G.nodes:
-            for t_k in G.nodes:
-                if s_k == t_k:
-                    continue
-                paths = find_paths(G, s_k, t_k, num_paths, edge_disjoint)
-                paths_no_cycles = [remove_cycles(path) for path in paths]
-                paths_dict[(s_k, t_k)] = paths_no_cycles
-        return paths_dict
+        return compute_all_paths(problem.G, num_paths, edge_disjoint, dist_metric)
 
     @staticmethod
     def read_paths_from_disk_or_compute(problem, num_paths, edge_disjoint, dist_metric):
-        paths_fname = TopFormulation.paths_full_fname(
+        pkl_fname = TopFormulation.paths_full_fname(
             problem, num_paths, edge_disjoint, dist_metric
         )
-        print("Loading paths from pickle file", paths_fname)
-
-        try:
-            with open(paths_fname, "rb") as f:
-                paths_dict = pickle.load(f)
-                for key, paths in paths_dict.items():
-                    paths_no_cycles = [remove_cycles(path) for path in paths]
-                    paths_dict[key] = paths_no_cycles
-                print("paths_dict size:", len(paths_dict))
-                return paths_dict
-        except FileNotFoundError:
-            print("Unable to find {}".format(paths_fname))
-            paths_dict = TopFormulation.compute_paths(
+        return read_path_store_or_compute(
+            pkl_fname,
+            problem.G,
+            lambda: TopFormulation.compute_paths(
                 problem, num_paths, edge_disjoint, dist_metric
-            )
-            print("Saving paths to pickle file")
-            with open(paths_fname, "wb") as w:
-                pickle.dump(paths_dict, w)
-            return paths_dict
+            ),
+            num_paths,
+            edge_disjoint,
+            dist_metric,
+        )
 
     def get_paths(self, problem):
         if not hasattr(self, "_paths_dict"):
@@ -309,34 +216,26 @@ class TopFormulation(AbstractFormulation):
 
     def _construct_lp(self, sat_flows=[]):
         edge_to_paths, num_paths = self.pre_solve()
-        return self._construct_path_lp(
-            self._problem.G, edge_to_paths, num_paths, sat_flows
-        )
+        return self._construct_path_lp(edge_to_paths, num_paths, sat_flows)
 
     @property
     def sol_dict(self):
         if not hasattr(self, "_sol_dict"):
-            sol_dict_def = defaultdict(list)
-            for var in self.model.getVars():
-                if var.varName.startswith("f[") and var.x != 0.0:
-                    match = re.match(r"f\[(\d+)\]", var.varName)
-                    p = int(match.group(1))
-                    sol_dict_def[self.commodity_list[self._path_to_commod[p]]] += [
-                        (edge, var.x) for edge in path_to_edge_list(self._all_paths[p])
-                    ]
-
-            # Set zero-flow commodities to be empty lists
-            self._sol_dict = {}
-            sol_dict_def = dict(sol_dict_def)
-            for commod_key in self.problem.commodity_list:
-                if commod_key in sol_dict_def:
-                    self._sol_dict[commod_key] = sol_dict_def[commod_key]
-                else:
-                    self._sol_dict[commod_key] = []
+            path_flows = self.path_flows
+            sol_dict_def = path_flows_to_sol_dict(
+                path_flows,
+                np.flatnonzero(path_flows != 0.0),
+                self._all_paths,
+                self._path_to_commod,
+                self.commodity_list,
+            )
+            self._sol_dict = self._create_sol_dict(
+                sol_dict_def, self.problem.commodity_list
+            )
 
             # Set rest of the demands
             if self._objective == Objective.TOTAL_FLOW:
-                self._total_objVal = self._solver.model.objVal
+                self._total_objVal = self._solver.obj_val
                 capacity_dict = {
                     (u, v): data['capacity'] for u, v, data
                     in self.problem.G.edges(data=True)}
@@ -386,19 +285,8 @@ class TopFormulation(AbstractFormulation):
 
         return self._sol_dict
 
-    @property
-    def sol_mat(self):
-        edge_idx = self.problem.edge_idx
-        sol_mat = np.zeros((len(edge_idx), len(self._path_to_commod)), dtype=np.float32)
-        for var in self.model.getVars():
-            if var.varName.startswith("f[") and var.x != 0.0:
-                match = re.match(r"f\[(\d+)\]", var.varName)
-                p = int(match.group(1))
-                k = self._path_to_commod[p]
-                for edge in path_to_edge_list(self._all_paths[p]):
-                    sol_mat[edge_idx[edge], k] += var.x
-
-        return sol_mat
+    path_flows = PathFormulation.path_flows
+    sol_mat = PathFormulation.sol_mat
 
     @classmethod
     # Return total number of fib entries and max for any node in topology
@@ -432,7 +320,7 @@ class TopFormulation(AbstractFormulation):
     @property
     def runtime(self):
         if not hasattr(self, "_runtime"):
-            self._runtime = self._solver.model.Runtime
+            self._runtime = self._solver.runtime
         return self._runtime
 
     @property
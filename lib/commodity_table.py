@@ -0,0 +1,72 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+# Structure-of-arrays table of the commodities of a traffic matrix: commodity
+# k goes from src[k] to dst[k] and has demand demand[k]. The commodities are the
+# off-diagonal entries of the traffic matrix (only the non-zero ones, unless
+# skip_zero is False) in row-major order, which is the order that
+# graph_utils.commodity_gen yields them in, so k is also the commodity's id in
+# Problem.commodity_list
+class CommodityTable(object):
+    def __init__(self, src, dst, demand):
+        self.src = src
+        self.dst = dst
+        self.demand = demand
+
+    # tm can be a dense array or a scipy.sparse one; a sparse tm is only
+    # densified if skip_zero is False, since then every off-diagonal entry is
+    # a commodity
+    @classmethod
+    def from_traffic_matrix(cls, tm, skip_zero=True):
+        if sp.issparse(tm):
+            if not skip_zero:
+                return cls.from_traffic_matrix(tm.toarray(), skip_zero=False)
+            coo = sp.coo_array(tm)
+            coo.sum_duplicates()
+            keep = (coo.data != 0) & (coo.row != coo.col)
+            src, dst, demand = coo.row[keep], coo.col[keep], coo.data[keep]
+            order = np.lexsort((dst, src))
+            return cls(
+                src[order].astype(np.intp), dst[order].astype(np.intp), demand[order]
+            )
+        if skip_zero:
+            mask = tm != 0
+        else:
+            mask = np.ones(tm.shape, dtype=bool)
+        # always skip diagonal values
+        np.fill_diagonal(mask, False)
+        src, dst = np.nonzero(mask)
+        return cls(src, dst, tm[src, dst])
+
+    def __len__(self):
+        return len(self.src)
+
+    @property
+    def ids(self):
+        return np.arange(len(self.src))
+
+    # (k, s_k, t_k, d_k) for every commodity
+    def rows(self):
+        return zip(
+            range(len(self.src)), self.src.tolist(), self.dst.tolist(), self.demand
+        )
+
+    # [(k, (s_k, t_k, d_k)), ...], the format of Problem.commodity_list
+    def as_list(self):
+        return [(k, (s_k, t_k, d_k)) for k, s_k, t_k, d_k in self.rows()]
+
+    # Id of the commodity from src[i] to dst[i], for every i, or -1 if there
+    # is no such commodity
+    def ids_of(self, src, dst):
+        src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+        num_nodes = 1 + max(
+            int(arr.max(initial=-1)) for arr in [self.src, self.dst, src, dst]
+        )
+        # commodities are in row-major order, so their keys are sorted
+        keys = self.src.astype(np.int64) * num_nodes + self.dst
+        query = src * num_nodes + dst
+        ids = np.searchsorted(keys, query)
+        found = ids < len(keys)
+        found[found] = keys[ids[found]] == query[found]
+        return np.where(found, ids, -1)
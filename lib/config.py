@@ -11,3 +11,6 @@ TEAVAR_RUNLOGS_DIR = os.path.join(TL_DIR, "ext", "teavar", "code", "runlogs")
 TEAVAR_BASELINE_RESULTS_DIR = os.path.join(
     TL_DIR, "ext", "teavar", "code", "teavar_star_plots", "data"
 )
+
+# LP solver used by the formulations that go through lib.lp_backend
+LP_BACKEND = os.environ.get("LP_BACKEND", "gurobi")
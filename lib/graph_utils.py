@@ -3,6 +3,8 @@ from itertools import tee
 from sys import maxsize
 from collections import defaultdict
 
+import numpy as np
+
 EPS = 1e-4
 
 
@@ -61,17 +63,17 @@ def compute_residual_problem(problem, sol_dict):
             new_d_k = 0.0
         tm[s_k, t_k] = new_d_k
 
-        for (u, v), l in flow_list:
-            problem.G[u][v]["capacity"] -= l
-            # same here; clamp capacity to 0.0
-            if problem.G[u][v]["capacity"] < 0.0:
-                problem.G[u][v]["capacity"] = 0.0
+    # same here; clamp capacity to 0.0
+    edge_flows = problem.topology.edge_flows(sol_dict.values())
+    problem.set_capacities(np.maximum(problem.capacities - edge_flows, 0.0))
 
     problem._invalidate_commodity_lists()
     return problem
 
 
-# subtract flows in sol_dict from edges in G
+# subtract flows in sol_dict from edges in G. For a problem's graph, use
+# compute_residual_problem instead, which also updates the problem's capacity
+# vector (or call problem._invalidate_capacities afterwards)
 def compute_residual_graph(G, sol_dict):
     for flow_list in sol_dict.values():
         for (u, v), l in flow_list:
@@ -288,6 +290,27 @@ def transform_for_network_simplex(problem, vis=False):
     return G
 
 
+# Asserts that the flows in flow_lists ([((u, v), l), ...] lists) leave at
+# least -eps capacity on every edge of problem. Returns the fraction of its
+# capacity that is left on every edge with non-zero capacity, as
+# [(u, v, fraction), ...] sorted from the least to the most remaining
+def check_capacities(problem, flow_lists, eps):
+    topology = problem.topology
+    capacities = problem.capacities
+    residual = capacities - topology.edge_flows(flow_lists)
+    assert np.all(residual > -eps)
+    edge_ids = np.flatnonzero(capacities != 0.0)
+    fractions = residual[edge_ids] / capacities[edge_ids]
+    order = np.argsort(fractions, kind="stable")
+    return list(
+        zip(
+            topology.src[edge_ids[order]].tolist(),
+            topology.dst[edge_ids[order]].tolist(),
+            fractions[order].tolist(),
+        )
+    )
+
+
 # Takes one or more sol_dicts for a given problem; determines if the solution
 # (i.e. all the sol_dicts) is feasible. If the solution is not feasible, an
 # exception will be thrown via a failed assertion.
@@ -299,7 +322,6 @@ def check_feasibility(problem, sol_dicts):
     total_flow = 0.0
     EPS = 1e-3
 
-    G_copy = problem.G.copy()
     print("checking flow conservation")
     for sol_dict in sol_dicts:
         for commod_key, flow_list in sol_dict.items():
@@ -310,21 +332,11 @@ def check_feasibility(problem, sol_dicts):
             except:
                 print("Flow for commodity {} is {}".format(commod_key, flow_for_commod))
             total_flow += flow_for_commod
-            for (u, v), flow_val in flow_list:
-                G_copy[u][v]["capacity"] -= flow_val
-                # if G_copy[u][v]['capacity'] < 0.0:
-                #     print(u, v, G_copy[u][v]['capacity'])
-                assert G_copy[u][v]["capacity"] > -EPS
     print("Total Flow: " + str(total_flow))
     print("checking capacity constraints")
-    edge_percent_cap_remaining = []
-    for u, v, cap in G_copy.edges.data("capacity"):
-        # if G_copy[u][v]['capacity'] < 0.0:
-        #     print(u, v, G_copy[u][v]['capacity'])
-        assert G_copy[u][v]["capacity"] > -EPS
-        if problem.G[u][v]["capacity"] == 0.0:
-            continue
-        edge_percent_cap_remaining.append((u, v, cap / problem.G[u][v]["capacity"]))
-
-    bottleneck_edges = sorted(edge_percent_cap_remaining, key=lambda x: x[-1])
+    bottleneck_edges = check_capacities(
+        problem,
+        [flow_list for sol_dict in sol_dicts for flow_list in sol_dict.values()],
+        EPS,
+    )
     print("Top 5 Bottleneck edges", bottleneck_edges[:5])
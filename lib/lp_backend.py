@@ -0,0 +1,655 @@
+import os
+import threading
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    import gurobipy as gp
+    from gurobipy import GurobiError
+except ImportError:
+    gp = None
+
+    class GurobiError(Exception):
+        pass
+
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+from .config import LP_BACKEND
+
+# Constraint senses and objective directions; the values match gurobipy's so
+# the Gurobi backend can pass them straight through
+LESS_EQUAL = "<"
+GREATER_EQUAL = ">"
+EQUAL = "="
+MINIMIZE = 1
+MAXIMIZE = -1
+INFINITY = float("inf")
+
+# Exceptions a backend may raise when the model has no solution to report
+SOLVER_ERRORS = (GurobiError, AttributeError)
+
+# Gurobi status code -> name, e.g. 2 -> "OPTIMAL"
+GUROBI_STATUSES = (
+    {
+        getattr(gp.GRB.Status, name): name
+        for name in dir(gp.GRB.Status)
+        if name.isupper()
+    }
+    if gp is not None
+    else {}
+)
+
+# Gurobi environments are not thread-safe, and a forked worker must not use
+# its parent's, so every (process, thread) pair gets its own, which all of its
+# models share
+_gurobi_envs = threading.local()
+
+
+def gurobi_env():
+    pid = os.getpid()
+    if getattr(_gurobi_envs, "pid", None) != pid:
+        _gurobi_envs.env = gp.Env()
+        _gurobi_envs.pid = pid
+    return _gurobi_envs.env
+
+
+# Matrix-level LP builder shared by all solvers. Variables and constraints are
+# referred to by their integer index, in the order they were added; every
+# method that adds variables or rows returns the indices it created.
+class LpBackend(object):
+    name = None
+
+    # Whether the solver this backend wraps is installed
+    @classmethod
+    def available(cls):
+        return True
+
+    def __init__(self, model_name=""):
+        self._model_name = model_name
+        self._num_vars = 0
+        self._num_constrs = 0
+        # when the model was created, emptied or last solved; the time from
+        # then until the next solve is reported as its build time
+        self.build_start = time.time()
+
+    @property
+    def model_name(self):
+        return self._model_name
+
+    @property
+    def num_vars(self):
+        return self._num_vars
+
+    @property
+    def num_constrs(self):
+        return self._num_constrs
+
+    def _new_ids(self, count, attr):
+        start = getattr(self, attr)
+        setattr(self, attr, start + count)
+        return np.arange(start, start + count)
+
+    # Remove every variable and constraint so the model can be refilled;
+    # solver parameters are kept
+    def clear(self, model_name=""):
+        raise NotImplementedError(
+            "clear needs to be implemented in the subclass: {}".format(self.__class__)
+        )
+
+    def add_vars(self, num_vars, lb=0.0, ub=INFINITY, name="x"):
+        raise NotImplementedError(
+            "add_vars needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    # Add one row per row of A: A @ x[var_ids] (sense) rhs
+    def add_constrs(self, A, var_ids, sense, rhs):
+        raise NotImplementedError(
+            "add_constrs needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    def set_objective(self, var_ids, coeffs, sense):
+        raise NotImplementedError(
+            "set_objective needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    def set_rhs(self, constr_ids, rhs):
+        raise NotImplementedError(
+            "set_rhs needs to be implemented in the subclass: {}".format(self.__class__)
+        )
+
+    # Set the coefficient of var_ids[i] in row constr_ids[i] to coeffs[i];
+    # var_ids and coeffs may also be scalars shared by every row
+    def set_coeffs(self, constr_ids, var_ids, coeffs):
+        raise NotImplementedError(
+            "set_coeffs needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    # Status of every variable and constraint in the last simplex basis, or
+    # None if the last solve did not produce one. Pass it to set_basis to
+    # warm-start the next solve after the model has been modified
+    def get_basis(self):
+        raise NotImplementedError(
+            "get_basis needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    def set_basis(self, basis):
+        raise NotImplementedError(
+            "set_basis needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    # Solve the model and return the objective value; raises one of
+    # SOLVER_ERRORS if no optimal solution was found
+    def solve(
+        self,
+        method,
+        num_threads=None,
+        bar_tol=None,
+        err_tol=None,
+        numeric_focus=False,
+        log_file="",
+    ):
+        raise NotImplementedError(
+            "solve needs to be implemented in the subclass: {}".format(self.__class__)
+        )
+
+    def primal_values(self, num_vars=None):
+        raise NotImplementedError(
+            "primal_values needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    def var_names(self):
+        raise NotImplementedError(
+            "var_names needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    # Solver-reported statistics about the last solve: a dict with keys
+    # status (str), method_used (Method value of the algorithm that produced
+    # the solution, or None), threads (0: left to the solver), nnz,
+    # presolve_rows_removed, presolve_cols_removed, simplex_iters and
+    # barrier_iters
+    def solve_stats(self):
+        raise NotImplementedError(
+            "solve_stats needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    @property
+    def obj_val(self):
+        raise NotImplementedError(
+            "@property obj_val needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    @property
+    def runtime(self):
+        raise NotImplementedError(
+            "@property runtime needs to be implemented in the subclass: {}".format(
+                self.__class__
+            )
+        )
+
+    def write(self, fname):
+        raise NotImplementedError(
+            "write needs to be implemented in the subclass: {}".format(self.__class__)
+        )
+
+
+class GurobiBackend(LpBackend):
+    name = "gurobi"
+
+    @classmethod
+    def available(cls):
+        return gp is not None
+
+    # If `model` is given, wrap an existing gurobipy Model (possibly built
+    # with the gurobipy API directly)
+    def __init__(self, model_name="", model=None):
+        if gp is None:
+            raise Exception("gurobipy is not installed; cannot use the Gurobi backend")
+        super().__init__(model_name)
+        if model is None:
+            self._model = gp.Model(model_name, env=gurobi_env())
+            self._vars, self._constrs = [], []
+        else:
+            self._model = model
+            self._model.update()
+            self._vars, self._constrs = model.getVars(), model.getConstrs()
+            self._num_vars, self._num_constrs = len(self._vars), len(self._constrs)
+
+    @property
+    def model(self):
+        return self._model
+
+    def clear(self, model_name=""):
+        self._model.remove(self._vars + self._constrs)
+        self._model.reset(1)
+        self._model.ModelName = model_name
+        self._model_name = model_name
+        self._vars, self._constrs = [], []
+        self._num_vars, self._num_constrs = 0, 0
+        self.build_start = time.time()
+
+    # Parameters persist across solves of a reused model, so every parameter
+    # solve touches is set explicitly (None restores the default), but only
+    # when it changes: setting LogFile, for one, reopens the log file
+    def _set_param(self, name, value):
+        _, _, current, _, _, default = self._model.getParamInfo(name)
+        if value is None:
+            value = default
+        if value != current:
+            self._model.setParam(name, value)
+
+    @staticmethod
+    def _bound(val):
+        if np.isscalar(val):
+            return min(max(val, -gp.GRB.INFINITY), gp.GRB.INFINITY)
+        return np.clip(val, -gp.GRB.INFINITY, gp.GRB.INFINITY)
+
+    def add_vars(self, num_vars, lb=0.0, ub=INFINITY, name="x"):
+        if num_vars == 0:
+            return self._new_ids(0, "_num_vars")
+        mvar = self._model.addMVar(
+            num_vars, lb=self._bound(lb), ub=self._bound(ub), name=name
+        )
+        self._vars.extend(mvar.tolist())
+        return self._new_ids(num_vars, "_num_vars")
+
+    def add_constrs(self, A, var_ids, sense, rhs):
+        A = sp.csr_matrix(A)
+        if A.shape[0] == 0:
+            return self._new_ids(0, "_num_constrs")
+        rhs = np.broadcast_to(np.asarray(rhs, dtype=np.float64), (A.shape[0],))
+        mconstr = self._model.addMConstr(
+            A, [self._vars[i] for i in var_ids], sense, rhs
+        )
+        self._constrs.extend(mconstr.tolist())
+        return self._new_ids(A.shape[0], "_num_constrs")
+
+    def set_objective(self, var_ids, coeffs, sense):
+        coeffs = np.broadcast_to(np.asarray(coeffs, dtype=np.float64), (len(var_ids),))
+        self._model.setObjective(
+            gp.LinExpr(coeffs.tolist(), [self._vars[i] for i in var_ids]), sense
+        )
+
+    def set_rhs(self, constr_ids, rhs):
+        self._model.setAttr(
+            "RHS",
+            [self._constrs[i] for i in constr_ids],
+            np.broadcast_to(rhs, (len(constr_ids),)).tolist(),
+        )
+
+    def set_coeffs(self, constr_ids, var_ids, coeffs):
+        num = len(constr_ids)
+        for i, j, val in zip(
+            np.asarray(constr_ids).tolist(),
+            np.broadcast_to(var_ids, (num,)).tolist(),
+            np.broadcast_to(np.asarray(coeffs, dtype=np.float64), (num,)).tolist(),
+        ):
+            self._model.chgCoeff(self._constrs[i], self._vars[j], val)
+
+    def get_basis(self):
+        try:
+            return (
+                self._model.getAttr("VBasis", self._vars),
+                self._model.getAttr("CBasis", self._constrs),
+            )
+        except GurobiError:
+            return None
+
+    def set_basis(self, basis):
+        vbasis, cbasis = basis
+        self._model.setAttr("VBasis", self._vars, vbasis)
+        self._model.setAttr("CBasis", self._constrs, cbasis)
+
+    def solve(
+        self,
+        method,
+        num_threads=None,
+        bar_tol=None,
+        err_tol=None,
+        numeric_focus=False,
+        log_file="",
+    ):
+        model = self._model
+        self._set_param("NumericFocus", 1 if numeric_focus else None)
+        self._set_param("Threads", int(num_threads) if num_threads else None)
+        self._set_param("Method", method.value)
+        self._set_param("LogFile", log_file)
+        self._set_param("BarConvTol", bar_tol or None)
+        self._set_param("OptimalityTol", err_tol or None)
+        self._set_param("FeasibilityTol", err_tol or None)
+        self._presolve_removed = (0, 0)
+        model.optimize(self._presolve_callback)
+        return model.objVal
+
+    def _presolve_callback(self, model, where):
+        if where == gp.GRB.Callback.PRESOLVE:
+            self._presolve_removed = (
+                model.cbGet(gp.GRB.Callback.PRE_ROWDEL),
+                model.cbGet(gp.GRB.Callback.PRE_COLDEL),
+            )
+
+    def primal_values(self, num_vars=None):
+        variables = self._model.getVars()
+        if num_vars is not None:
+            variables = variables[:num_vars]
+        return np.array(self._model.getAttr("X", variables), dtype=np.float64)
+
+    def var_names(self):
+        return self._model.getAttr("VarName", self._model.getVars())
+
+    def solve_stats(self):
+        model = self._model
+        method_used = model.Params.Method
+        # Concurrent methods: report the one that finished first
+        if method_used in (3, 4):
+            try:
+                method_used = model.ConcurrentWinMethod
+            except SOLVER_ERRORS:
+                method_used = -1
+        rows_removed, cols_removed = getattr(self, "_presolve_removed", (0, 0))
+        return {
+            "status": GUROBI_STATUSES.get(model.Status, str(model.Status)),
+            "method_used": method_used if method_used >= 0 else None,
+            "threads": model.Params.Threads,
+            "nnz": model.NumNZs,
+            "presolve_rows_removed": rows_removed,
+            "presolve_cols_removed": cols_removed,
+            "simplex_iters": int(model.IterCount),
+            "barrier_iters": model.BarIterCount,
+        }
+
+    @property
+    def obj_val(self):
+        return self._model.objVal
+
+    @property
+    def runtime(self):
+        return self._model.Runtime
+
+    def write(self, fname):
+        self._model.write(fname)
+
+
+class HighsBackend(LpBackend):
+    name = "highs"
+
+    # Method enum value -> (HiGHS solver, simplex strategy)
+    METHODS = {
+        0: ("simplex", 4),
+        1: ("simplex", 1),
+        2: ("ipm", None),
+        3: ("choose", None),
+        4: ("choose", None),
+    }
+    # HiGHS runs every model on one process-wide thread pool, which has to be
+    # reset before a model can ask for a different number of threads
+    _scheduler_threads = None
+
+    @classmethod
+    def available(cls):
+        return highspy is not None
+
+    def __init__(self, model_name=""):
+        if highspy is None:
+            raise Exception("highspy is not installed; cannot use the HiGHS backend")
+        super().__init__(model_name)
+        self._highs = highspy.Highs()
+        self._highs.setOptionValue("output_flag", False)
+        self._names, self._row_senses = [], []
+        self._runtime = 0.0
+
+    def clear(self, model_name=""):
+        self._highs.clearModel()
+        # Options set by the last solve (tolerances, log file, ...) go back
+        # to their defaults, as for a new model
+        self._highs.resetOptions()
+        self._highs.setOptionValue("output_flag", False)
+        self._model_name = model_name
+        self._names, self._row_senses = [], []
+        self._num_vars, self._num_constrs = 0, 0
+        self._runtime = 0.0
+        self.build_start = time.time()
+
+    @property
+    def model(self):
+        return self._highs
+
+    @staticmethod
+    def _bound(val, num):
+        val = np.broadcast_to(np.asarray(val, dtype=np.float64), (num,))
+        return np.clip(val, -highspy.kHighsInf, highspy.kHighsInf)
+
+    def add_vars(self, num_vars, lb=0.0, ub=INFINITY, name="x"):
+        if num_vars == 0:
+            return self._new_ids(0, "_num_vars")
+        self._highs.addCols(
+            num_vars,
+            np.zeros(num_vars),
+            self._bound(lb, num_vars),
+            self._bound(ub, num_vars),
+            0,
+            np.array([], dtype=np.int32),
+            np.array([], dtype=np.int32),
+            np.array([], dtype=np.float64),
+        )
+        self._names.extend("{}[{}]".format(name, i) for i in range(num_vars))
+        return self._new_ids(num_vars, "_num_vars")
+
+    def add_constrs(self, A, var_ids, sense, rhs):
+        A = sp.csr_matrix(A)
+        A.sum_duplicates()
+        num_rows = A.shape[0]
+        if num_rows == 0:
+            return self._new_ids(0, "_num_constrs")
+        rhs = self._bound(rhs, num_rows)
+        if sense == LESS_EQUAL:
+            lower, upper = np.full(num_rows, -highspy.kHighsInf), rhs
+        elif sense == GREATER_EQUAL:
+            lower, upper = rhs, np.full(num_rows, highspy.kHighsInf)
+        elif sense == EQUAL:
+            lower, upper = rhs, rhs
+        else:
+            raise Exception('"{}" not a valid constraint sense'.format(sense))
+        self._row_senses.extend([sense] * num_rows)
+        self._highs.addRows(
+            num_rows,
+            lower,
+            upper,
+            A.nnz,
+            A.indptr[:-1].astype(np.int32),
+            np.asarray(var_ids, dtype=np.int32)[A.indices],
+            A.data.astype(np.float64),
+        )
+        return self._new_ids(num_rows, "_num_constrs")
+
+    def set_objective(self, var_ids, coeffs, sense):
+        costs = np.zeros(self._num_vars)
+        np.add.at(costs, np.asarray(var_ids), coeffs)
+        self._highs.changeColsCost(
+            self._num_vars, np.arange(self._num_vars, dtype=np.int32), costs
+        )
+        self._highs.changeObjectiveSense(
+            highspy.ObjSense.kMaximize
+            if sense == MAXIMIZE
+            else highspy.ObjSense.kMinimize
+        )
+
+    def set_rhs(self, constr_ids, rhs):
+        constr_ids = np.asarray(constr_ids, dtype=np.int32)
+        rhs = self._bound(rhs, len(constr_ids))
+        senses = np.array(self._row_senses)[constr_ids]
+        lower = np.where(senses == LESS_EQUAL, -highspy.kHighsInf, rhs)
+        upper = np.where(senses == GREATER_EQUAL, highspy.kHighsInf, rhs)
+        self._highs.changeRowsBounds(len(constr_ids), constr_ids, lower, upper)
+
+    def set_coeffs(self, constr_ids, var_ids, coeffs):
+        num = len(constr_ids)
+        for i, j, val in zip(
+            np.asarray(constr_ids).tolist(),
+            np.broadcast_to(var_ids, (num,)).tolist(),
+            np.broadcast_to(np.asarray(coeffs, dtype=np.float64), (num,)).tolist(),
+        ):
+            self._highs.changeCoeff(i, j, val)
+
+    def get_basis(self):
+        basis = self._highs.getBasis()
+        if not basis.valid:
+            return None
+        return list(basis.col_status), list(basis.row_status)
+
+    def set_basis(self, basis):
+        col_status, row_status = basis
+        highs_basis = highspy.HighsBasis()
+        highs_basis.col_status = col_status
+        highs_basis.row_status = row_status
+        highs_basis.valid = True
+        self._highs.setBasis(highs_basis)
+
+    def solve(
+        self,
+        method,
+        num_threads=None,
+        bar_tol=None,
+        err_tol=None,
+        numeric_focus=False,
+        log_file="",
+    ):
+        highs = self._highs
+        solver, simplex_strategy = self.METHODS[method.value]
+        highs.setOptionValue("solver", solver)
+        if simplex_strategy is not None:
+            highs.setOptionValue("simplex_strategy", simplex_strategy)
+        if num_threads:
+            num_threads = int(num_threads)
+            if HighsBackend._scheduler_threads not in (None, num_threads):
+                highspy.Highs.resetGlobalScheduler(True)
+            HighsBackend._scheduler_threads = num_threads
+            highs.setOptionValue("threads", num_threads)
+        if log_file:
+            highs.setOptionValue("log_file", log_file)
+        if bar_tol:
+            highs.setOptionValue("ipm_optimality_tolerance", bar_tol)
+        if err_tol:
+            highs.setOptionValue("primal_feasibility_tolerance", err_tol)
+            highs.setOptionValue("dual_feasibility_tolerance", err_tol)
+        start = time.time()
+        highs.run()
+        self._runtime = time.time() - start
+        return self.obj_val
+
+    def primal_values(self, num_vars=None):
+        col_value = np.array(self._highs.getSolution().col_value, dtype=np.float64)
+        return col_value if num_vars is None else col_value[:num_vars]
+
+    def var_names(self):
+        return self._names
+
+    def solve_stats(self):
+        highs = self._highs
+        info = highs.getInfo()
+        solver = highs.getOptionValue("solver")[1]
+        if solver == "simplex":
+            method_used = 0 if highs.getOptionValue("simplex_strategy")[1] == 4 else 1
+        elif solver == "ipm" or info.ipm_iteration_count > 0:
+            method_used = 2
+        else:
+            # "choose" runs dual simplex on LPs unless it picks IPM
+            method_used = 1
+        rows_removed, cols_removed = 0, 0
+        if highs.getModelPresolveStatus() in (
+            highspy.HighsPresolveStatus.kReduced,
+            highspy.HighsPresolveStatus.kReducedToEmpty,
+        ):
+            presolved_lp = highs.getPresolvedLp()
+            rows_removed = self._num_constrs - presolved_lp.num_row_
+            cols_removed = self._num_vars - presolved_lp.num_col_
+        return {
+            "status": highs.modelStatusToString(highs.getModelStatus()),
+            "method_used": method_used,
+            "threads": highs.getOptionValue("threads")[1],
+            "nnz": highs.getNumNz(),
+            "presolve_rows_removed": rows_removed,
+            "presolve_cols_removed": cols_removed,
+            "simplex_iters": max(info.simplex_iteration_count, 0),
+            "barrier_iters": max(info.ipm_iteration_count, 0),
+        }
+
+    @property
+    def obj_val(self):
+        status = self._highs.getModelStatus()
+        if status != highspy.HighsModelStatus.kOptimal:
+            raise AttributeError(
+                "Unable to retrieve objective value; model status: {}".format(
+                    self._highs.modelStatusToString(status)
+                )
+            )
+        return self._highs.getInfo().objective_function_value
+
+    @property
+    def runtime(self):
+        return self._runtime
+
+    def write(self, fname):
+        self._highs.writeModel(fname)
+
+
+BACKENDS = {
+    GurobiBackend.name: GurobiBackend,
+    HighsBackend.name: HighsBackend,
+}
+
+
+# Create an empty model for the named backend (LP_BACKEND by default)
+def get_backend(name=None, model_name=""):
+    if name is None:
+        name = LP_BACKEND
+    if name not in BACKENDS:
+        raise Exception(
+            '"{}" not a valid LP backend; choose one of {}'.format(
+                name, list(BACKENDS.keys())
+            )
+        )
+    return BACKENDS[name](model_name)
+
+
+# Reusable models, one per template name. get(template) hands out the model
+# it returned for that template last time, emptied, instead of creating a new
+# one; so a model must no longer be needed by the time its template is asked
+# for again. Meant for long runs of small LPs, like NCFlow's R2 LP for every
+# meta-node, or the LP of every POP subproblem.
+class ModelPool(object):
+    def __init__(self, lp_backend=None):
+        self._lp_backend = lp_backend
+        self._models = {}
+
+    def get(self, template, model_name=""):
+        if template in self._models:
+            self._models[template].clear(model_name)
+        else:
+            self._models[template] = get_backend(self._lp_backend, model_name)
+        return self._models[template]
@@ -1,6 +1,8 @@
-from gurobipy import GurobiError
 from enum import Enum, unique
 import sys
+import time
+
+from .lp_backend import GurobiBackend, GurobiError, LpBackend
 
 
 @unique
@@ -12,13 +14,57 @@ class Method(Enum):
     PRIMAL_AND_DUAL = 4
 
 
+# Telemetry for one call to LpSolver.solve_lp. method is the Method that was
+# asked for, method_used the one that produced the solution (the winner, for
+# CONCURRENT). Times are in seconds: build_time is the time spent building or
+# updating the model before the solve, runtime the solver's own timer and
+# wall_time the whole call, including setting parameters.
+class SolveStats(object):
+    FIELDS = [
+        "model_name",
+        "status",
+        "method",
+        "method_used",
+        "threads",
+        "num_vars",
+        "num_constrs",
+        "nnz",
+        "presolve_rows_removed",
+        "presolve_cols_removed",
+        "simplex_iters",
+        "barrier_iters",
+        "build_time",
+        "runtime",
+        "wall_time",
+    ]
+
+    def __init__(self, **fields):
+        for field in SolveStats.FIELDS:
+            setattr(self, field, fields.get(field))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in SolveStats.FIELDS}
+
+    def __repr__(self):
+        return "SolveStats({})".format(
+            ", ".join(
+                "{}={}".format(field, getattr(self, field))
+                for field in SolveStats.FIELDS
+            )
+        )
+
+
 class LpSolver(object):
+    # `model` is either an LpBackend or a gurobipy Model built directly with
+    # the gurobipy API, which is wrapped in a GurobiBackend
     def __init__(
         self, model, debug_fn=None, DEBUG=False, VERBOSE=False, out=None, gurobi_out=""
     ):
         if out is None:
             out = sys.stdout
-        self._model = model
+        if not isinstance(model, LpBackend):
+            model = GurobiBackend(model=model)
+        self._backend = model
         self._debug_fn = debug_fn
         self.DEBUG = DEBUG
         self.VERBOSE = VERBOSE
@@ -49,51 +95,87 @@ class LpSolver(object):
         err_tol=None,
         numeric_focus=False,
     ):
-        model = self._model
-        if numeric_focus:
-            model.setParam("NumericFocus", 1)
-        if num_threads:
-            model.setParam("Threads", int(num_threads))
-        model.setParam("Method", method.value)
-        model.setParam("LogFile", self.gurobi_out)
+        backend = self._backend
+        start = time.time()
+        build_time = start - backend.build_start
         try:
-            if bar_tol:
-                model.Params.BarConvTol = bar_tol
-            if err_tol:
-                model.Params.OptimalityTol = err_tol
-                model.Params.FeasibilityTol = err_tol
-
             # if self.VERBOSE:
             self._print("\nSolving LP")
-            model.optimize()
+            try:
+                obj_val = backend.solve(
+                    method,
+                    num_threads=num_threads,
+                    bar_tol=bar_tol,
+                    err_tol=err_tol,
+                    numeric_focus=numeric_focus,
+                    log_file=self.gurobi_out,
+                )
+            finally:
+                self._record_stats(method, build_time, time.time() - start)
 
             if self.DEBUG or self.VERBOSE:
-                for var in model.getVars():
-                    if var.x != 0:
-                        if self.DEBUG and self._debug_fn:
-                            if not var.varName.startswith("f["):
-                                continue
-                            u, v, k, s_k, t_k, d_k = self._debug_fn(var)
-                            if self.VERBOSE:
-                                self._print(
-                                    "edge ({}, {}), demand ({}, ({}, {}, {})), flow: {}".format(
-                                        u, v, k, s_k, t_k, d_k, var.x
-                                    )
+                if self.DEBUG and self._debug_fn:
+                    # debug_fn expects gurobipy variables
+                    for var in backend.model.getVars():
+                        if var.x == 0 or not var.varName.startswith("f["):
+                            continue
+                        u, v, k, s_k, t_k, d_k = self._debug_fn(var)
+                        if self.VERBOSE:
+                            self._print(
+                                "edge ({}, {}), demand ({}, ({}, {}, {})), flow: {}".format(
+                                    u, v, k, s_k, t_k, d_k, var.x
                                 )
-                        elif self.VERBOSE:
-                            self._print("{} {}".format(var.varName, var.x))
-                self._print("Obj: %g" % model.objVal)
-            return model.objVal
+                            )
+                elif self.VERBOSE:
+                    for name, x in zip(backend.var_names(), backend.primal_values()):
+                        if x != 0:
+                            self._print("{} {}".format(name, x))
+                self._print("Obj: %g" % obj_val)
+            return obj_val
         except GurobiError as e:
             self._print("Error code " + str(e.errno) + ": " + str(e))
         except AttributeError as e:
             self._print(str(e))
             self._print("Encountered an attribute error")
 
+    def _record_stats(self, method, build_time, wall_time):
+        backend = self._backend
+        backend.build_start = time.time()
+        stats = backend.solve_stats()
+        if stats["method_used"] is not None:
+            stats["method_used"] = Method(stats["method_used"]).name
+        self._stats = SolveStats(
+            model_name=backend.model_name,
+            method=method.name,
+            num_vars=backend.num_vars,
+            num_constrs=backend.num_constrs,
+            build_time=build_time,
+            runtime=backend.runtime,
+            wall_time=wall_time,
+            **stats
+        )
+
+    def primal_values(self, num_vars=None):
+        return self._backend.primal_values(num_vars)
+
+    # SolveStats of the last call to solve_lp
+    @property
+    def stats(self):
+        return self._stats
+
+    @property
+    def backend(self):
+        return self._backend
+
+    # The solver's native model object (a gurobipy Model for the Gurobi backend)
     @property
     def model(self):
-        return self._model
+        return self._backend.model
 
     @property
     def obj_val(self):
-        return self._model.objVal
+        return self._backend.obj_val
+
+    @property
+    def runtime(self):
+        return self._backend.runtime
@@ -51,17 +51,16 @@ class AbstractPartitioningMethod(object):
     def _default_num_partitions(self, G):
         return int(np.sqrt(len(G.nodes)))
 
+    # Partitions are cached by the problem's fingerprint (its topology and
+    # capacities; see Problem.fingerprint), not its name
     def partition(self, problem, override_cache=False):
-        if (
-            not override_cache
-            and self._use_cache
-            and problem.name in self._best_partitions
-        ):
-            return self._best_partitions[problem.name]
+        key = problem.fingerprint()
+        if not override_cache and self._use_cache and key in self._best_partitions:
+            return self._best_partitions[key]
 
         self._partition_vector = self._partition_impl(problem)
-        self._best_partitions[problem.name] = self._partition_vector
-        return self._best_partitions[problem.name]
+        self._best_partitions[key] = self._partition_vector
+        return self._best_partitions[key]
 
     #################
     # Public method #
@@ -3,3 +3,4 @@ from .generic import GenericSplitter
 from .random import RandomSplitter
 from .smart import SmartSplitter
 from .random2 import RandomSplitter2
+from .precluster_cache import PreclusterCache
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class AbstractPOPSplitter(object):
     def __init__(self, num_subproblems):
         self._num_subproblems = num_subproblems
@@ -10,3 +13,48 @@ class AbstractPOPSplitter(object):
         raise NotImplementedError(
             "split needs to be implemented in the subclass: {}".format(self.__class__)
         )
+
+    # Copies of problem, one per subproblem, where subproblem i only has the
+    # demands demand[j] from src[j] to dst[j] for which assignment[j] == i
+    # (repeated pairs are summed) and every link has 1 / num_subproblems of
+    # its capacity. Dense traffic matrices are built together with a single
+    # scatter-add and each subproblem's is a view of its slice of the result;
+    # all subproblems share one read-only capacities vector
+    def _subproblems_from_assignment(self, problem, assignment, src, dst, demand):
+        num_subproblems = self._num_subproblems
+        assignment = np.asarray(assignment, dtype=np.intp)
+        src = np.asarray(src, dtype=np.intp)
+        dst = np.asarray(dst, dtype=np.intp)
+        demand = np.asarray(demand, dtype=np.float64)
+
+        sub_problems = [problem.copy() for _ in range(num_subproblems)]
+        traffic_matrix = problem.traffic_matrix
+        if traffic_matrix.is_sparse:
+            # group the demands by subproblem, keeping their order
+            order = np.argsort(assignment, kind="stable")
+            bounds = np.cumsum(np.bincount(assignment, minlength=num_subproblems))
+            for sub_problem, sp_order in zip(
+                sub_problems, np.split(order, bounds[:-1])
+            ):
+                sub_problem.traffic_matrix.set_demands(
+                    src[sp_order], dst[sp_order], demand[sp_order]
+                )
+        else:
+            num_nodes = traffic_matrix.tm_view.shape[0]
+            shape = (num_subproblems, num_nodes, num_nodes)
+            sub_tms = np.bincount(
+                np.ravel_multi_index((assignment, src, dst), shape),
+                weights=demand,
+                minlength=num_subproblems * num_nodes * num_nodes,
+            )
+            sub_tms = sub_tms.reshape(shape).astype(
+                traffic_matrix.tm_view.dtype, copy=False
+            )
+            for sub_problem, sub_tm in zip(sub_problems, sub_tms):
+                sub_problem.traffic_matrix.tm = sub_tm
+
+        sub_capacities = problem.capacities / num_subproblems
+        sub_capacities.setflags(write=False)
+        for sub_problem in sub_problems:
+            sub_problem.set_capacities(sub_capacities)
+        return sub_problems
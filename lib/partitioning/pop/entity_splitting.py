@@ -1,81 +1,82 @@
 import numpy as np
-import heapq
-import copy
 
 
-class MaxHeapObj(object):
-    def __init__(self, entity):
-        self.entity = entity
-
-    # reverse comparison of demands, since heapq implemented as minheap
-    def __lt__(self, other):
-        return self.entity[-1] > other.entity[-1]
-
-    def __eq__(self, other):
-        return self.entity == other
-
-    def __str__(self):
-        return str(self.entity)
-
-    def get_entity(self):
-        return self.entity
-
-    def split(self, factor):
-        self.entity[-1] = self.entity[-1] * factor
-
-
-def halve(entity_mho):
-    halved_entities_mho = [
-        MaxHeapObj(copy.deepcopy(entity_mho.get_entity())) for _ in range(2)
-    ]
-    for entity_mho in halved_entities_mho:
-        entity_mho.split(1 / 2.0)
-
-    return halved_entities_mho
-
-
-# Split the max entities in half (on last dimension)
-# until add_fraction new entities are formed.
-# Return a list of lists containing all splits of each entity
-def split_entities(entity_list, add_fraction):
+# Split the max entities in half (on demand), one at a time, until
+# add_fraction new entities are formed. demands holds the demand of every
+# entity. Return (entity_ids, split_demands): the demands of all splits,
+# grouped by entity (in entity order), and, for every split, the index of
+# the entity it is a split of
+def split_entities(demands, add_fraction):
 
     print("splitting for additional " + str(add_fraction) + " entities")
 
-    num_entities = len(entity_list)
-    num_new_entities = np.round(num_entities * add_fraction)
-
-    # use dict to keep track of all splits of each original entity
-    entity_splits_dict = {}
-    for entity in entity_list:
-        entity_splits_dict[tuple(entity[:-1])] = [entity]
-
-    # creat MaxHeapObject list of entities
-    entity_mho_list = [MaxHeapObj(entity) for entity in entity_list]
-
-    # create heap of maxHeapObjects (a maxheap)
-    heapq.heapify(entity_mho_list)
-
-    while len(entity_mho_list) < num_entities + num_new_entities:
-        largest_entity_mho = heapq.heappop(entity_mho_list)
-
-        # split largest entity
-        new_entities = halve(largest_entity_mho)
-
-        # add it to heap
-        for new_entity in new_entities:
-            heapq.heappush(entity_mho_list, new_entity)
-
-        # update splits dict
-        entity = largest_entity_mho.get_entity()
-        entity_splits_dict[tuple(entity[:-1])].remove(entity)
-        for new_entity in new_entities:
-            entity_splits_dict[tuple(entity[:-1])].append(new_entity.get_entity())
-
-    # new_entity_list = [entity_mho.get_entity() for entity_mho in entity_mho_list]
-
-    # group together all entities that share id
-    grouped_entity_list = [
-        entity_splits_dict[tuple(entity[:-1])] for entity in entity_list
-    ]
-
-    return grouped_entity_list
+    demands = np.asarray(demands, dtype=np.float64)
+    num_entities = len(demands)
+    num_new_entities = int(np.round(num_entities * add_fraction))
+
+    # an entity halved s = 2^m - 1 + r times (0 <= r < 2^m) has 2^m - r
+    # splits of demand d / 2^m followed by 2r splits of demand d / 2^(m + 1)
+    num_halvings = _num_halvings(demands, num_new_entities)
+    num_splits = num_halvings + 1
+    entity_ids = np.repeat(np.arange(num_entities), num_splits)
+    rank = np.arange(len(entity_ids)) - np.repeat(
+        np.cumsum(num_splits) - num_splits, num_splits
+    )
+    levels = np.floor(np.log2(num_splits)).astype(np.int64)
+    num_unsplit = 2 * 2**levels - num_splits
+    split_levels = levels[entity_ids] + (rank >= num_unsplit[entity_ids])
+    split_demands = np.ldexp(demands[entity_ids], -split_levels)
+
+    return entity_ids, split_demands
+
+
+# Number of times each entity is halved when the max entity is halved
+# num_new_entities times. The halvings are those of the num_new_entities
+# largest nodes of the entities' (infinite) binary trees of halves, so this
+# finds the demand t of the last one halved and halves every larger node;
+# nodes of demand t are halved in entity order. Demands are compared as
+# (exponent, mantissa) pairs, which halving keeps exact
+def _num_halvings(demands, num_new_entities):
+    num_halvings = np.zeros(len(demands), dtype=np.int64)
+    positive = demands > 0
+    if num_new_entities <= 0 or not np.any(positive):
+        return num_halvings
+
+    mantissas, exponents = np.frexp(demands[positive])
+    exponents = exponents.astype(np.int64)
+
+    # number of nodes of each tree with demand > t (or >= t, if or_equal)
+    # for t = t_mantissa * 2^t_exponent
+    def num_nodes(t_mantissa, t_exponent, or_equal):
+        larger = mantissas >= t_mantissa if or_equal else mantissas > t_mantissa
+        levels = np.maximum(exponents - t_exponent + larger, 0)
+        return 2**levels - 1
+
+    # t is one of the demands below, in increasing order; the largest entity
+    # alone has num_new_entities nodes of demand >= the lowest one
+    grid_mantissas = np.unique(mantissas)
+    min_exponent = exponents.max() - int(np.ceil(np.log2(num_new_entities + 1))) - 1
+
+    def grid_point(i):
+        return (
+            grid_mantissas[i % len(grid_mantissas)],
+            min_exponent + i // len(grid_mantissas),
+        )
+
+    # binary search for the largest t with num_new_entities nodes >= t
+    low = 0
+    high = (exponents.max() - min_exponent + 1) * len(grid_mantissas) - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if np.sum(num_nodes(*grid_point(mid), True)) >= num_new_entities:
+            low = mid
+        else:
+            high = mid - 1
+    t_mantissa, t_exponent = grid_point(low)
+
+    larger = num_nodes(t_mantissa, t_exponent, False)
+    equal = num_nodes(t_mantissa, t_exponent, True) - larger
+    num_left = num_new_entities - np.sum(larger)
+    halved_equal = np.clip(num_left - (np.cumsum(equal) - equal), 0, equal)
+    num_halvings[positive] = larger + halved_equal
+    return num_halvings
@@ -1,73 +1,66 @@
 from .abstract_pop_splitter import AbstractPOPSplitter
-from .utils import create_edges_onehot_dict, split_generic, compute_precluster
+from .precluster_cache import PreclusterCache
+from .utils import create_edges_onehot_features, split_generic
+from ...path_store import PathStore
 import math
 
 
 class GenericSplitter(AbstractPOPSplitter):
     # TODO: change this so that it no longer takes in a PathFormulation object as an argument
+    # precluster_cache: the PreclusterCache of the "cluster" method; by
+    # default, one that fits preclusters on num_workers processes. Pass the
+    # same cache to the splitters of successive problems to reuse their
+    # preclusters
     def __init__(
-        self, num_subproblems, pf, method="means", split_fraction=0.1, verbose=False
+        self,
+        num_subproblems,
+        pf,
+        method="means",
+        split_fraction=0.1,
+        verbose=False,
+        precluster_cache=None,
+        num_workers=None,
     ):
         super().__init__(num_subproblems)
         self._pf = pf
         self.verbose = verbose
         self.method = method
         self.split_fraction = split_fraction
+        if precluster_cache is None:
+            precluster_cache = PreclusterCache(num_workers=num_workers)
+        self._precluster_cache = precluster_cache
 
     def split(self, problem):
-        input_dict, np_data = create_edges_onehot_dict(
-            problem, self._pf, self._num_subproblems, self.split_fraction
-        )
-
-        # create subproblems, zero out commodities in traffic matrix that aren't assigned to each
-        sub_problems = [problem.copy() for _ in range(self._num_subproblems)]
         if self._num_subproblems == 1:
-            return sub_problems
+            return [problem.copy()]
 
-        # zero-out the traffic matrices; they will be populated later using entity_assignments_lists
-        for sp in sub_problems:
-            for u in sp.G.nodes:
-                for v in sp.G.nodes:
-                    sp.traffic_matrix.tm[u, v] = 0
+        paths = PathStore.from_paths(self._pf.get_paths(problem), problem.G)
+        src, dst, demand, features = create_edges_onehot_features(
+            problem, self._pf, self.split_fraction, paths=paths
+        )
 
         precluster = None
         categorical = None
         if self.method == "cluster":
             categorical = list(range(len(problem.G.edges)))
-            precluster = compute_precluster(
-                np_data,
+            precluster = self._precluster_cache.precluster(
+                problem,
+                paths,
+                features,
                 int(math.sqrt(len(problem.G.nodes))),
-                categorical_indices=categorical,
+                categorical=categorical,
             )
 
-        entity_assignments_lists = split_generic(
-            input_dict,
+        entity_assignments = split_generic(
+            features,
             self._num_subproblems,
             verbose=self.verbose,
             method=self.method,
             precluster=precluster,
-            np_data=np_data,
             categorical=categorical,
         )
 
-        if self.method == "cluster":
-            # replace commodity id index with commodity id (assuming ordereddict)
-            commodity_ids_list = list(input_dict.keys())
-            for i in range(len(entity_assignments_lists)):
-                entity_assignments_lists[i] = [
-                    commodity_ids_list[x] for x in entity_assignments_lists[i]
-                ]
-
-        for i in range(self._num_subproblems):
-
-            # populate TM for commodities assigned to subproblem i
-            for _, source, target, demand in entity_assignments_lists[i]:
-                sub_problems[i].traffic_matrix.tm[source, target] += demand
-
-            # split the capacity of each link
-            for u, v in sub_problems[i].G.edges:
-                sub_problems[i].G[u][v]["capacity"] = (
-                    sub_problems[i].G[u][v]["capacity"] / self._num_subproblems
-                )
-
-        return sub_problems
+        # the TM of subproblem i only has the commodities assigned to it
+        return self._subproblems_from_assignment(
+            problem, entity_assignments, src, dst, demand
+        )
@@ -0,0 +1,99 @@
+import os
+import pickle
+
+import scipy.sparse as sp
+
+from ...config import TOPOLOGIES_DIR
+from ...topology import array_fingerprint
+from .utils import compute_precluster, warm_start_centroids
+
+PRECLUSTERS_DIR = os.path.join(TOPOLOGIES_DIR, "preclusters")
+
+
+# Preclusters (see compute_precluster) of the features of a problem's entities
+# (see create_edges_onehot_features), kept in memory and saved to cache_dir.
+# The clusters mostly follow the topology and the paths, which do not change
+# from one traffic matrix to the next, so a precluster is keyed by their
+# fingerprints and the number of clusters (the categorical columns of the
+# features are those of the edges, so they are fixed by the topology too):
+#   - features the precluster was fitted on get it back as is
+#   - other features (e.g., new demands) refit it, starting from its
+#     centroids, for refit_max_iter iterations
+#   - with no precluster for the key, one is fitted from scratch, for
+#     max_iter iterations (by default, those of compute_precluster)
+# Preclusters are fitted on num_workers processes (see compute_precluster).
+class PreclusterCache(object):
+    def __init__(
+        self,
+        cache_dir=PRECLUSTERS_DIR,
+        num_workers=None,
+        max_iter=None,
+        refit_max_iter=2,
+    ):
+        self._cache_dir = cache_dir
+        self._num_workers = num_workers
+        self._max_iter = max_iter
+        self._refit_max_iter = refit_max_iter
+        # key: (precluster, fingerprint of the features it was fitted on), or
+        # None if there is none in memory or on disk
+        self._preclusters = {}
+
+    # paths: the paths of problem, as a PathStore (see PathStore.from_paths)
+    def precluster(self, problem, paths, features, num_clusters, categorical=None):
+        key = "{}-{}-{}-{}".format(
+            problem.topology.fingerprint,
+            paths.fingerprint,
+            num_clusters,
+            "kmeans" if categorical is None else "kprototypes",
+        )
+        features = sp.csr_array(features)
+        features_fingerprint = array_fingerprint(
+            features.data, features.indices, features.indptr
+        )
+
+        if key not in self._preclusters:
+            self._preclusters[key] = self._load(key)
+        cached = self._preclusters[key]
+        if cached is not None and cached[1] == features_fingerprint:
+            return cached[0]
+
+        if cached is None:
+            precluster = compute_precluster(
+                features,
+                num_clusters,
+                categorical_indices=categorical,
+                max_iter=self._max_iter,
+                num_workers=self._num_workers,
+            )
+        else:
+            precluster = compute_precluster(
+                features,
+                num_clusters,
+                categorical_indices=categorical,
+                init=warm_start_centroids(cached[0], features, categorical),
+                max_iter=self._refit_max_iter,
+                num_workers=self._num_workers,
+            )
+        self._preclusters[key] = (precluster, features_fingerprint)
+        self._save(key)
+        return precluster
+
+    def _fname(self, key):
+        return os.path.join(self._cache_dir, key + ".pkl")
+
+    def _load(self, key):
+        fname = self._fname(key)
+        if not os.path.exists(fname):
+            return None
+        with open(fname, "rb") as f:
+            return pickle.load(f)
+
+    # Write to a temporary file and rename it into place, so that a
+    # concurrent load never sees a partially written precluster
+    def _save(self, key):
+        fname = self._fname(key)
+        os.makedirs(self._cache_dir, exist_ok=True)
+        tmp_fname = "{}.tmp-{}".format(fname, os.getpid())
+        with open(tmp_fname, "wb") as f:
+            pickle.dump(self._preclusters[key], f)
+        os.replace(tmp_fname, fname)
@@ -10,37 +10,48 @@ class RandomSplitter(AbstractPOPSplitter):
         self.split_fraction = split_fraction
 
     def split(self, problem):
-        sub_problems = [problem.copy() for _ in range(self._num_subproblems)]
-        # zero-out the traffic matrices; they will be populated at random using commodity list
-        for sp in sub_problems:
-            for u in sp.G.nodes:
-                for v in sp.G.nodes:
-                    sp.traffic_matrix.tm[u, v] = 0
+        commodity_table = problem.commodity_table
+        entity_ids, split_demands = split_entities(
+            commodity_table.demand, self.split_fraction
+        )
 
-        entity_list = [[k, u, v, d] for (k, (u, v, d)) in problem.commodity_list]
+        # assign the splits of each entity by randomly sampling sps (without
+        # replacement, if possible) in rounds of up to num_subproblems splits,
+        # until all splits have been assigned
+        num_splits = np.bincount(entity_ids, minlength=len(commodity_table))
+        num_rounds = -(-num_splits // self._num_subproblems)
+        round_entity_ids = np.repeat(np.arange(len(num_splits)), num_rounds)
+        round_ranks = np.arange(len(round_entity_ids)) - np.repeat(
+            np.cumsum(num_rounds) - num_rounds, num_rounds
+        )
+        round_sizes = np.minimum(
+            num_splits[round_entity_ids] - round_ranks * self._num_subproblems,
+            self._num_subproblems,
+        )
 
-        split_entity_lists = split_entities(entity_list, self.split_fraction)
-        for split_list in split_entity_lists:
+        return self._subproblems_from_assignment(
+            problem,
+            _sample_without_replacement(round_sizes, self._num_subproblems),
+            commodity_table.src[entity_ids],
+            commodity_table.dst[entity_ids],
+            split_demands,
+        )
 
-            num_subentities = len(split_list)
-            assigned_sps_list = []
-            # create list of assigned sps by randomly sampling sps (without replacement, if possible)
-            # until all entities have been assigned
-            while len(assigned_sps_list) < num_subentities:
-                num_to_add = min(
-                    num_subentities - len(assigned_sps_list), self._num_subproblems
-                )
-                randperm = np.random.permutation(np.arange(self._num_subproblems))
-                assigned_sps_list += list(randperm[:num_to_add])
 
-            for ind, [_, source, target, demand] in enumerate(split_list):
-                sub_problems[assigned_sps_list[ind]].traffic_matrix.tm[
-                    source, target
-                ] += demand
+# round_sizes[i] distinct values in [0, n) sampled at random for every round
+# i, concatenated in round order. Rounds of more than one value sample from
+# random permutations of [0, n), chunk_size of them at a time
+def _sample_without_replacement(round_sizes, n, chunk_size=2**16):
+    samples = np.empty(np.sum(round_sizes), dtype=np.intp)
+    round_starts = np.cumsum(round_sizes) - round_sizes
+    single = round_sizes == 1
+    samples[round_starts[single]] = np.random.randint(n, size=np.count_nonzero(single))
 
-        for sub_problem in sub_problems:
-            for u, v in sub_problems[-1].G.edges:
-                sub_problem.G[u][v]["capacity"] = (
-                    sub_problem.G[u][v]["capacity"] / self._num_subproblems
-                )
-        return sub_problems
+    multiple = np.flatnonzero(round_sizes > 1)
+    for start in range(0, len(multiple), chunk_size):
+        rounds = multiple[start : start + chunk_size]
+        permutations = np.argsort(np.random.random((len(rounds), n)), axis=1)
+        positions = round_starts[rounds, None] + np.arange(n)
+        taken = np.arange(n) < round_sizes[rounds, None]
+        samples[positions[taken]] = permutations[taken]
+    return samples
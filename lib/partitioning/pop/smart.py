@@ -1,77 +1,67 @@
-from collections import defaultdict
 from .abstract_pop_splitter import AbstractPOPSplitter
-from ...graph_utils import path_to_edge_list
+from ...path_store import PathStore
 import numpy as np
 
 
 class SmartSplitter(AbstractPOPSplitter):
     # paths_dict: key: (source, target), value: array of paths,
-    #             where a path is a list of sequential nodes
-    #             use lib.graph_utils.path_to_edge_list to get edges.
+    #             where a path is a list of sequential nodes; either a
+    #             PathStore with edge ids (see
+    #             PathFormulation.read_paths_from_disk_or_compute) or a dict,
+    #             which is converted to one on the first split
     def __init__(self, num_subproblems, paths_dict):
         super().__init__(num_subproblems)
         self._paths_dict = paths_dict
 
     def split(self, problem):
-        com_list = problem.commodity_list
-
         max_demand = 100.0 / self._num_subproblems
+        paths = self._path_store(problem)
+        commodity_table = problem.commodity_table
 
-        # create dictionary of all edges used by each commodity
-        com_path_edges_dict = defaultdict(list)
-        for k, (source, target, demand) in com_list:
-
-            num_split_entity = 1
-            if demand > max_demand:
-                num_split_entity = min(
-                    self._num_subproblems, int(np.ceil(demand / max_demand))
-                )
-
-            paths_array = self._paths_dict[(source, target)]
-            for path in paths_array:
-                ptelp = list(path_to_edge_list(path))
-                for i in range(num_split_entity):
-                    com_path_edges_dict[
-                        (k + i * 0.001, source, target, demand / num_split_entity)
-                    ] += ptelp
-
-        # for each edge, split all commodities using that edge across subproblems
-        subproblem_com_indices = defaultdict(list)
-        current_subproblem = 0
-        for (u, v) in problem.G.edges:
-            coms_on_edge = [
-                x
-                for x in com_path_edges_dict.keys()
-                if (u, v) in com_path_edges_dict[x]
-            ]
-
-            # split commodities that share path across all subproblems
-            for (k, source, target, demand) in coms_on_edge:
-                subproblem_com_indices[current_subproblem] += [
-                    (k, source, target, demand)
-                ]
-                current_subproblem = (current_subproblem + 1) % self._num_subproblems
-                # remove commodity from cosideration when processing later edges
-                del com_path_edges_dict[(k, source, target, demand)]
-
-        # create subproblems, zero out commodities in traffic matrix that aren't assigned to each
-        sub_problems = []
-        for i in range(self._num_subproblems):
+        # split commodities with large demands into up to num_subproblems
+        # entities, each with an equal share of the demand and the paths of
+        # the commodity
+        num_split_entity = np.ones(len(commodity_table), dtype=np.int64)
+        large = commodity_table.demand > max_demand
+        num_split_entity[large] = np.minimum(
+            self._num_subproblems,
+            np.ceil(commodity_table.demand[large] / max_demand).astype(np.int64),
+        )
+        entity_commodities = np.repeat(commodity_table.ids, num_split_entity)
+        entity_demands = (commodity_table.demand / num_split_entity)[entity_commodities]
 
-            sub_problems.append(problem.copy())
-            # zero-out the traffic matrices; they will be populated later using entity_assignments_lists
-            for u in sub_problems[-1].G.nodes:
-                for v in sub_problems[-1].G.nodes:
-                    sub_problems[-1].traffic_matrix.tm[u, v] = 0
+        pairs = paths.pair_indices(commodity_table.src, commodity_table.dst)
+        if np.any(pairs < 0):
+            k = int(np.argmax(pairs < 0))
+            raise KeyError((int(commodity_table.src[k]), int(commodity_table.dst[k])))
 
-            # assigned commodity to subproblem i
-            for _, source, target, demand in subproblem_com_indices[i]:
-                sub_problems[-1].traffic_matrix.tm[source, target] += demand
+        # for each edge (in G.edges order), split all entities using that edge
+        # across subproblems, round-robin, and remove them from consideration
+        # when processing later edges. So an entity is assigned at the first
+        # edge of its paths, and the order of assignment is by that edge, then
+        # entity order; entities without any path are not assigned
+        edge_pairs = paths.edge_pair_incidence().tocoo()
+        first_edges = np.full(paths.num_pairs, edge_pairs.shape[0], dtype=np.int64)
+        np.minimum.at(first_edges, edge_pairs.col, edge_pairs.row)
+        entity_first_edges = first_edges[pairs][entity_commodities]
+        on_edge = entity_first_edges < edge_pairs.shape[0]
+        order = np.flatnonzero(on_edge)[
+            np.argsort(entity_first_edges[on_edge], kind="stable")
+        ]
 
-            # split the capacity of each link
-            for u, v in sub_problems[-1].G.edges:
-                sub_problems[-1].G[u][v]["capacity"] = (
-                    sub_problems[-1].G[u][v]["capacity"] / self._num_subproblems
-                )
+        # create subproblems; each traffic matrix only has the commodities
+        # assigned to its subproblem
+        return self._subproblems_from_assignment(
+            problem,
+            np.arange(len(order)) % self._num_subproblems,
+            commodity_table.src[entity_commodities[order]],
+            commodity_table.dst[entity_commodities[order]],
+            entity_demands[order],
+        )
 
-        return sub_problems
+    # Paths as a PathStore with edge ids, whose edge-pair incidence (see
+    # PathStore.edge_pair_incidence) indexes the commodities that use each
+    # edge; it is built once and reused by every split
+    def _path_store(self, problem):
+        self._paths_dict = PathStore.from_paths(self._paths_dict, problem.G)
+        return self._paths_dict
@@ -1,340 +1,352 @@
 import numpy as np
-import random
-import math
-from collections import defaultdict
-import copy
-from ...graph_utils import path_to_edge_list
+import scipy.sparse as sp
 from kmodes.kprototypes import KPrototypes
 from sklearn.cluster import KMeans
 from .entity_splitting import split_entities
+from ...constants import NUM_CORES
+from ...path_store import PathStore
+import os
 import time
 
 
-def create_edges_onehot_dict(problem, pf_original, num_subproblems, split_fraction=0.1):
-    paths_dict = pf_original.get_paths(problem)
-
-    entity_list = [[k, u, v, d] for (k, (u, v, d)) in problem.commodity_list]
-    split_entity_lists = split_entities(entity_list, split_fraction)
-
-    # compose single list from all split entity lists
-    split_entity_list = []
-    for split_entity in split_entity_lists:
-        split_entity_list += split_entity
-
-    num_entities = len(split_entity_list)
-    num_edges = len(problem.G.edges)
-    enum_edges_dict = {}
-    for i, edge in enumerate(problem.G.edges):
-        enum_edges_dict[edge] = i
-
-    # create dictionary of all edges used by each commodity
-    com_path_edges_dict = defaultdict(list)
-    min_demand = np.inf
-    max_demand = 0
-
-    for ind, [_, source, target, demand] in enumerate(split_entity_list):
-        paths_array = paths_dict[(source, target)]
+# Features of the (split) entities of problem: entity i goes from src[i] to
+# dst[i] with demand demand[i], and row i of the CSR feature matrix (one
+# column per edge, in G.edges order, and one for the demand) is one-hot on
+# the edges used by the paths of the entity, followed by its demand,
+# normalized to [0, 1]. Entities without paths are left out. paths, if given,
+# are those of pf_original for problem, as a PathStore (see
+# PathStore.from_paths).
+# Returns (src, dst, demand, features)
+def create_edges_onehot_features(problem, pf_original, split_fraction=0.1, paths=None):
+    if paths is None:
+        paths = PathStore.from_paths(pf_original.get_paths(problem), problem.G)
+
+    commodity_table = problem.commodity_table
+    entity_ids, split_demands = split_entities(commodity_table.demand, split_fraction)
+    src = commodity_table.src[entity_ids]
+    dst = commodity_table.dst[entity_ids]
+
+    pairs = paths.pair_indices(src, dst)
+    if np.any(pairs < 0):
+        i = int(np.argmax(pairs < 0))
+        raise KeyError((int(src[i]), int(dst[i])))
+    onehot_edges = sp.csr_array(paths.edge_pair_incidence().T)[pairs]
+
+    # add in normalized demand as a dimension
+    if len(split_demands) > 0 and split_demands.max() > split_demands.min():
+        norm_demands = (split_demands - split_demands.min()) / (
+            split_demands.max() - split_demands.min()
+        )
+    else:
+        norm_demands = np.zeros(len(split_demands))
+    features = sp.hstack(
+        [onehot_edges, sp.csr_array(norm_demands[:, None])], format="csr"
+    )
+    # KMeans only takes 32-bit indices
+    if max(features.shape[1], features.nnz) <= np.iinfo(np.int32).max:
+        features.indices = features.indices.astype(np.int32)
+        features.indptr = features.indptr.astype(np.int32)
+
+    has_paths = np.diff(onehot_edges.indptr) > 0
+    return (
+        src[has_paths],
+        dst[has_paths],
+        split_demands[has_paths],
+        features[has_paths],
+    )
 
-        if min_demand > demand:
-            min_demand = demand
-        if max_demand < demand:
-            max_demand = demand
 
-        # add an entry to the dict for each split, each of which has a fraction of demand
-        for path in paths_array:
-            com_path_edges_dict[(ind, source, target, demand)] += list(
-                path_to_edge_list(path)
-            )
-    com_path_edges_onehot_dict = defaultdict(list)
-    num_entities = len(com_path_edges_dict)
-    np_data = np.zeros((num_entities, num_edges + 1))
-    np_data_i = 0
-    for (k, source, target, demand), edge_list in com_path_edges_dict.items():
-        onehot_edge = [0] * num_edges
-        for edge in edge_list:
-            edge_i = enum_edges_dict[edge]
-            onehot_edge[edge_i] = 1
-            np_data[np_data_i, edge_i] = 1
-        # add in normalized demand as a dimension
-        norm_demand = (demand - min_demand) / (max_demand - min_demand)
-        com_path_edges_onehot_dict[(k, source, target, demand)] = onehot_edge + [
-            norm_demand
-        ]
-        np_data[np_data_i, -1] = norm_demand
-        np_data_i += 1
-
-    return com_path_edges_onehot_dict, np_data
-
-
-# subproblem_list: list of lists, one for each subproblem, containing assigned entities
-# input_set_dims: dictionary mapping entity to its dimensions
+# assignments: subproblem of every entity
+# features: feature matrix with a row for every entity
 # calculate mean value of every dimension of each subproblem and return
+def check_dims(assignments, features, k):
 
-
-def check_dims(subproblem_list, input_set_dims):
-
-    num_subproblems = len(subproblem_list)
-    num_dimensions = len(list(input_set_dims.values())[0])
+    num_dimensions = features.shape[1]
     print(
         "checking split of "
         + str(num_dimensions)
         + " dimensions over "
-        + str(num_subproblems)
+        + str(k)
         + " subproblems"
     )
 
-    subproblem_dim_sums = [np.zeros(num_dimensions) for _ in range(num_subproblems)]
-
-    for k in range(num_subproblems):
-        subproblem_entities = subproblem_list[k]
-
-        for entity in subproblem_entities:
-            entity_dims = input_set_dims[entity]
-            subproblem_dim_sums[k] = np.add(
-                np.asarray(entity_dims), subproblem_dim_sums[k]
-            )
-        subproblem_dim_sums[k] = subproblem_dim_sums[k] / len(subproblem_entities)
-        print("subproblem " + str(k) + ": " + str(subproblem_dim_sums[k]))
+    assignment_matrix = sp.csr_array(
+        (np.ones(len(assignments)), (assignments, np.arange(len(assignments)))),
+        shape=(k, len(assignments)),
+    )
+    subproblem_dim_sums = (assignment_matrix @ features).toarray()
+    subproblem_dim_sums /= np.bincount(assignments, minlength=k)[:, None]
+    for i in range(k):
+        print("subproblem " + str(i) + ": " + str(subproblem_dim_sums[i]))
     return subproblem_dim_sums
 
 
-def calc_cov_online(current_cov, current_means, num_entity, new_entity):
-    num_dims = len(current_means)
-    new_means = (current_means * num_entity + np.asarray(new_entity)) / (num_entity + 1)
-
-    resid_row_array = np.asarray(
-        [[d - new_means[i]] * num_dims for i, d in enumerate(new_entity)]
+# Change in distance (2-norm of the dimensional sums, relative to those of the
+# original distribution) of subproblems candidates[i] from the original
+# distribution when adding entity i to them (batch holds the entities' rows)
+def calc_dist_mean_change(batch, candidates, sums, origin_dist):
+    weights = np.zeros(len(origin_dist))
+    nonzero = origin_dist != 0
+    weights[nonzero] = 1.0 / np.square(origin_dist[nonzero])
+
+    residuals = sums - origin_dist
+    sq_sum_distance = np.square(residuals) @ weights
+    cross = batch @ (residuals * weights).T
+    entity_sq_sums = batch.multiply(batch) @ weights
+
+    rows = np.arange(candidates.shape[0])[:, None]
+    sq_sum_distance_new = (
+        sq_sum_distance[candidates]
+        + 2 * cross[rows, candidates]
+        + entity_sq_sums[:, None]
     )
-    resid_col_array = np.transpose(resid_row_array)
-
-    new_cov = current_cov * (num_entity - 1) + (num_entity / (num_entity - 1)) * (
-        np.multiply(resid_row_array, resid_col_array)
+    return np.sqrt(sq_sum_distance[candidates]) - np.sqrt(
+        np.maximum(sq_sum_distance_new, 0.0)
     )
-    new_cov = new_cov / num_entity
 
-    return new_cov
 
-
-# calculate the change in MSE between subproblem inputs and all inputs covariance
+# Change in MSE between the covariance of the original distribution and that
+# of subproblems candidates[i] when adding entity i to them. The covariance of
+# a subproblem with n entities is estimated, as an online update, from the new
+# entity's residual r from the subproblem's new mean: r r^T / (n - 1), or the
+# exact covariance of the two entities if n is 1 (and 0 if it is empty). With
+# covariance C of the features, the MSE change is
+# (2 r^T C r / (n - 1) - |r|^4 / (n - 1)^2) / num_dims^2. r is a x - b s for
+# the entity's row x and the subproblem's sums s, so the products of r are
+# expanded into those of x and s, which are computed once per batch, for all
+# entities, from the products with the features' Gram matrix G of the batch
+# (batch_gram) and of the sums (sums_gram), and the features' mean
+# (origin_means)
 def calc_dist_cov_change(
-    input_set_dims, new_entity, origin_dist_covs, num_entity_mean, current_covs
+    batch, batch_gram, candidates, sums, sums_gram, counts, origin_means, num
 ):
-    num_dims = len(new_entity)
-    # print("old covs: " + str(current_covs))
-    num_entity_in_sp = num_entity_mean[0]
-    new_covs = np.zeros((num_dims, num_dims))
-    if num_entity_in_sp > 0:
-
-        # calculate it from scratch for the first 50 elements
-        if num_entity_in_sp < 2:
-            input_set_dims_new = copy.deepcopy(input_set_dims)
-            for d in range(num_dims):
-                input_set_dims_new[d] += [new_entity[d]]
-            new_covs = np.cov(input_set_dims_new)
-        # use online update estimate
-        else:
-            new_covs = calc_cov_online(
-                current_covs, num_entity_mean[1], num_entity_mean[0], new_entity
-            )
-
-    old_mse = ((current_covs - origin_dist_covs) ** 2).mean(axis=None)
-    new_mse = ((new_covs - origin_dist_covs) ** 2).mean(axis=None)
-
-    dist_diff = old_mse - new_mse
-    return dist_diff, new_covs
-
-
-# Compute the change in distance (2-norm of dimensional means)
-# from the original problem inputs when adding new entity
-# TODO: better distance metric that considers covariance?
-def calc_dist_mean_change(input_set_dims, new_entity, origin_dist, num_entity_mean):
-    num_dims = len(new_entity)
-    num_entity = num_entity_mean[0]
-    current_means = num_entity_mean[1]
-
-    # new_means = (current_means*num_entity + np.asarray(new_entity))/(num_entity+1)
-    new_means = current_means + np.asarray(new_entity)
-
-    sq_sum_distance_new = np.sum(np.square((new_means - origin_dist) / origin_dist))
-    sq_sum_distance = np.sum(np.square((current_means - origin_dist) / origin_dist))
-
-    return math.sqrt(sq_sum_distance) - math.sqrt(sq_sum_distance_new)
-
-
-def two_choice(input_dict, k, verbose=False, method="means"):
-
-    num_inputs = len(input_dict)
-    num_dimensions = len(list(input_dict.values())[0])
-
-    # original_dist_dict: keys are dimension indices (0..d), values are frequency
-    original_dist_means_array = np.zeros(num_dimensions)
-    original_dist_inputs_by_dim = []
-    for d in range(num_dimensions):
-        inputs = [val[d] for val in input_dict.values()]
-        original_dist_inputs_by_dim.append(inputs)
-        sum_d = sum(inputs)
-        # original dist will reflect the sum of each dimension, divided by the number of subproblems
-        original_dist_means_array[d] = sum_d / k  # /(num_inputs*1.0)
-
-    original_dist_cov = np.cov(original_dist_inputs_by_dim)
-
-    # subproblem_dim_lists has k lists, one for each subproblem. Within each list are d lists,
-    # each containing the value of a dimension for each entity assigned to that subproblem
-    subproblem_dim_lists = [[[] for _ in range(num_dimensions)] for _ in range(k)]
-
-    # subproblem_entity_assignments is a list of lists
-    subproblem_entity_assignments = [[] for _ in range(k)]
-
-    # Assign each entity to the sub-problem that would have their distance from the
-    # original distribution shrink the most.
-    num_assigned = 0
-    subproblem_num_entity_means = [[0, np.zeros(num_dimensions)] for _ in range(k)]
-    subproblem_covs = [np.zeros((num_dimensions, num_dimensions)) for _ in range(k)]
-    sp_ids = [i for i in range(k)]
-    for entity, dims in input_dict.items():
-        if num_assigned % int(num_inputs / 4) == 0:
-            print("Assigned " + str(num_assigned) + " entities")
-        max_dist_change = -np.inf
-        max_dist_sp = 0
-        updated_cov = None
+    num_dims = len(origin_means)
+    s_gram_s = np.sum(sums * sums_gram, axis=1)
+    x_gram_x = np.asarray(batch.multiply(batch_gram).sum(axis=1)).ravel()
+    x_gram_s = batch @ sums_gram.T
+    x_x = np.asarray(batch.multiply(batch).sum(axis=1)).ravel()
+    x_s = batch @ sums.T
+    s_s = np.sum(np.square(sums), axis=1)
+    mean_x = batch @ origin_means
+    mean_s = sums @ origin_means
+
+    rows = np.arange(candidates.shape[0])
+    dist_change = np.zeros(candidates.shape)
+    for c in range(candidates.shape[1]):
+        sp_ids = candidates[:, c]
+        n = counts[sp_ids]
+        # r = (n x - s) / (n + 1) for n >= 2, x - s for n = 1
+        a = np.where(n >= 2, n / (n + 1.0), 1.0)
+        b = np.where(n >= 2, 1.0 / (n + 1.0), 1.0)
+        r_gram_r = (
+            a**2 * x_gram_x
+            - 2 * a * b * x_gram_s[rows, sp_ids]
+            + b**2 * s_gram_s[sp_ids]
+        )
+        mean_r = a * mean_x - b * mean_s[sp_ids]
+        r_cov_r = (r_gram_r - num * np.square(mean_r)) / max(num - 1, 1)
+        r_r = a**2 * x_x - 2 * a * b * x_s[rows, sp_ids] + b**2 * s_s[sp_ids]
+
+        scale = np.where(n >= 2, 1.0 / np.maximum(n - 1.0, 1.0), 0.5)
+        change = (2 * scale * r_cov_r - np.square(scale * r_r)) / num_dims**2
+        dist_change[:, c] = np.where(n > 0, change, 0.0)
+    return dist_change
+
+
+# Assign each entity to the better of 2 random subproblems: the one whose
+# distance from the original distribution shrinks the most ("means": of the
+# sums of every dimension; "covs": of the covariance). Subproblems with more
+# than their equal share of entities (plus 1%) are no longer chosen. The
+# entities are assigned in batches of batch_size (by default, in 256 batches);
+# the distances for a batch are evaluated together, from the subproblems
+# before the batch is assigned.
+# Returns the subproblem of every entity (row of features)
+def two_choice(features, k, verbose=False, method="means", batch_size=None):
+
+    features = sp.csr_array(features, dtype=np.float64)
+    num_inputs, num_dimensions = features.shape
+    if batch_size is None:
+        batch_size = max(-(-num_inputs // 256), 1)
+
+    # original dist will reflect the sum of each dimension, divided by the number of subproblems
+    original_dist_means_array = np.asarray(features.sum(axis=0)).ravel() / k
+    if method == "covs":
+        gram = (features.T @ features).tocsr()
+        # a Gram matrix this dense is faster to multiply as an array
+        if gram.nnz > num_dimensions**2 / 8:
+            gram = gram.toarray()
+        original_means = original_dist_means_array * k / max(num_inputs, 1)
+
+    subproblem_sums = np.zeros((k, num_dimensions))
+    # subproblem_sums @ gram, for "covs"
+    subproblem_sums_gram = np.zeros((k, num_dimensions))
+    subproblem_counts = np.zeros(k, dtype=np.int64)
+    max_entities_per_sp = num_inputs * 1.01 / k
+    open_sps = np.ones(k, dtype=bool)
+    assignments = np.empty(num_inputs, dtype=np.intp)
+    num_batches = -(-num_inputs // batch_size)
+    for start in range(0, num_inputs, batch_size):
+        if (start // batch_size) % max(num_batches // 4, 1) == 0:
+            print("Assigned " + str(start) + " entities")
+        batch = features[start : start + batch_size]
+        num_batch = batch.shape[0]
+        if method == "covs":
+            batch_gram = batch @ gram
 
         # choose 2 random subproblems to compare, as long as they aren't equal or full
-        num_sp_left = len(sp_ids)
-        if num_sp_left == 1:
-            max_dist_sp = sp_ids[0]
+        sp_ids = np.flatnonzero(open_sps)
+        if len(sp_ids) == 1:
+            choices = np.full(num_batch, sp_ids[0])
         else:
-            random_sp1_id = random.randint(0, num_sp_left - 1)
-            random_sp2_id = random.randint(0, num_sp_left - 1)
-            while random_sp1_id == random_sp2_id:
-                random_sp2_id = random.randint(0, num_sp_left - 1)
-            random_sp1 = sp_ids[random_sp1_id]
-            random_sp2 = sp_ids[random_sp2_id]
-
-            for sp_index in [random_sp1, random_sp2]:
-
-                # skip those that have more than equal share of currently assigned entities
-                # if len(subproblem_entity_assignments[sp_index]) > (num_inputs+1.02)/(k*1.0):
-                #    continue
-                dist_change = 0
-                if method == "means":
-                    dist_change = calc_dist_mean_change(
-                        subproblem_dim_lists[sp_index],
-                        dims,
-                        original_dist_means_array,
-                        subproblem_num_entity_means[sp_index],
-                    )
-                elif method == "covs":
-                    dist_change, new_cov = calc_dist_cov_change(
-                        subproblem_dim_lists[sp_index],
-                        dims,
-                        original_dist_cov,
-                        subproblem_num_entity_means[sp_index],
-                        subproblem_covs[sp_index],
-                    )
-                # print("subproblem " + str(i) + ", dist change: " + str(dist_change))
-                if dist_change >= max_dist_change:
-                    max_dist_change = dist_change
-                    max_dist_sp = sp_index
-                    if method == "covs":
-                        updated_cov = new_cov
-
-            if method == "cov":
-                subproblem_covs[max_dist_sp] = new_cov
-
-        subproblem_entity_assignments[max_dist_sp].append(entity)
-        if len(subproblem_entity_assignments[max_dist_sp]) > ((num_inputs) * 1.01) / (
-            k * 1.0
-        ):
-            sp_ids.remove(max_dist_sp)
-            # print("removed sp " + str(max_dist_sp))
-        # update means to reflect entity assignment
-        for d in range(num_dimensions):
-            subproblem_dim_lists[max_dist_sp][d].append(dims[d])
-
-        num_entity = subproblem_num_entity_means[max_dist_sp][0]
-        dim_means = subproblem_num_entity_means[max_dist_sp][1]
-        subproblem_num_entity_means[max_dist_sp][0] += 1
-        # subproblem_num_entity_means[max_dist_sp][1] = (dim_means*num_entity + np.asarray(dims))/(num_entity+1)
-        subproblem_num_entity_means[max_dist_sp][1] = dim_means + np.asarray(dims)
-
-        num_assigned += 1
+            first = np.random.randint(len(sp_ids), size=num_batch)
+            second = (first + np.random.randint(1, len(sp_ids), size=num_batch)) % len(
+                sp_ids
+            )
+            candidates = sp_ids[np.stack([first, second], axis=1)]
+            if method == "means":
+                dist_change = calc_dist_mean_change(
+                    batch, candidates, subproblem_sums, original_dist_means_array
+                )
+            elif method == "covs":
+                dist_change = calc_dist_cov_change(
+                    batch,
+                    batch_gram,
+                    candidates,
+                    subproblem_sums,
+                    subproblem_sums_gram,
+                    subproblem_counts,
+                    original_means,
+                    num_inputs,
+                )
+            # ties go to the second subproblem
+            choices = np.where(
+                dist_change[:, 0] > dist_change[:, 1],
+                candidates[:, 0],
+                candidates[:, 1],
+            )
+        assignments[start : start + num_batch] = choices
+
+        # update sums to reflect entity assignments
+        assignment_matrix = sp.csr_array(
+            (np.ones(num_batch), (choices, np.arange(num_batch))),
+            shape=(k, num_batch),
+        )
+        subproblem_sums += (assignment_matrix @ batch).toarray()
+        if method == "covs":
+            subproblem_sums_gram += _dense(assignment_matrix @ batch_gram)
+        subproblem_counts += np.bincount(choices, minlength=k)
+        open_sps &= subproblem_counts <= max_entities_per_sp
 
         if verbose:
-            print(subproblem_dim_lists)
-            print(subproblem_entity_assignments)
+            print(subproblem_counts)
+            print(subproblem_sums)
             print("\n")
-    return subproblem_entity_assignments
-
-
-# compute cluster using input data
-def compute_precluster(data, num_clusters, categorical_indices=None):
+    return assignments
+
+
+# compute cluster using input data; KPrototypes needs a dense array. The
+# clusters are initialized with k-means++ (KMeans) or Cao's method
+# (KPrototypes), unless init gives their initial centroids (see
+# warm_start_centroids). KPrototypes runs on num_workers processes (by
+# default, NUM_CORES or one per CPU, whichever is fewer)
+def compute_precluster(
+    data,
+    num_clusters,
+    categorical_indices=None,
+    init=None,
+    max_iter=None,
+    num_workers=None,
+):
     if categorical_indices is None:
-        kp = KMeans(n_clusters=num_clusters)
+        kwargs = {} if init is None else {"init": init, "n_init": 1}
+        if max_iter is not None:
+            kwargs["max_iter"] = max_iter
+        kp = KMeans(n_clusters=num_clusters, **kwargs)
         kp.fit(data)
     else:
+        if num_workers is None:
+            num_workers = min(NUM_CORES, os.cpu_count() or 1)
         kp = KPrototypes(
             n_clusters=num_clusters,
-            init="Cao",
+            init="Cao" if init is None else init,
             n_init=1,
             verbose=1,
-            n_jobs=24,
-            max_iter=5,
+            n_jobs=num_workers,
+            max_iter=5 if max_iter is None else max_iter,
         )
-        clusters = kp.fit(data, categorical=categorical_indices)
+        clusters = kp.fit(_dense(data), categorical=categorical_indices)
     return kp
 
 
+# Centroids of precluster (see compute_precluster), as the init of a
+# precluster of data with the same features, so that refitting it on new data
+# starts from the old clusters. KPrototypes takes them as [numerical,
+# categorical] arrays, with the categorical values encoded as it encodes
+# those of data: as the index of the value among the sorted unique values of
+# its column (values missing from the column are encoded as 0)
+def warm_start_centroids(precluster, data, categorical_indices=None):
+    if categorical_indices is None:
+        return precluster.cluster_centers_
+
+    # cluster_centroids_ has the numerical columns first
+    centroids = precluster.cluster_centroids_
+    num_numerical = data.shape[1] - len(categorical_indices)
+    data = sp.csc_array(data)
+    encoded = np.zeros((len(centroids), len(categorical_indices)), dtype=np.int64)
+    for j, col in enumerate(categorical_indices):
+        values = data.data[data.indptr[col] : data.indptr[col + 1]]
+        if len(values) < data.shape[0]:
+            values = np.append(values, 0.0)
+        values = np.unique(values)
+        centroid_values = centroids[:, num_numerical + j].astype(np.float64)
+        i = np.minimum(np.searchsorted(values, centroid_values), len(values) - 1)
+        encoded[:, j] = np.where(values[i] == centroid_values, i, 0)
+    return [centroids[:, :num_numerical].astype(np.float64), encoded]
+
+
 # cluster data according to provided precluster (or compute it on the fly)
 def cluster(data, k, precluster, categorical):
     # compute clusters, which is a list of cluster ids, one for each data item
 
     start_time = time.time()
-    clusters = precluster.predict(data, categorical)
+    if categorical is None:
+        clusters = precluster.predict(data)
+    else:
+        clusters = precluster.predict(_dense(data), categorical=categorical)
     print("--- %s seconds ---" % (time.time() - start_time))
-    # print(clusters)
 
-    # subproblem_entity_assignments is a list of lists
-    subproblem_entity_assignments = [[] for _ in range(k)]
+    # equally assign items in each cluster (in random order) across
+    # subproblems, round-robin
+    order = np.lexsort((np.random.random(len(clusters)), clusters))
+    assignments = np.empty(len(clusters), dtype=np.intp)
+    assignments[order] = np.arange(len(clusters)) % k
+    return assignments
 
-    num_clusters = precluster.n_clusters
-    cluster_lists = [[] for _ in range(num_clusters)]
-    for i, j in enumerate(clusters):
-        cluster_lists[j].append(i)
 
-    for cluster_list in cluster_lists:
-        np.random.shuffle(cluster_list)
-        # print(cluster_list)
-
-    # equally assign items in each cluster across subproblems
-    sp_roundrobin_id = 0
-    for cluster in cluster_lists:
-        for item in cluster:
-            subproblem_entity_assignments[sp_roundrobin_id].append(item)
-            sp_roundrobin_id = (sp_roundrobin_id + 1) % k
-
-    # print(subproblem_entity_assignments)
-    return subproblem_entity_assignments
-
-
-# input_dict: keys are entities and values are (ordered) list of entity dimensions,
+# features: feature matrix with a row for every entity (see
+# create_edges_onehot_features),
 # k: number of subproblems
+# Returns the subproblem of every entity
 def split_generic(
-    input_dict,
+    features,
     k,
     verbose=False,
     method="means",
     precluster=None,
-    np_data=None,
     categorical=None,
 ):
 
     if method == "cluster":
         subproblem_entity_assignments = cluster(
-            np_data, k, precluster=precluster, categorical=categorical
+            features, k, precluster=precluster, categorical=categorical
         )
     elif method == "means" or method == "covs":
         subproblem_entity_assignments = two_choice(
-            input_dict, k, verbose=verbose, method=method
+            features, k, verbose=verbose, method=method
         )
 
     return subproblem_entity_assignments
+
+
+def _dense(data):
+    return data.toarray() if sp.issparse(data) else data
@@ -0,0 +1,663 @@
+from collections import defaultdict
+from collections.abc import Mapping, Sequence
+import os
+import pickle
+import shutil
+import tempfile
+from glob import glob
+from sys import maxsize
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+from .path_utils import (
+    edge_weight,
+    find_paths_from_source,
+    graph_copy_with_edge_weights,
+    remove_cycles,
+)
+from .topology import array_fingerprint
+
+NODE_DTYPE = np.int32
+OFFSET_DTYPE = np.int64
+
+
+# Columnar, read-only store of the paths for every (s_k, t_k) pair of a
+# topology, with the same lookups as the {(s_k, t_k): [path, ...]} dicts
+# computed by compute_all_paths. All the paths' nodes are concatenated into one
+# flat int32 array:
+#   - the nodes of path p are nodes[path_offsets[p]:path_offsets[p + 1]]
+#   - pair i is (pair_src[i], pair_dst[i]), and its paths are
+#     pair_offsets[i] to pair_offsets[i + 1]
+#   - optionally, edge_ids holds the index (in G.edges order) of every edge of
+#     every path; path p has one fewer edge than nodes, so its edge ids start
+#     at path_offsets[p] - p
+#   - optionally, capacities holds the capacity (in G.edges order) of every
+#     edge of the graph the paths were computed on
+# Saved as a directory of .npy files, which are memory-mapped read-only on
+# load, so every process that loads the same store shares one copy of it.
+# Looking up a pair builds its lists of paths on demand.
+class PathStore(Mapping):
+    ARRAYS = ("pair_src", "pair_dst", "pair_offsets", "path_offsets", "nodes")
+    OPTIONAL_ARRAYS = ("edge_ids", "capacities")
+
+    def __init__(
+        self,
+        pair_src,
+        pair_dst,
+        pair_offsets,
+        path_offsets,
+        nodes,
+        edge_ids=None,
+        capacities=None,
+    ):
+        self.pair_src = pair_src
+        self.pair_dst = pair_dst
+        self.pair_offsets = pair_offsets
+        self.path_offsets = path_offsets
+        self.nodes = nodes
+        self.edge_ids = edge_ids
+        self.capacities = capacities
+        # Directory this store was loaded from, if any
+        self._store_dir = None
+
+    # Build a store from a {(s_k, t_k): [path, ...]} dict, keeping its key
+    # order. If G is given, also store the edge ids of every path and the
+    # capacities of G
+    @classmethod
+    def from_dict(cls, paths_dict, G=None):
+        num_pairs = len(paths_dict)
+        pair_src = np.empty(num_pairs, dtype=NODE_DTYPE)
+        pair_dst = np.empty(num_pairs, dtype=NODE_DTYPE)
+        pair_offsets = np.zeros(num_pairs + 1, dtype=OFFSET_DTYPE)
+        path_lens, all_nodes = [], []
+        for i, ((s_k, t_k), paths) in enumerate(paths_dict.items()):
+            pair_src[i], pair_dst[i] = s_k, t_k
+            pair_offsets[i + 1] = pair_offsets[i] + len(paths)
+            for path in paths:
+                path_lens.append(len(path))
+                all_nodes.extend(path)
+
+        path_offsets = np.zeros(len(path_lens) + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(path_lens, out=path_offsets[1:])
+        nodes = np.array(all_nodes)
+        if len(nodes) > 0 and (
+            nodes.dtype.kind not in "iu"
+            or nodes.min() < 0
+            or nodes.max() > np.iinfo(NODE_DTYPE).max
+        ):
+            raise Exception("path nodes must be non-negative int32 integers")
+        nodes = nodes.astype(NODE_DTYPE)
+
+        store = cls(pair_src, pair_dst, pair_offsets, path_offsets, nodes)
+        if G is not None:
+            store._set_graph(G)
+        return store
+
+    # Paths as a store with the edge ids of G: paths itself, if it is one that
+    # has them, or a store built from its {(s_k, t_k): [path, ...]} items
+    @classmethod
+    def from_paths(cls, paths, G):
+        if isinstance(paths, PathStore) and paths.edge_ids is not None:
+            return paths
+        return cls.from_dict(dict(paths), G)
+
+    # Memory-map the store saved in store_dir; pass mmap=False to read it into
+    # memory instead
+    @classmethod
+    def load(cls, store_dir, mmap=True):
+        mmap_mode = "r" if mmap else None
+
+        def load_array(name):
+            return np.load(os.path.join(store_dir, name + ".npy"), mmap_mode=mmap_mode)
+
+        store = cls(
+            *[load_array(name) for name in cls.ARRAYS],
+            **{
+                name: load_array(name)
+                for name in cls.OPTIONAL_ARRAYS
+                if os.path.exists(os.path.join(store_dir, name + ".npy"))
+            }
+        )
+        store._store_dir = store_dir
+        return store
+
+    # Write the arrays to a temporary directory and rename it into place, so
+    # that a concurrent load never sees a partially written store. A saved
+    # store is never replaced: if store_dir already exists (another process
+    # saved the same store first), it is kept and this one is dropped
+    def save(self, store_dir):
+        parent_dir = os.path.dirname(store_dir) or "."
+        os.makedirs(parent_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(
+            prefix=os.path.basename(store_dir) + ".tmp-", dir=parent_dir
+        )
+        for name in self.ARRAYS + self.OPTIONAL_ARRAYS:
+            arr = getattr(self, name)
+            if arr is not None:
+                np.save(os.path.join(tmp_dir, name + ".npy"), np.ascontiguousarray(arr))
+        try:
+            os.rename(tmp_dir, store_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir)
+
+    # Pickling a store that was loaded from disk only pickles its location, so
+    # that worker processes memory-map the same files instead of copying them
+    def __reduce__(self):
+        if self._store_dir is not None:
+            return (PathStore.load, (self._store_dir,))
+        return (
+            PathStore,
+            tuple(getattr(self, name) for name in self.ARRAYS + self.OPTIONAL_ARRAYS),
+        )
+
+    @property
+    def num_pairs(self):
+        return len(self.pair_src)
+
+    @property
+    def num_paths(self):
+        return len(self.path_offsets) - 1
+
+    # Content fingerprint of the paths (their pairs and nodes), computed on
+    # first use; see array_fingerprint
+    @property
+    def fingerprint(self):
+        if not hasattr(self, "_fingerprint"):
+            self._fingerprint = array_fingerprint(
+                *[getattr(self, name) for name in self.ARRAYS]
+            )
+        return self._fingerprint
+
+    # Index of (s_k, t_k) in pair_src/pair_dst, or -1 if the store does not
+    # have that pair. Scalar lookups go through a {(s_k, t_k): index} dict,
+    # built on first use; use pair_indices to look up many pairs at once
+    def pair_index(self, s_k, t_k):
+        if not hasattr(self, "_pair_index_dict"):
+            self._pair_index_dict = {
+                pair: i
+                for i, pair in enumerate(
+                    zip(self.pair_src.tolist(), self.pair_dst.tolist())
+                )
+            }
+        return self._pair_index_dict.get((s_k, t_k), -1)
+
+    # pair_index of (src[i], dst[i]), for every i
+    def pair_indices(self, src, dst):
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        if self.num_pairs == 0:
+            return np.full(len(src), -1, dtype=np.int64)
+        if not hasattr(self, "_sorted_pair_keys"):
+            num_nodes = int(max(self.pair_src.max(), self.pair_dst.max())) + 1
+            keys = self.pair_src.astype(np.int64) * num_nodes + self.pair_dst
+            self._num_key_nodes = num_nodes
+            self._sorted_pair_order = np.argsort(keys, kind="stable")
+            self._sorted_pair_keys = keys[self._sorted_pair_order]
+        in_range = (
+            (0 <= src)
+            & (src < self._num_key_nodes)
+            & (0 <= dst)
+            & (dst < self._num_key_nodes)
+        )
+        keys = np.where(in_range, src * self._num_key_nodes + dst, -1)
+        i = np.minimum(
+            np.searchsorted(self._sorted_pair_keys, keys),
+            len(self._sorted_pair_keys) - 1,
+        )
+        found = in_range & (self._sorted_pair_keys[i] == keys)
+        return np.where(found, self._sorted_pair_order[i], -1)
+
+    # Global ids [start, stop) of the paths of (s_k, t_k)
+    def path_range(self, s_k, t_k):
+        i = self.pair_index(s_k, t_k)
+        if i < 0:
+            raise KeyError((s_k, t_k))
+        return int(self.pair_offsets[i]), int(self.pair_offsets[i + 1])
+
+    def path(self, p):
+        return self.nodes[self.path_offsets[p] : self.path_offsets[p + 1]].tolist()
+
+    # Indices (in G.edges order) of the edges of path p
+    def path_edge_ids(self, p):
+        if self.edge_ids is None:
+            raise Exception("this path store has no edge ids")
+        return self.edge_ids[
+            self.path_offsets[p] - p : self.path_offsets[p + 1] - p - 1
+        ]
+
+    # Edge-path incidence of the paths path_ids: (num_edges x len(path_ids))
+    # CSR matrix, where entry (e, i) is 1.0 if path path_ids[i] traverses the
+    # edge with id e (or the number of times it does)
+    def path_edge_incidence(self, path_ids):
+        if self.edge_ids is None:
+            raise Exception("this path store has no edge ids")
+        path_ids = np.asarray(path_ids, dtype=np.int64)
+        starts = self.path_offsets[path_ids] - path_ids
+        num_edges = self.path_offsets[path_ids + 1] - self.path_offsets[path_ids] - 1
+        indptr = np.zeros(len(path_ids) + 1, dtype=np.int64)
+        np.cumsum(num_edges, out=indptr[1:])
+        edge_pos = np.repeat(starts - indptr[:-1], num_edges) + np.arange(indptr[-1])
+        incidence = sp.csc_matrix(
+            (
+                np.ones(indptr[-1]),
+                self.edge_ids[edge_pos].astype(np.int64),
+                indptr,
+            ),
+            shape=(len(self.capacities), len(path_ids)),
+        )
+        incidence.sum_duplicates()
+        return incidence.tocsr()
+
+    def __getitem__(self, key):
+        start, stop = self.path_range(*key)
+        return [self.path(p) for p in range(start, stop)]
+
+    def __contains__(self, key):
+        try:
+            return self.pair_index(*key) >= 0
+        except (TypeError, ValueError):
+            return False
+
+    def __iter__(self):
+        return zip(self.pair_src.tolist(), self.pair_dst.tolist())
+
+    def __len__(self):
+        return self.num_pairs
+
+    # Store with the paths of the pairs in new_paths ({(s_k, t_k): [path, ...]})
+    # replaced, and every other pair's paths copied over
+    def with_paths(self, new_paths):
+        updates = sorted(
+            (self.path_range(*pair)[0], self.pair_index(*pair), paths)
+            for pair, paths in new_paths.items()
+        )
+        path_lens = np.diff(self.path_offsets)
+        num_pair_paths = np.diff(self.pair_offsets)
+        node_chunks, len_chunks = [], []
+        next_path = 0
+        for start, i, paths in updates + [(self.num_paths, None, None)]:
+            node_chunks.append(
+                self.nodes[self.path_offsets[next_path] : self.path_offsets[start]]
+            )
+            len_chunks.append(path_lens[next_path:start])
+            if i is None:
+                break
+            node_chunks.append(
+                np.array([node for path in paths for node in path], dtype=NODE_DTYPE)
+            )
+            len_chunks.append(
+                np.array([len(path) for path in paths], dtype=OFFSET_DTYPE)
+            )
+            next_path = start + num_pair_paths[i]
+            num_pair_paths[i] = len(paths)
+
+        path_lens = np.concatenate(len_chunks)
+        path_offsets = np.zeros(len(path_lens) + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(path_lens, out=path_offsets[1:])
+        pair_offsets = np.zeros(self.num_pairs + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(num_pair_paths, out=pair_offsets[1:])
+        return PathStore(
+            np.array(self.pair_src),
+            np.array(self.pair_dst),
+            pair_offsets,
+            path_offsets,
+            np.concatenate(node_chunks).astype(NODE_DTYPE),
+        )
+
+    # (u, v) of every edge of every path, as u * num_nodes + v, and the path
+    # each edge belongs to
+    def path_edge_keys(self, num_nodes):
+        # consecutive nodes within a path
+        not_last = np.ones(len(self.nodes), dtype=bool)
+        not_last[self.path_offsets[1:] - 1] = False
+        heads = self.nodes[:-1][not_last[:-1]].astype(np.int64)
+        tails = self.nodes[1:][not_last[:-1]].astype(np.int64)
+        path_ids = np.repeat(np.arange(self.num_paths), np.diff(self.path_offsets) - 1)
+        return heads * num_nodes + tails, path_ids
+
+    # Edge-pair incidence: (num_edges x num_pairs) CSR matrix, where entry
+    # (e, i) is 1.0 if a path of pair i traverses the edge with id e; row e
+    # indexes the pairs that use edge e. Built once per store
+    def edge_pair_incidence(self):
+        if self.edge_ids is None:
+            raise Exception("this path store has no edge ids")
+        if not hasattr(self, "_edge_pair_incidence"):
+            path_pairs = np.repeat(
+                np.arange(self.num_pairs), np.diff(self.pair_offsets)
+            )
+            edge_pairs = np.repeat(path_pairs, np.diff(self.path_offsets) - 1)
+            incidence = sp.csr_array(
+                (
+                    np.ones(len(edge_pairs)),
+                    (self.edge_ids.astype(np.int64), edge_pairs),
+                ),
+                shape=(len(self.capacities), self.num_pairs),
+            )
+            incidence.sum_duplicates()
+            incidence.data[:] = 1.0
+            self._edge_pair_incidence = incidence
+        return self._edge_pair_incidence
+
+    # Store the edge ids of every path and the capacities of G
+    def _set_graph(self, G):
+        num_nodes = max(G.nodes) + 1
+        edge_key_to_id = {u * num_nodes + v: e for e, (u, v) in enumerate(G.edges)}
+        edge_keys, _ = self.path_edge_keys(num_nodes)
+        try:
+            self.edge_ids = np.array(
+                [edge_key_to_id[key] for key in edge_keys.tolist()], dtype=NODE_DTYPE
+            )
+        except KeyError:
+            raise Exception("paths traverse an edge that is not in G")
+        self.capacities = np.array(
+            [c_e for _, _, c_e in G.edges.data("capacity")], dtype=np.float64
+        )
+
+
+# Read-only list of the paths path_ids (global ids) of store, whose node lists
+# are only built when they are accessed
+class PathList(Sequence):
+    def __init__(self, store, path_ids):
+        self._store = store
+        self._path_ids = path_ids
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return PathList(self._store, self._path_ids[i])
+        return self._store.path(self._path_ids[i])
+
+    def __len__(self):
+        return len(self._path_ids)
+
+
+# Pairs of store whose paths could change when the capacities of some edges of
+# G change, given {(u, v): previous capacity} for those edges (a failed edge
+# has capacity 0). Only edges whose weight under dist_metric changes matter. A pair is affected if
+#   - one of its paths traverses a changed edge, or
+#   - it has num_paths paths (so others may have been cut off) and the weight
+#     of an edge (u, v) dropped so that a path through it, which is at least as
+#     long as dist(s_k, u) + w(u, v) + dist(v, t_k), may now be shorter than
+#     its longest path
+# If a pair has fewer than num_paths paths, it has all of its candidate paths
+# (simple paths for k-shortest paths, or the paths of the max-flow for
+# edge-disjoint paths, which do not depend on the weights), so lowering the
+# weight of an edge that none of them use cannot add one.
+def affected_pairs(store, G, old_capacities, num_paths, dist_metric):
+    if len(old_capacities) == 0:
+        return []
+    G_weighted = graph_copy_with_edge_weights(G, dist_metric)
+    changed_keys, dropped_edges = [], []
+    num_nodes = max(max(G.nodes), max(u for edge in old_capacities for u in edge)) + 1
+    if store.num_paths > 0:
+        num_nodes = max(num_nodes, int(store.nodes.max()) + 1)
+    for (u, v), old_cap in old_capacities.items():
+        old_weight = edge_weight(old_cap, dist_metric)
+        new_weight = G_weighted[u][v]["weight"]
+        if new_weight == old_weight:
+            continue
+        changed_keys.append(u * num_nodes + v)
+        if new_weight < old_weight:
+            dropped_edges.append((u, v, new_weight))
+    if len(changed_keys) == 0:
+        return []
+
+    edge_keys, edge_path_ids = store.path_edge_keys(num_nodes)
+    path_pair_ids = np.repeat(np.arange(store.num_pairs), np.diff(store.pair_offsets))
+    is_affected = np.zeros(store.num_pairs, dtype=bool)
+    is_affected[path_pair_ids[edge_path_ids[np.isin(edge_keys, changed_keys)]]] = True
+
+    full_pairs = np.flatnonzero(np.diff(store.pair_offsets) == num_paths)
+    if len(dropped_edges) > 0 and len(full_pairs) > 0:
+        # Length of every path, and of the longest path of every full pair
+        G_keys = np.array([u * num_nodes + v for u, v in G.edges], dtype=np.int64)
+        G_weights = np.array([w for _, _, w in G_weighted.edges.data("weight")])
+        order = np.argsort(G_keys)
+        G_keys, G_weights = G_keys[order], G_weights[order]
+        edge_pos = np.minimum(np.searchsorted(G_keys, edge_keys), len(G_keys) - 1)
+        edge_weights = np.where(
+            G_keys[edge_pos] == edge_keys, G_weights[edge_pos], np.inf
+        )
+        path_lens = np.bincount(
+            edge_path_ids, weights=edge_weights, minlength=store.num_paths
+        )
+        longest = path_lens[
+            store.pair_offsets[full_pairs][:, None] + np.arange(num_paths)
+        ].max(axis=1)
+        srcs = store.pair_src[full_pairs]
+        dsts = store.pair_dst[full_pairs]
+
+        G_reverse = G_weighted.reverse(copy=False)
+        for u, v, weight in dropped_edges:
+            to_u = np.full(num_nodes, np.inf)
+            for node, dist in nx.single_source_dijkstra_path_length(
+                G_reverse, u
+            ).items():
+                to_u[node] = dist
+            from_v = np.full(num_nodes, np.inf)
+            for node, dist in nx.single_source_dijkstra_path_length(
+                G_weighted, v
+            ).items():
+                from_v[node] = dist
+            lower_bound = to_u[srcs] + weight + from_v[dsts]
+            is_affected[full_pairs[lower_bound <= longest * (1 + 1e-9)]] = True
+
+    return [
+        (s_k, t_k)
+        for s_k, t_k in zip(
+            store.pair_src[is_affected].tolist(), store.pair_dst[is_affected].tolist()
+        )
+    ]
+
+
+# Incrementally update store after the capacities of some edges of G changed
+# (failed edges have capacity 0), given {(u, v): previous capacity} for those edges:
+# only the paths of the pairs returned by affected_pairs are recomputed, from
+# one search per source. Returns the updated store, with the edge ids and
+# capacities of G, and the recomputed pairs. Pairs that are no longer
+# connected get no paths
+def update_path_store(store, G, old_capacities, num_paths, edge_disjoint, dist_metric):
+    pairs = affected_pairs(store, G, old_capacities, num_paths, dist_metric)
+    G_weighted = graph_copy_with_edge_weights(G, dist_metric)
+    targets_by_src = defaultdict(list)
+    for s_k, t_k in pairs:
+        targets_by_src[s_k].append(t_k)
+
+    new_paths = {}
+    for s_k, targets in targets_by_src.items():
+        paths_from_s_k = find_paths_from_source(
+            G_weighted, s_k, targets, num_paths, edge_disjoint, skip_no_path=True
+        )
+        for t_k in targets:
+            new_paths[(s_k, t_k)] = paths_from_s_k.get(t_k, [])
+
+    new_store = store.with_paths(new_paths)
+    new_store._set_graph(G)
+    return new_store, pairs
+
+
+# One-shot conversion of a pickled {(s_k, t_k): [path, ...]} dict to a
+# PathStore saved in store_dir (by default, next to the pickle, with
+# "-dict.pkl" replaced by "-store"). Cycles are removed from the paths once,
+# here, instead of on every load. If G is given, the edge ids and capacities
+# are stored too
+def convert_paths_pickle(pkl_fname, store_dir=None, G=None):
+    if store_dir is None:
+        store_dir = path_store_dir(pkl_fname)
+    with open(pkl_fname, "rb") as f:
+        paths_dict = pickle.load(f)
+    for key, paths in paths_dict.items():
+        paths_dict[key] = [remove_cycles(path) for path in paths]
+    PathStore.from_dict(paths_dict, G).save(store_dir)
+    return store_dir
+
+
+# Directory of the PathStore that replaces the pickled paths in pkl_fname
+def path_store_dir(pkl_fname):
+    base = pkl_fname[: -len(".pkl")] if pkl_fname.endswith(".pkl") else pkl_fname
+    if base.endswith("-dict"):
+        base = base[: -len("-dict")]
+    return base + "-store"
+
+
+# Weight of every edge of a graph with the given capacities under dist_metric
+# (see edge_weight)
+def edge_weights(capacities, dist_metric):
+    capacities = np.asarray(capacities, dtype=np.float64)
+    if dist_metric == "inv-cap":
+        with np.errstate(divide="ignore"):
+            return np.where(capacities > 0.0, 1.0 / capacities, float(maxsize))
+    elif dist_metric == "min-hop":
+        return np.where(capacities > 0.0, 1.0, float(maxsize))
+    else:
+        raise Exception("invalid dist_metric: {}".format(dist_metric))
+
+
+# Edge weights (see edge_weights) up to a common factor, which does not change
+# any path: normalized by the smallest one (those of edges without capacity,
+# which do not scale, are left as is), with their mantissas rounded to 12
+# digits
+def _normalized_edge_weights(capacities, dist_metric):
+    weights = edge_weights(capacities, dist_metric)
+    scaled = weights < maxsize
+    if np.any(scaled):
+        weights[scaled] /= weights[scaled].min()
+    mantissas, exponents = np.frexp(weights)
+    return np.ldexp(np.round(mantissas, 12), exponents)
+
+
+# Fingerprint of the edge weights of G (in G.edges order) under dist_metric, up
+# to a common factor (see _normalized_edge_weights); besides the topology, the
+# paths only depend on them. So, e.g., POP's subproblems, which have
+# 1 / num_subproblems of every capacity, have the same fingerprint as the full
+# problem
+def edge_weights_fingerprint(G, dist_metric):
+    return array_fingerprint(
+        _normalized_edge_weights(_graph_capacities(G), dist_metric)
+    )
+
+
+# {(u, v): capacity in store} for the edges of G whose weight differs from
+# that in store, up to a common factor (see _normalized_edge_weights). The
+# capacities of store are scaled like those of G (for inv-cap, to the same
+# largest capacity), so that update_path_store compares weights of the same
+# scale
+def _changed_capacities(store, G, dist_metric):
+    capacities = _graph_capacities(G)
+    old_capacities = np.asarray(store.capacities, dtype=np.float64)
+    changed = np.flatnonzero(
+        _normalized_edge_weights(old_capacities, dist_metric)
+        != _normalized_edge_weights(capacities, dist_metric)
+    )
+    if (
+        dist_metric == "inv-cap"
+        and np.any(old_capacities > 0.0)
+        and np.any(capacities > 0.0)
+    ):
+        old_capacities = old_capacities * (capacities.max() / old_capacities.max())
+    edges = list(G.edges)
+    return {edges[e]: old_capacities[e] for e in changed.tolist()}
+
+
+def _graph_capacities(G):
+    return np.array([c_e for _, _, c_e in G.edges.data("capacity")], dtype=np.float64)
+
+
+# File name of the pickled paths (see path_store_dir for that of their store)
+# of the topology with the given fingerprint and the edge weights of G
+def paths_fname(
+    paths_dir, topology_fingerprint, G, num_paths, edge_disjoint, dist_metric
+):
+    return os.path.join(
+        paths_dir,
+        "{}-{}-paths_edge-disjoint-{}_dist-metric-{}_weights-{}-dict.pkl".format(
+            topology_fingerprint,
+            num_paths,
+            edge_disjoint,
+            dist_metric,
+            edge_weights_fingerprint(G, dist_metric),
+        ),
+    )
+
+
+# The saved store of the same topology and path settings as store_dir (see
+# paths_fname), for other edge weights, whose weights differ from those of G
+# on the fewest edges, or None if there is none; as (store,
+# _changed_capacities of the store)
+def _closest_path_store(store_dir, G, dist_metric):
+    prefix, sep, _ = store_dir.rpartition("_weights-")
+    if sep == "":
+        return None
+    closest = None
+    for other_dir in sorted(glob(prefix + sep + "*-store")):
+        other = PathStore.load(other_dir)
+        if other.capacities is None or len(other.capacities) != len(G.edges):
+            continue
+        old_capacities = _changed_capacities(other, G, dist_metric)
+        if closest is None or len(old_capacities) < len(closest[1]):
+            closest = (other, old_capacities)
+    return closest
+
+
+# Load the PathStore for pkl_fname (see paths_fname), converting the pickle if
+# there is no store yet. If there is neither, the store is derived from that
+# of the same topology for the closest edge weights (see _closest_path_store),
+# by recomputing the paths that could have changed with update_path_store, or
+# else computed from scratch (with compute_paths()). Every store is saved once
+# and never rewritten, so problems with other capacities never change the
+# paths of one another. The returned store is memory-mapped, unless its edge
+# weights differ from those of G (which only happens if pkl_fname does not
+# depend on them): then the paths that could have changed are recomputed in
+# memory, and not saved
+def read_path_store_or_compute(
+    pkl_fname, G, compute_paths, num_paths, edge_disjoint, dist_metric
+):
+    store_dir = path_store_dir(pkl_fname)
+    if os.path.isdir(store_dir):
+        print("Loading paths from path store", store_dir)
+    elif os.path.exists(pkl_fname):
+        print("Converting pickled paths in {} to a path store".format(pkl_fname))
+        convert_paths_pickle(pkl_fname, store_dir, G)
+    else:
+        print("Unable to find {}".format(store_dir))
+        closest = _closest_path_store(store_dir, G, dist_metric)
+        if closest is not None:
+            store, old_capacities = closest
+            print("Updating the paths of path store", store._store_dir)
+            store, pairs = update_path_store(
+                store, G, old_capacities, num_paths, edge_disjoint, dist_metric
+            )
+            print(
+                "Weights of {} edges changed; recomputed paths of {} pairs".format(
+                    len(old_capacities), len(pairs)
+                )
+            )
+        else:
+            store = PathStore.from_dict(compute_paths(), G)
+        print("Saving paths to path store")
+        store.save(store_dir)
+    paths_dict = PathStore.load(store_dir)
+
+    if paths_dict.capacities is not None:
+        if len(G.edges) != len(paths_dict.capacities):
+            print("Topology changed since the paths were computed; recomputing")
+            paths_dict = PathStore.from_dict(compute_paths(), G)
+        else:
+            old_capacities = _changed_capacities(paths_dict, G, dist_metric)
+            if len(old_capacities) > 0:
+                paths_dict, pairs = update_path_store(
+                    paths_dict,
+                    G,
+                    old_capacities,
+                    num_paths,
+                    edge_disjoint,
+                    dist_metric,
+                )
+                print(
+                    "Weights of {} edges changed; recomputed paths of {} pairs".format(
+                        len(old_capacities), len(pairs)
+                    )
+                )
+    print("paths_dict size:", len(paths_dict))
+    return paths_dict
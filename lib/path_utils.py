@@ -1,6 +1,15 @@
+from .constants import NUM_CORES
 from .graph_utils import path_to_edge_list
-from itertools import islice
+from collections import defaultdict
+from collections.abc import Mapping
+from itertools import chain, islice
+import multiprocessing
 import networkx as nx
+from networkx.algorithms.connectivity import build_auxiliary_edge_connectivity
+from networkx.algorithms.flow import build_residual_network
+import numpy as np
+import os
+import scipy.sparse as sp
 from sys import maxsize
 
 
@@ -20,26 +29,29 @@ def remove_cycles(path):
     return stack
 
 
-def graph_copy_with_edge_weights(_G, dist_metric):
-    G = _G.copy()
-
+# Weight of an edge with capacity cap under dist_metric
+def edge_weight(cap, dist_metric):
     if dist_metric == "inv-cap":
-        for u, v, cap in G.edges.data("capacity"):
-            if cap < 0.0:
-                cap = 0.0
-            try:
-                G[u][v]["weight"] = 1.0 / cap
-            except ZeroDivisionError:
-                G[u][v]["weight"] = maxsize
+        if cap < 0.0:
+            cap = 0.0
+        try:
+            return 1.0 / cap
+        except ZeroDivisionError:
+            return maxsize
     elif dist_metric == "min-hop":
-        for u, v, cap in G.edges.data("capacity"):
-            if cap <= 0.0:
-                G[u][v]["weight"] = maxsize
-            else:
-                G[u][v]["weight"] = 1.0
+        if cap <= 0.0:
+            return maxsize
+        else:
+            return 1.0
     else:
         raise Exception("invalid dist_metric: {}".format(dist_metric))
 
+
+def graph_copy_with_edge_weights(_G, dist_metric):
+    G = _G.copy()
+    for u, v, cap in G.edges.data("capacity"):
+        G[u][v]["weight"] = edge_weight(cap, dist_metric)
+
     return G
 
 
@@ -88,3 +100,238 @@ def find_paths(G, s_k, t_k, num_paths, disjoint=True, include_weight=False):
             ]
         else:
             return k_shortest_paths(G, s_k, t_k, num_paths, weight="weight")
+
+
+# Batched find_paths: {t_k: find_paths(G, s_k, t_k, ...)} for every t_k in
+# targets, with identical paths, but sharing the work that does not depend on
+# the target. For edge-disjoint paths, that is the auxiliary digraph and
+# residual network of the max-flow, which find_paths rebuilds for every pair.
+# Yen's algorithm (disjoint=False) runs a bidirectional Dijkstra per target
+# whose tie-breaking a shared shortest-path tree would not reproduce, so there
+# only reachability is shared: unreachable targets get [] without a search.
+# Targets with no edge-disjoint path raise NetworkXNoPath, as in find_paths,
+# or are left out if skip_no_path is True.
+def find_paths_from_source(
+    G, s_k, targets, num_paths, disjoint=True, skip_no_path=False
+):
+    paths_dict = {}
+    if disjoint:
+
+        def compute_distance(path):
+            return sum(G[u][v]["weight"] for u, v in path_to_edge_list(path))
+
+        auxiliary = build_auxiliary_edge_connectivity(G)
+        residual = build_residual_network(auxiliary, "capacity")
+        for t_k in targets:
+            try:
+                paths = sorted(
+                    nx.edge_disjoint_paths(
+                        G, s_k, t_k, auxiliary=auxiliary, residual=residual
+                    ),
+                    key=compute_distance,
+                )
+            except nx.NetworkXNoPath:
+                if skip_no_path:
+                    continue
+                raise
+            paths_dict[t_k] = [remove_cycles(path) for path in paths[:num_paths]]
+    else:
+        reachable = nx.descendants(G, s_k)
+        for t_k in targets:
+            paths_dict[t_k] = (
+                find_paths(G, s_k, t_k, num_paths, disjoint=False)
+                if t_k in reachable
+                else []
+            )
+    return paths_dict
+
+
+# Cycle-free paths from s_k to every other node of the weighted graph G
+def paths_from_source(G, s_k, num_paths, edge_disjoint):
+    targets = [t_k for t_k in G.nodes if t_k != s_k]
+    paths_dict = find_paths_from_source(G, s_k, targets, num_paths, edge_disjoint)
+    return [[remove_cycles(path) for path in paths_dict[t_k]] for t_k in targets]
+
+
+# Weighted graph of a compute_all_paths worker, built once per process
+_worker_G = None
+
+
+def _init_path_worker(G, dist_metric):
+    global _worker_G
+    _worker_G = graph_copy_with_edge_weights(G, dist_metric)
+
+
+def _worker_paths_from_source(args):
+    return paths_from_source(_worker_G, *args)
+
+
+# Paths for every (s_k, t_k) pair of G, as {(s_k, t_k): [path, ...]}. Source
+# nodes are spread over a pool of num_workers processes (by default, NUM_CORES
+# or one per CPU, whichever is fewer), each with its own weighted copy of G;
+# progress is printed as sources finish.
+def compute_all_paths(G, num_paths, edge_disjoint, dist_metric, num_workers=None):
+    nodes = list(G.nodes)
+    if num_workers is None:
+        num_workers = min(NUM_CORES, os.cpu_count() or 1)
+    num_workers = max(min(num_workers, len(nodes)), 1)
+    tasks = [(s_k, num_paths, edge_disjoint) for s_k in nodes]
+    report_every = max(len(nodes) // 10, 1)
+
+    def log_progress(num_done):
+        if num_done % report_every == 0 or num_done == len(nodes):
+            print("Computed paths from {}/{} sources".format(num_done, len(nodes)))
+
+    paths_per_source = []
+    if num_workers == 1:
+        G_weighted = graph_copy_with_edge_weights(G, dist_metric)
+        for task in tasks:
+            paths_per_source.append(paths_from_source(G_weighted, *task))
+            log_progress(len(paths_per_source))
+    else:
+        with multiprocessing.Pool(
+            num_workers, initializer=_init_path_worker, initargs=(G, dist_metric)
+        ) as pool:
+            for paths in pool.imap(
+                _worker_paths_from_source,
+                tasks,
+                chunksize=max(len(tasks) // (4 * num_workers), 1),
+            ):
+                paths_per_source.append(paths)
+                log_progress(len(paths_per_source))
+
+    paths_dict = {}
+    for s_k, paths in zip(nodes, paths_per_source):
+        targets = (t_k for t_k in nodes if t_k != s_k)
+        for t_k, paths_no_cycles in zip(targets, paths):
+            paths_dict[(s_k, t_k)] = paths_no_cycles
+    return paths_dict
+
+
+# Build a CSR 0/1 matrix with one row per list in `rows`; row i has a 1.0 in
+# every column listed in rows[i]
+def incidence_from_lists(rows, num_cols):
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=indptr[1:])
+    indices = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=indptr[-1])
+    mat = sp.csr_matrix(
+        (np.ones(len(indices)), indices, indptr), shape=(len(rows), num_cols)
+    )
+    mat.sum_duplicates()
+    return mat
+
+
+# Path-edge incidence: (len(edges) x num_paths) CSR matrix, where entry (e, p)
+# is 1.0 if path p traverses edges[e]. edge_to_paths is the
+# {edge: [path ids]} dict returned by PathFormulation.pre_solve
+def path_edge_incidence(edges, edge_to_paths, num_paths):
+    return incidence_from_lists(
+        [edge_to_paths.get(edge, []) for edge in edges], num_paths
+    )
+
+
+# {edge: [path ids]} view of incidence, the (num_edges x num_paths) path-edge
+# incidence matrix of all the edges (edges_list, in edge id order, and
+# edge_idx, {edge: edge id}), without the edges that no path traverses. This
+# is the edge_to_paths that PathFormulation.pre_solve returns when its paths
+# are in a PathStore
+class IncidenceEdgeToPaths(Mapping):
+    def __init__(self, incidence, edges_list, edge_idx):
+        self.incidence = sp.csr_matrix(incidence)
+        # ids of the edges that some path traverses
+        self.edge_ids = np.flatnonzero(np.diff(self.incidence.indptr) > 0)
+        self._edges_list = edges_list
+        self._edge_idx = edge_idx
+
+    def __getitem__(self, edge):
+        e = self._edge_idx.get(edge)
+        indptr = self.incidence.indptr
+        if e is None or indptr[e] == indptr[e + 1]:
+            raise KeyError(edge)
+        return self.incidence.indices[indptr[e] : indptr[e + 1]].tolist()
+
+    def __iter__(self):
+        return (self._edges_list[e] for e in self.edge_ids.tolist())
+
+    def __len__(self):
+        return len(self.edge_ids)
+
+
+# Capacities and path-edge incidence for the edges of G that are used by at
+# least one path, in G.edges order
+def edge_capacities_and_incidence(G, edge_to_paths, num_paths):
+    edges, caps = [], []
+    for u, v, c_e in G.edges.data("capacity"):
+        if (u, v) in edge_to_paths:
+            edges.append((u, v))
+            caps.append(c_e)
+    return (
+        np.array(caps, dtype=np.float64),
+        path_edge_incidence(edges, edge_to_paths, num_paths),
+    )
+
+
+# Same as edge_capacities_and_incidence, for the edges of problem, read from
+# its topology and capacity vector instead of its graph (see Problem.copy).
+# Also returns the edge ids of those edges
+def problem_edge_capacities_and_incidence(problem, edge_to_paths, num_paths):
+    if isinstance(edge_to_paths, IncidenceEdgeToPaths):
+        edge_ids = edge_to_paths.edge_ids
+        return (
+            edge_ids,
+            problem.capacities[edge_ids],
+            edge_to_paths.incidence[edge_ids],
+        )
+    edge_ids = np.array(
+        [e for e, edge in enumerate(problem.edges_list) if edge in edge_to_paths],
+        dtype=np.int64,
+    )
+    return (
+        edge_ids,
+        problem.capacities[edge_ids],
+        path_edge_incidence(
+            [problem.edges_list[e] for e in edge_ids.tolist()],
+            edge_to_paths,
+            num_paths,
+        ),
+    )
+
+
+# Path-commodity incidence: (len(commodities) x num_paths) CSR matrix, where
+# entry (i, p) is 1.0 if path p belongs to commodities[i]. commodities is the
+# [(k, d_k, path_ids), ...] list built by PathFormulation.pre_solve
+def path_commod_incidence(commodities, num_paths):
+    return incidence_from_lists([path_ids for _, _, path_ids in commodities], num_paths)
+
+
+# Path-edge incidence over all the edges of a graph: (len(edge_idx) x
+# len(paths)) CSR matrix, where entry (edge_idx[edge], p) is 1.0 if paths[p]
+# traverses edge
+def path_edge_incidence_from_paths(paths, edge_idx):
+    return incidence_from_lists(
+        [[edge_idx[edge] for edge in path_to_edge_list(path)] for path in paths],
+        len(edge_idx),
+    ).T.tocsr()
+
+
+# Sum per-path flows into an (num_edges x num_commods) matrix, where entry
+# (e, k) is the total flow of commodity k on edge e. path_to_commod[p] is the
+# column of path p
+def path_flows_to_sol_mat(path_flows, path_edge_mat, path_to_commod, num_commods):
+    num_paths = len(path_flows)
+    path_commod_flows = sp.csr_matrix(
+        (path_flows, (np.arange(num_paths), path_to_commod)),
+        shape=(num_paths, num_commods),
+    )
+    return (path_edge_mat @ path_commod_flows).toarray().astype(np.float32)
+
+
+# Flow lists {commod_key: [((u, v), l), ...]} for the paths in path_ids.
+# path_to_commod[p] indexes into commodity_list
+def path_flows_to_sol_dict(path_flows, path_ids, paths, path_to_commod, commodity_list):
+    sol_dict_def = defaultdict(list)
+    for p, flow in zip(path_ids.tolist(), path_flows[path_ids].tolist()):
+        sol_dict_def[commodity_list[path_to_commod[p]]] += [
+            (edge, flow) for edge in path_to_edge_list(paths[p])
+        ]
+    return sol_dict_def
@@ -1,13 +1,19 @@
 import re
 import os
 import json
+import shutil
 import numpy as np
 import networkx as nx
+import scipy.sparse as sp
 from networkx.readwrite import json_graph
 from numbers import Real
-from .graph_utils import commodity_gen
+from .commodity_table import CommodityTable
+from .topology import Topology, array_fingerprint
 from .traffic_matrix import *
 
+BUNDLE_SUFFIX = "-bundle"
+BUNDLE_METADATA_FNAME = "metadata.json"
+
 
 class Problem(object):
     def __init__(
@@ -23,7 +29,7 @@ class Problem(object):
         self.capacity_seed = seed
 
         if traffic_matrix is not None:
-            if isinstance(traffic_matrix, np.ndarray):
+            if isinstance(traffic_matrix, np.ndarray) or sp.issparse(traffic_matrix):
                 assert traffic_matrix.shape[0] == len(G)
                 self.traffic_matrix = GenericTrafficMatrix(
                     self, traffic_matrix, scale_factor=scale_factor
@@ -126,8 +132,27 @@ class Problem(object):
     # Public class methods:    #
     # Instantiate new Problems #
     ############################
+    # If the problem has been converted to a bundle (see save_bundle) since
+    # the topology and traffic matrix files last changed, the bundle is loaded
+    # instead, unless use_bundle is False. traffic_matrix_fname can also be a
+    # bundle directory
     @classmethod
-    def from_file(cls, topology_fname, traffic_matrix_fname, old_way=True):
+    def from_file(
+        cls, topology_fname, traffic_matrix_fname, old_way=True, use_bundle=True
+    ):
+        if traffic_matrix_fname.endswith(BUNDLE_SUFFIX):
+            return cls.from_bundle(traffic_matrix_fname)
+        bundle_dir = problem_bundle_dir(traffic_matrix_fname)
+        if (
+            use_bundle
+            and not topology_fname.endswith(".dot")
+            and _is_newer(
+                os.path.join(bundle_dir, BUNDLE_METADATA_FNAME),
+                [topology_fname, traffic_matrix_fname],
+            )
+        ):
+            return cls.from_bundle(bundle_dir)
+
         if topology_fname.endswith("-edgelist.txt"):
             G = nx.read_edgelist(
                 topology_fname,
@@ -153,6 +178,54 @@ class Problem(object):
 
         return problem
 
+    # Load the bundle saved in bundle_dir by save_bundle. Its arrays are
+    # memory-mapped (the traffic matrix copy-on-write, so writes to tm stay in
+    # memory), unless mmap is False
+    @classmethod
+    def from_bundle(cls, bundle_dir, mmap=True):
+        with open(os.path.join(bundle_dir, BUNDLE_METADATA_FNAME)) as f:
+            metadata = json.load(f)
+
+        def load_array(name, mmap_mode="r"):
+            return np.load(
+                os.path.join(bundle_dir, name + ".npy"),
+                mmap_mode=mmap_mode if mmap else None,
+            )
+
+        src, dst = load_array("src"), load_array("dst")
+        capacities = load_array("capacities")
+        G = nx.DiGraph()
+        G.graph.update(metadata["graph"])
+        G.add_nodes_from((node, attrs) for node, attrs in metadata["nodes"])
+        edge_attrs = metadata["edge_attrs"] or [{}] * len(src)
+        G.add_edges_from(
+            (u, v, dict(attrs, capacity=c_e))
+            for u, v, c_e, attrs in zip(
+                src.tolist(), dst.tolist(), capacities.tolist(), edge_attrs
+            )
+        )
+
+        if metadata["sparse_traffic_matrix"]:
+            tm = sp.csr_array(
+                (
+                    load_array("tm_data", "c"),
+                    load_array("tm_indices", "c"),
+                    load_array("tm_indptr", "c"),
+                ),
+                shape=(len(G), len(G)),
+            )
+        else:
+            tm = load_array("tm", "c")
+        traffic_matrix = TrafficMatrix.from_array(tm, metadata["traffic_matrix_fname"])
+
+        problem = cls(G=G, traffic_matrix=traffic_matrix, seed=0)
+        problem.name = metadata["name"]
+        # G was built in src/dst order, so the arrays can be used as is
+        problem._topology = Topology(metadata["num_nodes"], src, dst)
+        capacities.setflags(write=False)
+        problem._capacities = capacities
+        return problem
+
     @classmethod
     def fixed_traffic_matrix_problem(cls, G, traffic_matrix, seed=0):
         problem = cls(G=G, traffic_matrix=traffic_matrix, seed=seed)
@@ -166,31 +239,80 @@ class Problem(object):
         print("Num edges: ", len(self.G.edges))
         print("Num commodities: ", len(self.commodity_list))
 
+    # Copy-on-write copy: the copy shares the topology, the capacity vector
+    # and the traffic matrix with this problem, and gets its own networkx
+    # graph (a copy of this problem's, with its own capacities) only when it
+    # first accesses G. Code that only reads topology and capacities, and
+    # changes capacities with set_capacities, never copies the graph. The
+    # traffic matrix is copied on first access to tm (see TrafficMatrix.copy).
+    # Node and edge attributes other than capacity are shared, so they must
+    # not be changed in place on either problem
     def copy(self):
-        G = self.G.copy()
+        problem = Problem.__new__(Problem)
+        problem._G = None
+        problem._shared_G = self._G if self._G is not None else self._shared_G
+        problem._topology = self.topology
+        problem._capacities = self.capacities
+        if hasattr(self, "_capacities_fingerprint"):
+            problem._capacities_fingerprint = self._capacities_fingerprint
         tm = self.traffic_matrix.copy()
-        problem = Problem(G, tm)
-        problem.name = self.name
         tm._problem = problem
+        problem._traffic_matrix = tm
+        problem.name = self.name
         problem.capacity_seed = self.capacity_seed
         return problem
 
+    # Copy of this problem (see copy) with traffic_matrix instead of this
+    # problem's traffic matrix; problems with the same topology and different
+    # traffic matrices can share it this way
+    def with_traffic_matrix(self, traffic_matrix):
+        problem = self.copy()
+        if hasattr(self, "old_G"):
+            problem.old_G = self.old_G
+        traffic_matrix._problem = problem
+        problem.traffic_matrix = traffic_matrix
+        return problem
+
     ##############
     # Properties #
     ##############
     @property
     def G(self):
+        if self._G is None:
+            # first access to the graph of a copy
+            G = self._shared_G.copy()
+            for (_, _, data), c_e in zip(G.edges(data=True), self._capacities.tolist()):
+                data["capacity"] = c_e
+            self._G = G
+            self._shared_G = None
         return self._G
 
     @G.setter
     def G(self, G):
         self._G = G
+        self._shared_G = None
+        # invalidate the array views of G
+        for attr in [
+            "_edges_list",
+            "_edge_idx",
+            "_topology",
+            "_capacities",
+            "_capacities_fingerprint",
+        ]:
+            if hasattr(self, attr):
+                delattr(self, attr)
 
     @property
     def traffic_matrix(self):
         return self._traffic_matrix
 
     def _invalidate_commodity_lists(self):
+        if hasattr(self, "_tm_fingerprint"):
+            del self._tm_fingerprint
+        if hasattr(self, "_commodity_table"):
+            del self._commodity_table
+        if hasattr(self, "_sparse_commodity_table"):
+            del self._sparse_commodity_table
         if hasattr(self, "_commodity_list"):
             del self._commodity_list
         if hasattr(self, "_multi_commodity_list"):
@@ -224,37 +346,133 @@ class Problem(object):
     @property
     def edges_list(self):
         if not hasattr(self, "_edges_list"):
-            self._edges_list = list(self.G.edges)
+            self._edges_list = list(
+                zip(self.topology.src.tolist(), self.topology.dst.tolist())
+            )
         return self._edges_list
 
+    # The commodities (non-zero, off-diagonal traffic matrix entries) as a
+    # CommodityTable of src, dst and demand arrays. commodity_list and
+    # multi_commodity_list are views of it, built on first use
+    @property
+    def commodity_table(self):
+        if not hasattr(self, "_commodity_table"):
+            self._commodity_table = CommodityTable.from_traffic_matrix(
+                self.traffic_matrix.tm_view
+            )
+        return self._commodity_table
+
+    # Same as commodity_table, but with every off-diagonal entry, including
+    # the zero ones
+    @property
+    def sparse_commodity_table(self):
+        if not hasattr(self, "_sparse_commodity_table"):
+            self._sparse_commodity_table = CommodityTable.from_traffic_matrix(
+                self.traffic_matrix.tm_view, skip_zero=False
+            )
+        return self._sparse_commodity_table
+
     @property
     def commodity_list(self):
         if not hasattr(self, "_commodity_list"):
-            self._commodity_list = list(
-                enumerate(commodity_gen(self.traffic_matrix.tm))
-            )
+            self._commodity_list = self.commodity_table.as_list()
         return self._commodity_list
 
     @property
     def multi_commodity_list(self):
         if not hasattr(self, "_multi_commodity_list"):
             self._multi_commodity_list = [
-                (k, [x], [y], z)
-                for k, (x, y, z) in enumerate(commodity_gen(self.traffic_matrix.tm))
+                (k, [x], [y], z) for k, (x, y, z) in self.commodity_table.as_list()
             ]
         return self._multi_commodity_list
 
     @property
     def sparse_commodity_list(self):
         if not hasattr(self, "_sparse_commodity_list"):
-            self._sparse_commodity_list = list(
-                enumerate(commodity_gen(self.traffic_matrix.tm, skip_zero=False))
-            )
+            self._sparse_commodity_list = self.sparse_commodity_table.as_list()
         return self._sparse_commodity_list
 
     @property
     def edge_idx(self):
-        return {edge: e for e, edge in enumerate(self.G.edges)}
+        if not hasattr(self, "_edge_idx"):
+            self._edge_idx = {edge: e for e, edge in enumerate(self.edges_list)}
+        return self._edge_idx
+
+    # CSR view of the edges of G (see Topology); edge ids follow G.edges order.
+    # The topology is immutable: assign a new G to add or remove edges
+    @property
+    def topology(self):
+        if not hasattr(self, "_topology"):
+            self._topology = Topology.from_graph(self.G)
+        return self._topology
+
+    # Capacity of every edge of G, indexed by edge id. Change capacities with
+    # set_capacities, which keeps G in sync (if this problem has its own G
+    # yet; see copy); after changing them in G directly, call
+    # _invalidate_capacities
+    @property
+    def capacities(self):
+        if not hasattr(self, "_capacities"):
+            self._capacities = np.fromiter(
+                (c_e for _, _, c_e in self.G.edges.data("capacity")),
+                dtype=np.float64,
+                count=self.G.number_of_edges(),
+            )
+            self._capacities.setflags(write=False)
+        return self._capacities
+
+    # A read-only float64 capacities array is used as is, so problems (e.g.,
+    # POP subproblems) can share one; anything else is copied
+    def set_capacities(self, capacities):
+        capacities = np.asarray(capacities, dtype=np.float64)
+        if capacities.flags.writeable:
+            capacities = capacities.copy()
+        if capacities.shape != (self.topology.num_edges,):
+            raise Exception(
+                "expected {} capacities, got an array of shape {}".format(
+                    self.topology.num_edges, capacities.shape
+                )
+            )
+        if self._G is not None:
+            for (_, _, data), c_e in zip(self._G.edges(data=True), capacities.tolist()):
+                data["capacity"] = c_e
+        capacities.setflags(write=False)
+        self._capacities = capacities
+        if hasattr(self, "_capacities_fingerprint"):
+            del self._capacities_fingerprint
+
+    def _invalidate_capacities(self):
+        # a copy's graph is built from its capacities, so build it first
+        self.G
+        if hasattr(self, "_capacities"):
+            del self._capacities
+        if hasattr(self, "_capacities_fingerprint"):
+            del self._capacities_fingerprint
+
+    # Content fingerprint of the problem: of its topology (see
+    # Topology.fingerprint) and capacities, and, if include_tm is True, of its
+    # commodities. Problems with the same fingerprint are the same whatever
+    # their names, so it is what caches are keyed by. Each part is computed
+    # once and recomputed only after it changes: capacities through
+    # set_capacities or _invalidate_capacities, the traffic matrix like the
+    # commodity lists are (writes to traffic_matrix.tm that bypass its setter
+    # must be followed by _invalidate_commodity_lists)
+    def fingerprint(self, include_tm=False):
+        if not hasattr(self, "_capacities_fingerprint"):
+            self._capacities_fingerprint = array_fingerprint(
+                self.capacities.astype(np.float64)
+            )
+        parts = [self.topology.fingerprint, self._capacities_fingerprint]
+        if include_tm:
+            if not hasattr(self, "_tm_fingerprint"):
+                table = self.commodity_table
+                self._tm_fingerprint = array_fingerprint(
+                    np.asarray(table.src, dtype=np.int64),
+                    np.asarray(table.dst, dtype=np.int64),
+                    np.asarray(table.demand, dtype=np.float64),
+                )
+            parts.append(self._tm_fingerprint)
+        return array_fingerprint(np.array(parts))
 
     def new_capacities(self, *, min_cap, max_cap, fixed_caps=[], same_both_ways=True):
         assert isinstance(min_cap, Real)
@@ -268,6 +486,59 @@ class Problem(object):
             same_both_ways=same_both_ways,
         )
 
+    # Save this problem as a bundle: its edges (src.npy and dst.npy, in
+    # G.edges order), capacities and traffic matrix (tm.npy, or the
+    # tm_data/tm_indices/tm_indptr CSR arrays in sparse mode) as .npy files,
+    # and its name, node, edge and graph attributes in metadata.json, with the
+    # name of the traffic matrix's file (traffic_matrix_fname, by default the
+    # one serialize would use), which encodes its model and parameters. Like
+    # PathStore.save, the bundle is written to a temporary directory and
+    # renamed into place
+    def save_bundle(self, bundle_dir, traffic_matrix_fname=None, overwrite=False):
+        if traffic_matrix_fname is None:
+            traffic_matrix_fname = "{}_traffic-matrix.pkl".format(
+                self.traffic_matrix._fname
+            )
+        tm = self.traffic_matrix.tm_view
+        arrays = {
+            "src": self.topology.src,
+            "dst": self.topology.dst,
+            "capacities": self.capacities,
+        }
+        if sp.issparse(tm):
+            arrays.update(tm_data=tm.data, tm_indices=tm.indices, tm_indptr=tm.indptr)
+        else:
+            arrays["tm"] = tm
+        edge_attrs = [
+            {key: val for key, val in attrs.items() if key != "capacity"}
+            for _, _, attrs in self.G.edges(data=True)
+        ]
+        metadata = {
+            "name": self.name,
+            "num_nodes": self.topology.num_nodes,
+            "graph": self.G.graph,
+            "nodes": list(self.G.nodes(data=True)),
+            "edge_attrs": edge_attrs if any(edge_attrs) else None,
+            "traffic_matrix_fname": os.path.basename(traffic_matrix_fname),
+            "sparse_traffic_matrix": sp.issparse(tm),
+        }
+
+        tmp_dir = "{}.tmp-{}".format(bundle_dir, os.getpid())
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp_dir, name + ".npy"), np.ascontiguousarray(arr))
+        # written last, so that from_file never sees a bundle without it
+        with open(os.path.join(tmp_dir, BUNDLE_METADATA_FNAME), "w") as w:
+            json.dump(metadata, w)
+        if overwrite and os.path.isdir(bundle_dir):
+            old_dir = "{}.old-{}".format(bundle_dir, os.getpid())
+            os.rename(bundle_dir, old_dir)
+            shutil.rmtree(old_dir)
+        try:
+            os.rename(tmp_dir, bundle_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir)
+
     def intra_and_inter_demands(self, partitioner):
         p_v = partitioner.partition(self)
         intra, inter = 0.0, 0.0
@@ -280,10 +551,8 @@ class Problem(object):
 
     @property
     def is_traffic_matrix_full(self):
-        return (
-            len(self.commodity_list)
-            == self.traffic_matrix.tm.size - self.traffic_matrix.tm.shape[0]
-        )
+        num_nodes = self.traffic_matrix.tm_view.shape[0]
+        return len(self.commodity_table) == num_nodes * num_nodes - num_nodes
 
     @property
     def total_demand(self):
@@ -291,7 +560,7 @@ class Problem(object):
 
     @property
     def total_capacity(self):
-        return sum(cap for _, _, cap in self.G.edges.data("capacity"))
+        return float(self.capacities.sum())
 
         ##########################
 
@@ -326,6 +595,7 @@ class Problem(object):
             self.G[u][v]["capacity"] = float(cap)
             if same_both_ways:
                 self.G[v][u]["capacity"] = float(cap)
+        self._invalidate_capacities()
 
     ##########################
     # Private static methods #
@@ -407,3 +677,17 @@ class Problem(object):
     @name.setter
     def name(self, name):
         self._name = name
+
+
+# Directory of the bundle (see Problem.save_bundle) of the problem whose
+# traffic matrix is in traffic_matrix_fname; it sits next to that file
+def problem_bundle_dir(traffic_matrix_fname):
+    return os.path.splitext(traffic_matrix_fname)[0] + BUNDLE_SUFFIX
+
+
+# Whether fname exists and was modified after all of other_fnames
+def _is_newer(fname, other_fnames):
+    if not os.path.exists(fname):
+        return False
+    mtime = os.path.getmtime(fname)
+    return all(mtime >= os.path.getmtime(other) for other in other_fnames)
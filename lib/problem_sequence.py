@@ -0,0 +1,134 @@
+import numpy as np
+
+
+# Change in demand between two traffic matrices on the same topology: the
+# demand from src[i] to dst[i] went from old_demand[i] to new_demand[i]. Only
+# the (off-diagonal) pairs whose demand changed are included, in row-major
+# order
+class DemandDelta(object):
+    def __init__(self, src, dst, old_demand, new_demand):
+        self.src = src
+        self.dst = dst
+        self.old_demand = old_demand
+        self.new_demand = new_demand
+
+    @classmethod
+    def between(cls, old_tm, new_tm):
+        mask = old_tm != new_tm
+        np.fill_diagonal(mask, False)
+        src, dst = np.nonzero(mask)
+        return cls(src, dst, old_tm[src, dst], new_tm[src, dst])
+
+    def __len__(self):
+        return len(self.src)
+
+    @property
+    def change(self):
+        return self.new_demand - self.old_demand
+
+    # Write the new demands into traffic_matrix, whose demands for the pairs
+    # in this delta must be the old ones
+    def apply(self, traffic_matrix):
+        if traffic_matrix.is_sparse:
+            tm = traffic_matrix.tm_view.tolil()
+            tm[self.src, self.dst] = self.new_demand
+            traffic_matrix.tm = tm
+        else:
+            traffic_matrix.tm[self.src, self.dst] = self.new_demand
+            traffic_matrix.problem._invalidate_commodity_lists()
+
+
+# A sequence of traffic matrices on one topology, e.g., demands that change
+# over time. The matrices are stored as one num_tms x num_nodes x num_nodes
+# array, and step i is a copy of the base problem (see
+# Problem.with_traffic_matrix) whose traffic matrix, of the base problem's
+# model, is a view of matrix i: the graph is never copied, and writes to a
+# step's tm go to the array (see copy to keep them out of it). Steps are built
+# on access, and only the most recently accessed one is kept, so that a sweep
+# that accesses its current step repeatedly builds it once, without keeping
+# every step alive. delta(i) is what changed since the previous step, which
+# algorithms that can re-solve in place (see PathFormulation.resolve) apply
+# instead of the whole traffic matrix
+class ProblemSequence(object):
+    def __init__(self, problem, tms):
+        tms = np.asarray(tms)
+        num_nodes = len(problem.G)
+        if tms.ndim != 3 or tms.shape[1:] != (num_nodes, num_nodes):
+            raise Exception(
+                "expected a num_tms x {0} x {0} array of traffic matrices, got an array of shape {1}".format(
+                    num_nodes, tms.shape
+                )
+            )
+        self._problem = problem
+        self._tms = tms
+        # (index, problem) of the most recently accessed step
+        self._last_step = None, None
+
+    # num_tms matrices of problem's traffic matrix model (see
+    # TrafficMatrix.generate_batch)
+    @classmethod
+    def from_model(cls, problem, num_tms, seed=None):
+        return cls(problem, problem.traffic_matrix.generate_batch(num_tms, seed))
+
+    # Starting from seed_prob's traffic matrix, every step changes each demand
+    # by a random amount (see TrafficMatrix.perturb_matrix) whose mean is
+    # drawn from N(rel_delta_abs_mean, rel_delta_std), with a random sign, and
+    # whose spread is rel_delta_std; both are relative to the mean demand of
+    # seed_prob
+    @classmethod
+    def from_perturbations(
+        cls, seed_prob, num_tms, rel_delta_abs_mean, rel_delta_std, seed=1
+    ):
+        seed_tm = seed_prob.traffic_matrix.tm_view
+        if not isinstance(seed_tm, np.ndarray):
+            seed_tm = seed_tm.toarray()
+        mean_load = np.mean(seed_tm)
+        delta_mean = rel_delta_abs_mean * mean_load
+        delta_std = rel_delta_std * mean_load
+
+        tms = np.empty((num_tms,) + seed_tm.shape, dtype=seed_tm.dtype)
+        if num_tms > 0:
+            tms[0] = seed_tm
+        np.random.seed(seed)
+        for i in range(1, num_tms):
+            perturb_mean = np.random.normal(delta_mean, delta_std)
+            perturb_mean *= np.random.choice([-1, 1])
+            tm = tms[i]
+            np.add(
+                tms[i - 1],
+                np.random.normal(perturb_mean, delta_std, seed_tm.shape),
+                out=tm,
+                casting="unsafe",
+            )
+            np.fill_diagonal(tm, 0.0)
+            tm[tm < 0.0] = 0.0  # demands can never be less than 0
+        return cls(seed_prob, tms)
+
+    def __len__(self):
+        return len(self._tms)
+
+    def __getitem__(self, i):
+        i = range(len(self))[i]
+        if self._last_step[0] != i:
+            self._last_step = i, self._problem.with_traffic_matrix(
+                self._problem.traffic_matrix.with_tm(self._tms[i])
+            )
+        return self._last_step[1]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def tms(self):
+        return self._tms
+
+    # Sequence of the same steps on a copy of the traffic matrices, whose
+    # steps can be written to without changing this sequence
+    def copy(self):
+        return ProblemSequence(self._problem, self._tms.copy())
+
+    # Change in demand from step prev (by default, i - 1) to step i
+    def delta(self, i, prev=None):
+        if prev is None:
+            prev = i - 1
+        return DemandDelta.between(self._tms[prev], self._tms[i])
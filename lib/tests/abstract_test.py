@@ -30,6 +30,17 @@ class AbstractTest(object):
                 + bcolors.ENDC
             )
 
+    def assert_equal(self, what, actual_val, correct_val):
+        if actual_val != correct_val:
+            self.has_error = True
+            print(
+                bcolors.ERROR
+                + "[ERROR] {}: expected {}, got {}".format(
+                    what, correct_val, actual_val
+                )
+                + bcolors.ENDC
+            )
+
     def assert_eq_epsilon(self, actual_val, correct_val, epsilon=1e-5):
         try:
             assert abs(correct_val - actual_val) < epsilon
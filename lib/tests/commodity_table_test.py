@@ -0,0 +1,37 @@
+from .abstract_test import AbstractTest
+from ..graph_utils import commodity_gen
+from ..problems import OptGapC3
+
+# The commodity lists that Problem builds from its CommodityTable should be
+# exactly the ones commodity_gen yields from the traffic matrix.
+
+
+class CommodityTableTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC3()
+
+    @property
+    def name(self):
+        return "commodity-table"
+
+    def run(self):
+        tm = self.problem.traffic_matrix.tm
+        tm[0, 1] = 0.0
+        self.problem._invalidate_commodity_lists()
+
+        self.assert_equal(
+            "commodity_list",
+            self.problem.commodity_list,
+            list(enumerate(commodity_gen(tm))),
+        )
+        self.assert_equal(
+            "sparse_commodity_list",
+            self.problem.sparse_commodity_list,
+            list(enumerate(commodity_gen(tm, skip_zero=False))),
+        )
+        self.assert_equal(
+            "multi_commodity_list",
+            self.problem.multi_commodity_list,
+            [(k, [x], [y], z) for k, (x, y, z) in enumerate(commodity_gen(tm))],
+        )
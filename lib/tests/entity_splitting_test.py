@@ -0,0 +1,68 @@
+import numpy as np
+
+from .abstract_test import AbstractTest
+from ..partitioning.pop.entity_splitting import split_entities
+from ..partitioning.pop.random import _sample_without_replacement
+
+# split_entities keeps halving the largest split, so every entity's splits
+# add up to its demand, and RandomSplitter sends the splits of an entity to
+# distinct subproblems while there are enough of them.
+
+
+class EntitySplittingTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "entity-splitting"
+
+    def run(self):
+        # 8 is halved, then both 4s: 3 new entities
+        entity_ids, split_demands = split_entities([8.0, 1.0, 3.0], 1.0)
+        self.assert_equal("entity ids", entity_ids.tolist(), [0, 0, 0, 0, 1, 2])
+        self.assert_equal(
+            "split demands", split_demands.tolist(), [2.0] * 4 + [1.0, 3.0]
+        )
+
+        # 6 is halved, then the first of the three 3s (ties go in entity order)
+        entity_ids, split_demands = split_entities([6.0, 3.0, 1.0, 1.0], 0.5)
+        self.assert_equal("ties, entity ids", entity_ids.tolist(), [0, 0, 0, 1, 2, 3])
+        self.assert_equal(
+            "ties, split demands",
+            split_demands.tolist(),
+            [3.0, 1.5, 1.5, 3.0, 1.0, 1.0],
+        )
+
+        entity_ids, split_demands = split_entities([1.0, 2.0], 0.0)
+        self.assert_equal("no splits", split_demands.tolist(), [1.0, 2.0])
+
+        np.random.seed(0)
+        demands = np.random.exponential(size=1000)
+        entity_ids, split_demands = split_entities(demands, 0.5)
+        self.assert_equal("number of splits", len(split_demands), 1500)
+        self.assert_equal("grouped", bool(np.all(np.diff(entity_ids) >= 0)), True)
+        self.assert_equal(
+            "demands kept",
+            np.allclose(np.bincount(entity_ids, weights=split_demands), demands),
+            True,
+        )
+        # nothing that was halved is smaller than a split that was not
+        halved = np.bincount(entity_ids)[entity_ids] > 1
+        self.assert_equal(
+            "largest halved",
+            bool(2 * split_demands[halved].min() >= split_demands.max()),
+            True,
+        )
+
+        round_sizes = np.array([1, 4, 2, 4, 1])
+        samples = _sample_without_replacement(round_sizes, 4)
+        rounds = np.split(samples, np.cumsum(round_sizes)[:-1])
+        self.assert_equal(
+            "sampled without replacement",
+            [len(set(r.tolist())) for r in rounds],
+            round_sizes.tolist(),
+        )
+        self.assert_equal(
+            "sampled range", bool(np.all((0 <= samples) & (samples < 4))), True
+        )
@@ -0,0 +1,61 @@
+from .abstract_test import AbstractTest, bcolors
+from ..problems import OptGapC1
+from ..algorithms.abstract_formulation import Objective
+from ..algorithms.path_formulation import PathFormulation
+from ..lp_backend import BACKENDS
+from .path_formulation_test import problem_with_commodity_1_5, solve_with_sat_flows
+
+# Every LP backend should reach the same optimum for the path formulation (see
+# path_formulation_test for the values). Backends whose solver is not installed
+# are skipped.
+
+
+class LpBackendTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC1()
+
+    @property
+    def name(self):
+        return "lp-backend"
+
+    def run(self):
+        for lp_backend, backend_cls in BACKENDS.items():
+            if not backend_cls.available():
+                print(
+                    bcolors.WARNING
+                    + "[SKIPPED] {} backend: solver not installed".format(lp_backend)
+                    + bcolors.ENDC
+                )
+                continue
+            for objective, correct_val in [
+                (Objective.TOTAL_FLOW, 5.0),
+                (Objective.MAX_CONCURRENT_FLOW, 0.25),
+                (Objective.COMPUTE_DEMAND_SCALE_FACTOR, 4.0),
+            ]:
+                pf = PathFormulation(
+                    objective=objective, num_paths=4, lp_backend=lp_backend
+                )
+                pf.solve(self.problem)
+                self.assert_eq_epsilon(pf.obj_val, correct_val)
+                # A second solve empties and refills the same model
+                pf.solve(self.problem)
+                self.assert_eq_epsilon(pf.obj_val, correct_val)
+
+            problem = self.problem.copy()
+            problem.traffic_matrix.tm[0, 5] = 4.0
+            pf = PathFormulation(
+                objective=Objective.MIN_MAX_LINK_UTIL,
+                num_paths=4,
+                lp_backend=lp_backend,
+            )
+            pf.solve(problem)
+            self.assert_eq_epsilon(pf.obj_val, 0.8)
+
+            pf = PathFormulation(
+                objective=Objective.MAX_CONCURRENT_FLOW,
+                num_paths=4,
+                lp_backend=lp_backend,
+            )
+            solve_with_sat_flows(pf, problem_with_commodity_1_5(), [((1,), 5.0)])
+            self.assert_eq_epsilon(pf.obj_val, 0.1025)
@@ -0,0 +1,61 @@
+from .abstract_test import AbstractTest, bcolors
+from ..problems import OptGapC3
+from ..path_utils import (
+    compute_all_paths,
+    find_paths,
+    find_paths_from_source,
+    graph_copy_with_edge_weights,
+)
+
+# Computing paths with a pool of workers should give exactly the paths (and
+# key order) of computing them in-process, and searching from a source to all
+# of its targets at once should match the per-pair search.
+
+
+class PathComputationTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC3()
+
+    @property
+    def name(self):
+        return "path-computation"
+
+    def run(self):
+        for edge_disjoint in [True, False]:
+            for dist_metric in ["inv-cap", "min-hop"]:
+                serial = compute_all_paths(
+                    self.problem.G, 4, edge_disjoint, dist_metric, num_workers=1
+                )
+                parallel = compute_all_paths(
+                    self.problem.G, 4, edge_disjoint, dist_metric, num_workers=2
+                )
+                if list(serial.items()) != list(parallel.items()):
+                    self.has_error = True
+                    print(
+                        bcolors.ERROR
+                        + "[ERROR] Paths differ for edge_disjoint={}, dist_metric={}".format(
+                            edge_disjoint, dist_metric
+                        )
+                        + bcolors.ENDC
+                    )
+
+                G = graph_copy_with_edge_weights(self.problem.G, dist_metric)
+                for s_k in G.nodes:
+                    targets = [t_k for t_k in G.nodes if t_k != s_k]
+                    batched = find_paths_from_source(
+                        G, s_k, targets, 4, disjoint=edge_disjoint
+                    )
+                    per_pair = {
+                        t_k: find_paths(G, s_k, t_k, 4, disjoint=edge_disjoint)
+                        for t_k in targets
+                    }
+                    if batched != per_pair:
+                        self.has_error = True
+                        print(
+                            bcolors.ERROR
+                            + "[ERROR] Batched paths from {} differ for edge_disjoint={}, dist_metric={}".format(
+                                s_k, edge_disjoint, dist_metric
+                            )
+                            + bcolors.ENDC
+                        )
@@ -0,0 +1,39 @@
+from .abstract_test import AbstractTest
+from ..problems import OptGapC1
+from ..algorithms.abstract_formulation import Objective
+from ..algorithms.path_formulation import PathFormulation
+
+# Re-solving a built path LP for a new TM and new capacities should reach the
+# same optimum as solving a freshly built LP for them.
+
+
+class PathFormulationResolveTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "path-formulation-resolve"
+
+    def run(self):
+        for objective in [
+            Objective.TOTAL_FLOW,
+            Objective.MAX_CONCURRENT_FLOW,
+            Objective.COMPUTE_DEMAND_SCALE_FACTOR,
+        ]:
+            for warm_start_mode in [False, True]:
+                problem = OptGapC1()
+                pf = PathFormulation.get_pf_for_obj(objective, 4)
+                pf._warm_start_mode = warm_start_mode
+                pf.solve(problem)
+
+                tm = problem.traffic_matrix.tm * 0.7
+                capacities = [
+                    1.3 * c_e for _, _, c_e in problem.G.edges.data("capacity")
+                ]
+                pf.resolve(tm=tm, capacities=capacities)
+
+                new_pf = PathFormulation.get_pf_for_obj(objective, 4)
+                new_pf._warm_start_mode = warm_start_mode
+                new_pf.solve(problem.copy())
+                self.assert_eq_epsilon(pf.obj_val, new_pf.obj_val)
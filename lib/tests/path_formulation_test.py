@@ -0,0 +1,59 @@
+from .abstract_test import AbstractTest
+from ..problems import OptGapC1
+from ..algorithms.abstract_formulation import Objective
+from ..algorithms.path_formulation import PathFormulation
+
+# Sanity check for the matrix-form path LP: every objective should reach the
+# same optimum as the original constraint-by-constraint formulation. The max
+# flow from 0 to 5 is 5, so routing a demand of 4 needs a max link utilization
+# of 0.8. With a second commodity from 1 to 5, both share the 7 units of
+# capacity into 5; saturating 1 -> 5 (at least 0.99 * 5) leaves 2.05 of the
+# demand of 20 of 0 -> 5, a concurrent flow of 0.1025.
+
+
+def problem_with_commodity_1_5():
+    problem = OptGapC1().copy()
+    problem.traffic_matrix.tm[1, 5] = 20.0
+    return problem
+
+
+# Solve pf with the flow cap constraints of sat_flows ([((k1, ..., kn), f1),
+# ...]), which solve itself never adds
+def solve_with_sat_flows(pf, problem, sat_flows):
+    pf._problem = problem
+    pf._invalidate_sol_caches()
+    pf._solver = pf._construct_lp(sat_flows)
+    pf._solver.solve_lp()
+
+
+class PathFormulationTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC1()
+
+    @property
+    def name(self):
+        return "path-formulation"
+
+    def run(self):
+        for objective, correct_val in [
+            (Objective.TOTAL_FLOW, 5.0),
+            (Objective.MAX_CONCURRENT_FLOW, 0.25),
+            (Objective.COMPUTE_DEMAND_SCALE_FACTOR, 4.0),
+        ]:
+            pf = PathFormulation.get_pf_for_obj(objective, 4)
+            pf.solve(self.problem)
+            self.assert_eq_epsilon(pf.obj_val, correct_val)
+
+        problem = self.problem.copy()
+        problem.traffic_matrix.tm[0, 5] = 4.0
+        pf = PathFormulation.get_pf_for_obj(Objective.MIN_MAX_LINK_UTIL, 4)
+        pf.solve(problem)
+        self.assert_eq_epsilon(pf.obj_val, 0.8)
+
+        problem = problem_with_commodity_1_5()
+        pf = PathFormulation.get_pf_for_obj(Objective.MAX_CONCURRENT_FLOW, 4)
+        pf.solve(problem)
+        self.assert_eq_epsilon(pf.obj_val, 0.175)
+        solve_with_sat_flows(pf, problem, [((1,), 5.0)])
+        self.assert_eq_epsilon(pf.obj_val, 0.1025)
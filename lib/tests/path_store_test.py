@@ -0,0 +1,203 @@
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from .abstract_test import AbstractTest
+from ..problems import OptGapC3
+from ..algorithms.path_formulation import PathFormulation
+from ..path_store import (
+    PathStore,
+    convert_paths_pickle,
+    paths_fname,
+    read_path_store_or_compute,
+    update_path_store,
+)
+from ..path_utils import compute_all_paths, path_to_edge_list
+
+# A PathStore, whether built in memory, memory-mapped from disk, converted from
+# a pickle or unpickled, should look up exactly the paths of the dict it was
+# built from, its edge ids (and edge-pair incidence) should match the paths'
+# edges, and PathFormulation.pre_solve should build the same LP inputs from it
+# as from the dict. Updating a store after some capacities change (or edges
+# fail) should give the same paths as recomputing all of them. Stores for other
+# capacities are saved next to the first one, under their own edge weights,
+# without changing it.
+
+
+class PathStoreTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC3()
+
+    @property
+    def name(self):
+        return "path-store"
+
+    # What PathFormulation.pre_solve builds for problem with paths (a PathStore
+    # or a dict)
+    def pre_solve(self, problem, paths):
+        pf = PathFormulation.new_total_flow(4)
+        pf._paths_dict = paths
+        edge_to_paths, num_paths = pf.pre_solve(problem)
+        return (
+            dict(edge_to_paths),
+            num_paths,
+            pf.commodities,
+            list(pf._all_paths),
+            [int(pf._path_to_commod[p]) for p in range(num_paths)],
+        )
+
+    def run(self):
+        G = self.problem.G
+        paths_dict = compute_all_paths(G, 4, True, "min-hop", num_workers=1)
+        full_problem = self.problem.copy()
+        full_problem.traffic_matrix.tm = 1.0 - np.eye(len(G))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pkl_fname = os.path.join(tmp_dir, "paths-dict.pkl")
+            with open(pkl_fname, "wb") as w:
+                pickle.dump(paths_dict, w)
+            convert_paths_pickle(pkl_fname, G=G)
+            loaded = PathStore.load(os.path.join(tmp_dir, "paths-store"))
+
+            stores = {
+                "in-memory": PathStore.from_dict(paths_dict, G),
+                "memory-mapped": loaded,
+                "unpickled": pickle.loads(pickle.dumps(loaded)),
+            }
+            for store_name, store in stores.items():
+                self.assert_equal(
+                    store_name + " paths", list(store.items()), list(paths_dict.items())
+                )
+                self.assert_equal(store_name + " has (0, 0)", (0, 0) in store, False)
+
+                edges = list(G.edges)
+                for p in range(store.num_paths):
+                    self.assert_equal(
+                        "{} edges of path {}".format(store_name, p),
+                        [edges[e] for e in store.path_edge_ids(p)],
+                        list(path_to_edge_list(store.path(p))),
+                    )
+
+                pairs = list(store)
+                self.assert_equal(
+                    store_name + " pair indices",
+                    store.pair_indices(
+                        [s_k for s_k, _ in pairs] + [0], [t_k for _, t_k in pairs] + [0]
+                    ).tolist(),
+                    list(range(len(pairs))) + [-1],
+                )
+                self.assert_equal(
+                    store_name + " pair index",
+                    [store.pair_index(s_k, t_k) for s_k, t_k in pairs + [(0, 0)]],
+                    list(range(len(pairs))) + [-1],
+                )
+                self.assert_equal(
+                    store_name + " pre_solve",
+                    self.pre_solve(full_problem, store),
+                    self.pre_solve(full_problem, paths_dict),
+                )
+                self.assert_equal(
+                    store_name + " fingerprint",
+                    store.fingerprint,
+                    PathStore.from_dict(paths_dict).fingerprint,
+                )
+                incidence = store.edge_pair_incidence().tocsc()
+                for i, pair in enumerate(pairs):
+                    start, stop = store.path_range(*pair)
+                    self.assert_equal(
+                        "{} edge-pair incidence of {}".format(store_name, pair),
+                        incidence[:, [i]].indices.tolist(),
+                        sorted(
+                            {
+                                e
+                                for p in range(start, stop)
+                                for e in store.path_edge_ids(p).tolist()
+                            }
+                        ),
+                    )
+
+        for edge_disjoint in [True, False]:
+            for dist_metric in ["inv-cap", "min-hop"]:
+                store = PathStore.from_dict(
+                    compute_all_paths(G, 4, edge_disjoint, dist_metric, num_workers=1),
+                    G,
+                )
+                new_G = G.copy()
+                edges = list(G.edges)
+                old_capacities = {
+                    edge: G.edges[edge]["capacity"] for edge in edges[1::3]
+                }
+                for i, (u, v) in enumerate(old_capacities):
+                    new_G[u][v]["capacity"] *= [0.0, 0.5, 3.0][i % 3]
+                updated, _ = update_path_store(
+                    store, new_G, old_capacities, 4, edge_disjoint, dist_metric
+                )
+                self.assert_equal(
+                    "updated ({}, {}) paths".format(edge_disjoint, dist_metric),
+                    dict(updated),
+                    compute_all_paths(
+                        new_G, 4, edge_disjoint, dist_metric, num_workers=1
+                    ),
+                )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            def read(G):
+                return read_path_store_or_compute(
+                    paths_fname(tmp_dir, "topology", G, 4, True, "inv-cap"),
+                    G,
+                    lambda: compute_all_paths(G, 4, True, "inv-cap", num_workers=1),
+                    4,
+                    True,
+                    "inv-cap",
+                )
+
+            first = read(G)
+            new_G = G.copy()
+            for i, (u, v) in enumerate(list(G.edges)[1::3]):
+                new_G[u][v]["capacity"] *= [0.0, 0.5, 3.0][i % 3]
+            updated = read(new_G)
+            self.assert_equal(
+                "other capacities, separate store",
+                updated._store_dir != first._store_dir,
+                True,
+            )
+            self.assert_equal(
+                "other capacities, paths",
+                dict(updated),
+                compute_all_paths(new_G, 4, True, "inv-cap", num_workers=1),
+            )
+            reloaded = PathStore.load(first._store_dir)
+            self.assert_equal(
+                "first store, paths", reloaded.fingerprint, first.fingerprint
+            )
+            self.assert_equal(
+                "first store, capacities",
+                reloaded.capacities.tolist(),
+                first.capacities.tolist(),
+            )
+            self.assert_equal(
+                "other capacities, reloaded store",
+                read(new_G)._store_dir,
+                updated._store_dir,
+            )
+
+            scaled_G = G.copy()
+            for u, v in scaled_G.edges:
+                scaled_G[u][v]["capacity"] /= 3
+            self.assert_equal(
+                "scaled capacities, store", read(scaled_G)._store_dir, first._store_dir
+            )
+
+        new_problem = self.problem.copy()
+        capacities = new_problem.capacities.copy()
+        capacities[1::3] *= 0.5
+        new_problem.set_capacities(capacities)
+        self.assert_equal(
+            "other capacities, paths file",
+            PathFormulation.paths_full_fname(new_problem, 4, True, "inv-cap")
+            != PathFormulation.paths_full_fname(self.problem, 4, True, "inv-cap"),
+            True,
+        )
@@ -0,0 +1,55 @@
+from .abstract_test import AbstractTest
+from ..problems import OptGapC3
+from ..algorithms.pop import POP
+from ..algorithms.abstract_formulation import Objective
+from ..algorithms.path_formulation import PathFormulation
+
+# Solving POP's subproblems on a process pool should give the same solution as
+# solving them one after the other, whichever commodity list the subproblems'
+# algorithm builds its LP over.
+
+
+# Path formulation whose LP has every pair of nodes as a commodity (see
+# PathFormulation._problem_commodity_list)
+class WarmStartPathFormulation(PathFormulation):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._warm_start_mode = True
+
+
+class POPParallelTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "pop-parallel"
+
+    def run(self):
+        for algo_cls in [PathFormulation, WarmStartPathFormulation]:
+            obj_vals, sol_dicts = [], []
+            for num_workers in [1, 2]:
+                pop = POP(
+                    objective=Objective.TOTAL_FLOW,
+                    num_subproblems=2,
+                    split_method="skewed",
+                    split_fraction=0.0,
+                    algo_cls=algo_cls,
+                    num_paths=4,
+                    num_workers=num_workers,
+                )
+                pop.solve(OptGapC3())
+                self.assert_geq_epsilon(pop.wall_time, 0.0)
+                obj_vals.append(pop.obj_val)
+                sol_dicts.append(
+                    {
+                        commod_key: sorted(flow_list)
+                        for commod_key, flow_list in pop.sol_dict.items()
+                    }
+                )
+            self.assert_eq_epsilon(obj_vals[1], obj_vals[0])
+            self.assert_equal(
+                "{} sol_dict, pool vs. serial".format(algo_cls.__name__),
+                sol_dicts[1],
+                sol_dicts[0],
+            )
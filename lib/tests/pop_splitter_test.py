@@ -0,0 +1,228 @@
+import networkx as nx
+import numpy as np
+
+from .abstract_test import AbstractTest
+from ..problem import Problem
+from ..problems import OptGapC3
+from ..algorithms.path_formulation import PathFormulation
+from ..partitioning.pop import (
+    BaselineSplitter,
+    GenericSplitter,
+    RandomSplitter,
+    RandomSplitter2,
+    SmartSplitter,
+)
+from ..partitioning.pop.utils import two_choice
+from ..path_utils import compute_all_paths
+
+# POP's splitters divide the demands of a problem among its subproblems, which
+# each get their own traffic matrix, and share one capacities vector with
+# 1 / num_subproblems of every link's capacity; with both dense and sparse
+# traffic matrices.
+#
+# SmartSplitter, on the line 0 - 1 - 2 - 3 (edges in G.edges order (0, 1),
+# (1, 0), (1, 2), (2, 1), (2, 3), (3, 2)), assigns every commodity at the
+# first of its paths' edges in that order: 0 -> 1 and 0 -> 2 at (0, 1),
+# 2 -> 0 at (1, 0), 1 -> 3 at (1, 2), 3 -> 1 (demand 50, over 100 / 3, so
+# split in 2) at (2, 1) and 3 -> 2 at (3, 2). Round-robin over 3 subproblems
+# in that order, they get {0 -> 1, 1 -> 3, 3 -> 2}, {0 -> 2, half of 3 -> 1}
+# and {2 -> 0, half of 3 -> 1}.
+#
+# GenericSplitter's two-choice assignment, in batches or one entity at a time,
+# keeps every subproblem's sum of every feature within 5% of its equal share
+# (a random assignment of the same entities is off by 10-15%), and stops
+# choosing a subproblem once it has its equal share of entities plus 1%, so
+# none gets more than that plus one batch.
+
+
+class LineProblem(Problem):
+    def __init__(self):
+        G = nx.DiGraph()
+        for u, v in [(0, 1), (1, 0), (1, 2), (2, 1), (2, 3), (3, 2)]:
+            G.add_edge(u, v, capacity=10.0)
+        traffic_matrix = np.zeros((4, 4))
+        for (s_k, t_k), d_k in LINE_DEMANDS.items():
+            traffic_matrix[s_k, t_k] = d_k
+        super().__init__(G, traffic_matrix)
+
+    @property
+    def name(self):
+        return "line"
+
+
+LINE_DEMANDS = {
+    (0, 1): 7.0,
+    (0, 2): 10.0,
+    (1, 3): 20.0,
+    (2, 0): 5.0,
+    (3, 1): 50.0,
+    (3, 2): 4.0,
+}
+LINE_SMART_SPLIT = [
+    {(0, 1): 7.0, (1, 3): 20.0, (3, 2): 4.0},
+    {(0, 2): 10.0, (3, 1): 25.0},
+    {(2, 0): 5.0, (3, 1): 25.0},
+]
+
+
+class POPSplitterTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "pop-splitter"
+
+    def run(self):
+        num_subproblems = 3
+        paths_dict = compute_all_paths(OptGapC3().G, 4, True, "min-hop", num_workers=1)
+        splitters = [
+            BaselineSplitter(num_subproblems),
+            RandomSplitter(num_subproblems, split_fraction=0.0),
+            RandomSplitter(num_subproblems, split_fraction=0.5),
+            RandomSplitter2(num_subproblems, split_fraction=0.5),
+            SmartSplitter(num_subproblems, paths_dict),
+            GenericSplitter(
+                num_subproblems, PathFormulation.new_total_flow(4), method="means"
+            ),
+            GenericSplitter(
+                num_subproblems, PathFormulation.new_total_flow(4), method="covs"
+            ),
+        ]
+        for sparse in [False, True]:
+            problem = OptGapC3()
+            if sparse:
+                problem.traffic_matrix.sparsify()
+            tm = _dense(problem.traffic_matrix.tm_view)
+            for splitter in splitters:
+                what = "{}{}{}".format(
+                    type(splitter).__name__,
+                    (
+                        " ({})".format(splitter.method)
+                        if isinstance(splitter, GenericSplitter)
+                        else ""
+                    ),
+                    " (sparse)" if sparse else "",
+                )
+                np.random.seed(0)
+                sub_problems = splitter.split(problem)
+                self.assert_equal(
+                    what + ": number of subproblems",
+                    len(sub_problems),
+                    num_subproblems,
+                )
+                self.assert_equal(
+                    what + ": sparse",
+                    all(
+                        sub_problem.traffic_matrix.is_sparse == sparse
+                        for sub_problem in sub_problems
+                    ),
+                    True,
+                )
+                sub_tms = [
+                    _dense(sub_problem.traffic_matrix.tm_view)
+                    for sub_problem in sub_problems
+                ]
+                self.assert_equal(
+                    what + ": demands",
+                    np.allclose(sum(sub_tms), tm),
+                    True,
+                )
+                self.assert_equal(
+                    what + ": capacities",
+                    np.allclose(
+                        sub_problems[0].capacities,
+                        problem.capacities / num_subproblems,
+                    ),
+                    True,
+                )
+                self.assert_equal(
+                    what + ": capacities shared",
+                    all(
+                        sub_problem.capacities is sub_problems[0].capacities
+                        for sub_problem in sub_problems
+                    ),
+                    True,
+                )
+
+                # a write to one subproblem's traffic matrix only changes it
+                sub_problems[0].traffic_matrix.tm *= 2
+                self.assert_equal(
+                    what + ": independent traffic matrices",
+                    np.allclose(
+                        _dense(sub_problems[1].traffic_matrix.tm_view), sub_tms[1]
+                    ),
+                    True,
+                )
+
+        # the only path of every pair is along the line
+        line_paths = {
+            (s_k, t_k): [_line_path(s_k, t_k)]
+            for s_k in range(4)
+            for t_k in range(4)
+            if s_k != t_k
+        }
+        for sparse in [False, True]:
+            problem = LineProblem()
+            if sparse:
+                problem.traffic_matrix.sparsify()
+            sub_problems = SmartSplitter(num_subproblems, line_paths).split(problem)
+            self.assert_equal(
+                "SmartSplitter{}: line".format(" (sparse)" if sparse else ""),
+                [
+                    {
+                        (int(s_k), int(t_k)): float(d_k)
+                        for _, (s_k, t_k, d_k) in sub_problem.commodity_list
+                    }
+                    for sub_problem in sub_problems
+                ],
+                LINE_SMART_SPLIT,
+            )
+
+        np.random.seed(0)
+        num_entities, num_features = 2000, 8
+        features = np.random.exponential(1.0, (num_entities, num_features)) * (
+            np.random.random((num_entities, num_features)) < 0.5
+        )
+        for method in ["means", "covs"]:
+            # by default, 256 batches of 8 entities
+            for batch_size in [None, 1]:
+                what = "two_choice ({}, batch size {})".format(
+                    method, 8 if batch_size is None else batch_size
+                )
+                np.random.seed(0)
+                assignments = two_choice(
+                    features, num_subproblems, method=method, batch_size=batch_size
+                )
+                sums = np.stack(
+                    [
+                        features[assignments == i].sum(axis=0)
+                        for i in range(num_subproblems)
+                    ]
+                )
+                share = features.sum(axis=0) / num_subproblems
+                self.assert_equal(
+                    what + ": balanced sums",
+                    bool(np.all(np.abs(sums - share) <= 0.05 * share)),
+                    True,
+                )
+                self.assert_equal(
+                    what + ": balanced counts",
+                    bool(
+                        np.all(
+                            np.bincount(assignments, minlength=num_subproblems)
+                            <= num_entities * 1.01 / num_subproblems
+                            + (8 if batch_size is None else batch_size)
+                        )
+                    ),
+                    True,
+                )
+
+
+def _line_path(s_k, t_k):
+    step = 1 if s_k < t_k else -1
+    return list(range(s_k, t_k + step, step))
+
+
+def _dense(tm):
+    return tm if isinstance(tm, np.ndarray) else tm.toarray()
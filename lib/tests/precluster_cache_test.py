@@ -0,0 +1,106 @@
+import tempfile
+
+import numpy as np
+
+from .abstract_test import AbstractTest
+from ..problems import OptGapC3
+from ..algorithms.path_formulation import PathFormulation
+from ..partitioning.pop import PreclusterCache
+from ..partitioning.pop.utils import create_edges_onehot_features
+from ..path_store import PathStore
+
+# A PreclusterCache fits a precluster once per topology and paths: features it
+# was fitted on get the same precluster back, from memory or from disk, and new
+# demands refit it from its centroids instead of from scratch. This holds for
+# KMeans preclusters and for KPrototypes ones (with the edge columns of the
+# features as categorical), on a full traffic matrix, so that there are enough
+# distinct entities for Cao's initialization.
+
+
+def centroids(precluster):
+    if hasattr(precluster, "cluster_centroids_"):
+        return precluster.cluster_centroids_
+    return precluster.cluster_centers_
+
+
+class PreclusterCacheTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "precluster-cache"
+
+    def run(self):
+        num_clusters = 3
+        pf = PathFormulation.new_total_flow(4)
+        problem = OptGapC3()
+        num_nodes = len(problem.G)
+        np.random.seed(0)
+        tm = np.random.uniform(1.0, 10.0, (num_nodes, num_nodes))
+        np.fill_diagonal(tm, 0.0)
+        problem.traffic_matrix.tm = tm
+        paths = PathStore.from_paths(pf.get_paths(problem), problem.G)
+
+        new_problem = problem.copy()
+        new_problem.traffic_matrix.tm = tm * np.linspace(
+            0.5, 2.0, num_nodes * num_nodes
+        ).reshape(num_nodes, num_nodes)
+
+        features = create_edges_onehot_features(problem, pf, 1.0, paths)[-1]
+        new_features = create_edges_onehot_features(new_problem, pf, 1.0, paths)[-1]
+        for categorical in [None, list(range(problem.topology.num_edges))]:
+            what = "kmeans" if categorical is None else "kprototypes"
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                cache = PreclusterCache(
+                    cache_dir=tmp_dir, num_workers=1, refit_max_iter=2
+                )
+                np.random.seed(0)
+                precluster = cache.precluster(
+                    problem, paths, features, num_clusters, categorical
+                )
+                self.assert_equal(
+                    "{}, same features, same cache".format(what),
+                    cache.precluster(
+                        problem, paths, features, num_clusters, categorical
+                    )
+                    is precluster,
+                    True,
+                )
+
+                loaded = PreclusterCache(cache_dir=tmp_dir).precluster(
+                    problem, paths, features, num_clusters, categorical
+                )
+                self.assert_equal(
+                    "{}, same features, loaded from disk".format(what),
+                    np.array_equal(centroids(loaded), centroids(precluster)),
+                    True,
+                )
+
+                refit = cache.precluster(
+                    new_problem, paths, new_features, num_clusters, categorical
+                )
+                self.assert_equal(
+                    "{}, new demands, refit".format(what), refit is not precluster, True
+                )
+                self.assert_equal(
+                    "{}, new demands, refit iterations".format(what),
+                    refit.n_iter_ <= 2,
+                    True,
+                )
+                self.assert_equal(
+                    "{}, new demands, refit saved".format(what),
+                    np.array_equal(
+                        centroids(
+                            PreclusterCache(cache_dir=tmp_dir).precluster(
+                                new_problem,
+                                paths,
+                                new_features,
+                                num_clusters,
+                                categorical,
+                            )
+                        ),
+                        centroids(refit),
+                    ),
+                    True,
+                )
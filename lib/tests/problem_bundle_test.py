@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+import numpy as np
+
+from .abstract_test import AbstractTest
+from ..problem import Problem, problem_bundle_dir
+from ..problems import OptGapC3
+from ..topology import Topology
+from ..traffic_matrix import GravityTrafficMatrix
+
+# A problem loaded from its bundle should have the same graph, capacities and
+# traffic matrix as the one loaded from the original files, and from_file
+# should only use the bundle while it is up to date.
+
+
+class ProblemBundleTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC3()
+
+    @property
+    def name(self):
+        return "problem-bundle"
+
+    def run(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            topo_fname = os.path.join(tmp_dir, "optgapc3.json")
+            Problem._write_graph_json(self.problem.G, topo_fname)
+            GravityTrafficMatrix(
+                self.problem, self.problem.traffic_matrix.tm, total_demand=None
+            ).serialize(tmp_dir)
+            (tm_fname,) = [
+                os.path.join(tmp_dir, fname)
+                for fname in os.listdir(tmp_dir)
+                if fname.endswith(".pkl")
+            ]
+            bundle_dir = problem_bundle_dir(tm_fname)
+            problem = Problem.from_file(topo_fname, tm_fname)
+
+            problem.save_bundle(bundle_dir, tm_fname)
+            bundled = Problem.from_file(topo_fname, tm_fname)
+            self.assert_equal(
+                "memory-mapped", isinstance(bundled.capacities, np.memmap), True
+            )
+            self.check_same(bundled, problem)
+
+            # Writes to the traffic matrix stay in memory
+            bundled.traffic_matrix.tm[0, 1] = 3.0
+            self.check_same(Problem.from_bundle(bundle_dir), problem)
+
+            problem.traffic_matrix.sparsify()
+            problem.save_bundle(bundle_dir, tm_fname, overwrite=True)
+            bundled = Problem.from_bundle(bundle_dir, mmap=False)
+            self.assert_equal("sparse", bundled.traffic_matrix.is_sparse, True)
+            self.check_same(bundled, problem)
+
+            # The bundle is out of date once the traffic matrix file changes
+            mtime = os.path.getmtime(tm_fname) + 10
+            os.utime(tm_fname, (mtime, mtime))
+            reloaded = Problem.from_file(topo_fname, tm_fname)
+            self.assert_equal(
+                "out of date bundle", reloaded.traffic_matrix.is_sparse, False
+            )
+
+    def check_same(self, problem, expected):
+        self.assert_equal("name", problem.name, expected.name)
+        for what in ["nodes", "edges"]:
+            self.assert_equal(
+                what,
+                list(getattr(problem.G, what)(data=True)),
+                list(getattr(expected.G, what)(data=True)),
+            )
+        self.assert_equal(
+            "topology",
+            problem.topology.has_same_edges(Topology.from_graph(problem.G)),
+            True,
+        )
+        self.assert_equal(
+            "capacities", problem.capacities.tolist(), expected.capacities.tolist()
+        )
+        self.assert_equal(
+            "traffic matrix",
+            (problem.traffic_matrix.model, problem.traffic_matrix.seed),
+            (expected.traffic_matrix.model, expected.traffic_matrix.seed),
+        )
+        self.assert_equal(
+            "commodities", problem.commodity_list, expected.commodity_list
+        )
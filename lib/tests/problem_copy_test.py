@@ -0,0 +1,79 @@
+from .abstract_test import AbstractTest
+from ..problems import OptGapC3
+
+# Problem.copy is copy-on-write: a copy shares the topology, capacities and
+# traffic matrix of the original until one of them changes, and changes to
+# either must never show up in the other.
+
+
+class ProblemCopyTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC3()
+
+    @property
+    def name(self):
+        return "problem-copy"
+
+    def run(self):
+        problem = self.problem
+        caps = problem.capacities.tolist()
+        tm = problem.traffic_matrix.tm.copy()
+
+        copy = problem.copy()
+        self.assert_equal("copy has no graph yet", copy._G is None, True)
+        self.assert_equal("topology shared", copy.topology is problem.topology, True)
+        self.assert_equal(
+            "copy commodities", copy.commodity_list, problem.commodity_list
+        )
+        self.assert_equal("copy has no graph yet", copy._G is None, True)
+
+        # Writes to either traffic matrix stay private
+        copy.traffic_matrix.tm[0, 5] = 1.0
+        problem.traffic_matrix.tm[2, 6] = 2.0
+        self.assert_equal(
+            "original tm[0, 5]", problem.traffic_matrix.tm[0, 5], tm[0, 5]
+        )
+        self.assert_equal("copy tm[2, 6]", copy.traffic_matrix.tm[2, 6], tm[2, 6])
+        problem.traffic_matrix.tm[2, 6] = tm[2, 6]
+
+        # ... and so do capacity changes, including in a copy of the copy
+        copy.set_capacities(copy.capacities / 2)
+        copy_of_copy = copy.copy()
+        copy_of_copy.set_capacities(copy_of_copy.capacities + 1)
+        self.assert_equal("original capacities", problem.capacities.tolist(), caps)
+        self.assert_equal(
+            "original graph",
+            [c_e for _, _, c_e in problem.G.edges.data("capacity")],
+            caps,
+        )
+        self.assert_equal(
+            "copy graph",
+            [c_e for _, _, c_e in copy.G.edges.data("capacity")],
+            [c_e / 2 for c_e in caps],
+        )
+        self.assert_equal(
+            "copy of copy graph",
+            [c_e for _, _, c_e in copy_of_copy.G.edges.data("capacity")],
+            [c_e / 2 + 1 for c_e in caps],
+        )
+        self.assert_equal("graph shared", copy.G is problem.G, False)
+
+        # Once it has its own graph, a copy keeps it in sync with its capacities
+        copy.set_capacities(caps)
+        self.assert_equal(
+            "copy graph after set_capacities",
+            [c_e for _, _, c_e in copy.G.edges.data("capacity")],
+            caps,
+        )
+
+        # Capacities written to G directly (followed by _invalidate_capacities)
+        # replace the cached capacity vector, for the problem and its copies
+        problem.fingerprint()
+        u, v = list(problem.G.edges)[0]
+        problem.G[u][v]["capacity"] = 0.0
+        problem._invalidate_capacities()
+        self.assert_equal("capacities after G write", problem.capacities[0], 0.0)
+        self.assert_equal(
+            "copy graph after G write", problem.copy().G[u][v]["capacity"], 0.0
+        )
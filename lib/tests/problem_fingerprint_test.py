@@ -0,0 +1,50 @@
+from .abstract_test import AbstractTest
+from ..problems import OptGapC1, OptGapC3
+
+# A problem's fingerprint depends on its topology, capacities and (if asked
+# for) commodities, not on its name, and follows changes to any of them.
+
+
+class ProblemFingerprintTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "problem-fingerprint"
+
+    def run(self):
+        problem = OptGapC3()
+        fingerprint = problem.fingerprint()
+        tm_fingerprint = problem.fingerprint(include_tm=True)
+
+        same = OptGapC3().copy()
+        same.name = "renamed"
+        self.assert_equal("renamed", same.fingerprint(include_tm=True), tm_fingerprint)
+        self.assert_equal(
+            "other problem", OptGapC1().fingerprint() == fingerprint, False
+        )
+        self.assert_equal("tm included", tm_fingerprint == fingerprint, False)
+
+        copy = problem.copy()
+        self.assert_equal("copy", copy.fingerprint(include_tm=True), tm_fingerprint)
+        copy.set_capacities(copy.capacities * 2)
+        self.assert_equal("new capacities", copy.fingerprint() == fingerprint, False)
+        self.assert_equal(
+            "same topology",
+            copy.topology.fingerprint,
+            problem.topology.fingerprint,
+        )
+        copy.set_capacities(problem.capacities)
+        self.assert_equal("old capacities", copy.fingerprint(), fingerprint)
+
+        copy.traffic_matrix.tm = copy.traffic_matrix.tm * 2
+        self.assert_equal(
+            "new tm", copy.fingerprint(include_tm=True) == tm_fingerprint, False
+        )
+        self.assert_equal("new tm, no tm", copy.fingerprint(), fingerprint)
+        copy.traffic_matrix.tm = problem.traffic_matrix.tm.copy()
+        copy.traffic_matrix.sparsify()
+        self.assert_equal(
+            "sparse tm", copy.fingerprint(include_tm=True), tm_fingerprint
+        )
@@ -0,0 +1,68 @@
+import numpy as np
+
+from .abstract_test import AbstractTest
+from ..problems import OptGapC1
+from ..problem_sequence import ProblemSequence
+from ..algorithms.path_formulation import PathFormulation
+
+# The steps of a problem sequence share the base problem's graph, and
+# re-solving a path LP with the deltas between steps should reach the same
+# optimum as solving a freshly built LP for every step.
+
+
+class ProblemSequenceTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "problem-sequence"
+
+    def run(self):
+        problem = OptGapC1()
+        problems = ProblemSequence.from_perturbations(
+            problem, 4, rel_delta_abs_mean=0.25, rel_delta_std=0.5
+        )
+        self.assert_equal("length", len(problems), 4)
+        self.assert_equal(
+            "first step",
+            np.array_equal(problems.tms[0], problem.traffic_matrix.tm),
+            True,
+        )
+        self.assert_equal("graph shared", problems[2]._G is None, True)
+        self.assert_equal(
+            "model", problems[2].traffic_matrix.model, problem.traffic_matrix.model
+        )
+        step = problems[2]
+        self.assert_equal("last step kept", problems[-2] is step, True)
+        problems[1]
+        self.assert_equal("previous step dropped", problems[2] is step, False)
+
+        copied = problems.copy()
+        copied[3].traffic_matrix.tm += 1.0
+        self.assert_equal(
+            "copy written to",
+            np.array_equal(
+                copied.tms[3], problems.tms[3] + 1.0 - np.eye(len(problem.G))
+            ),
+            True,
+        )
+        delta = problems.delta(2)
+        self.assert_equal(
+            "delta",
+            np.allclose(
+                problems.tms[2][delta.src, delta.dst],
+                problems.tms[1][delta.src, delta.dst] + delta.change,
+            ),
+            True,
+        )
+
+        for warm_start_mode in [False, True]:
+            pf = PathFormulation.new_total_flow(4)
+            pf._warm_start_mode = warm_start_mode
+            pf.solve(problems[0])
+            for i in range(1, len(problems)):
+                pf.resolve(problems[i], delta=problems.delta(i))
+                new_pf = PathFormulation.new_total_flow(4)
+                new_pf.solve(problems[i])
+                self.assert_eq_epsilon(pf.obj_val, new_pf.obj_val, epsilon=1e-3)
@@ -0,0 +1,159 @@
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from .abstract_test import AbstractTest
+from ..problem import Problem
+from ..problems import OptGapC3
+from benchmarks.benchmark_helpers import ProblemStream, problem_tables
+
+# A problem stream lists the traffic matrices of a traffic matrix directory in
+# the same order as the PROBLEMS and GROUPED_BY_PROBLEMS tables, with the same
+# file extensions (no .txt files in the holdout directory), and its slices are
+# slices of that order. Iterating over it, with or without prefetching, loads
+# every traffic matrix in that order into its own problem, and the problems of
+# a topology share its Topology.
+
+
+class ProblemStreamTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "problem-stream"
+
+    def run(self):
+        with tempfile.TemporaryDirectory() as tm_dir:
+            # listed out of order, across scale factors and extensions
+            for sub_dir, model, scale_factor, key, ext in [
+                ("", "toy", 2.0, 0, "pkl"),
+                ("", "toy", 1.0, 10, "txt"),
+                ("", "toy", 1.0, 2, "pkl"),
+                ("", "real", 1.0, 5, "pkl"),
+                ("holdout", "toy", 1.0, 1, "pkl"),
+                ("holdout", "toy", 1.0, 0, "txt"),
+            ]:
+                os.makedirs(os.path.join(tm_dir, sub_dir, model), exist_ok=True)
+                fname = "B4.json_{}_0_{}_{}_0.5_traffic-matrix.{}".format(
+                    model, scale_factor, key, ext
+                )
+                open(os.path.join(tm_dir, sub_dir, model, fname), "w").close()
+
+            for holdout in [False, True]:
+                stream = ProblemStream(["B4.json"], holdout=holdout, tm_dir=tm_dir)
+                fnames = list(stream.fnames())
+                problems, grouped_by_problems = problem_tables(holdout, tm_dir)
+                self.assert_equal(
+                    "holdout {}, stream vs. PROBLEMS".format(holdout),
+                    fnames,
+                    problems,
+                )
+                self.assert_equal(
+                    "holdout {}, stream vs. GROUPED_BY_PROBLEMS".format(holdout),
+                    [fname[1:] for fname in fnames],
+                    [
+                        topo_and_tm_fname
+                        for topo_and_tm_fnames in grouped_by_problems.values()
+                        for topo_and_tm_fname in topo_and_tm_fnames
+                    ],
+                )
+
+            self.assert_equal(
+                "order",
+                [
+                    os.path.basename(fname[-1])
+                    for fname in ProblemStream(["B4.json"], tm_dir=tm_dir).fnames()
+                ],
+                [
+                    "B4.json_real_0_1.0_5_0.5_traffic-matrix.pkl",
+                    "B4.json_toy_0_1.0_2_0.5_traffic-matrix.pkl",
+                    "B4.json_toy_0_1.0_10_0.5_traffic-matrix.txt",
+                    "B4.json_toy_0_2.0_0_0.5_traffic-matrix.pkl",
+                ],
+            )
+            self.assert_equal(
+                "holdout extensions",
+                [
+                    os.path.basename(fname[-1])
+                    for fname in ProblemStream(
+                        ["B4.json"], holdout=True, tm_dir=tm_dir
+                    ).fnames()
+                ],
+                ["B4.json_toy_0_1.0_1_0.5_traffic-matrix.pkl"],
+            )
+
+            stream = ProblemStream(["B4.json"], tm_dir=tm_dir)
+            sliced = stream[1:][::2]
+            self.assert_equal(
+                "slice",
+                (sliced.start, sliced.stop, sliced.step, sliced.tm_dir),
+                (1, None, 2, tm_dir),
+            )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            topologies_dir = os.path.join(tmp_dir, "topologies")
+            tm_dir = os.path.join(tmp_dir, "traffic-matrices")
+            os.makedirs(topologies_dir)
+            os.makedirs(os.path.join(tm_dir, "gravity"))
+            G = OptGapC3().G
+            Problem._write_graph_json(G, os.path.join(topologies_dir, "B4.json"))
+            tms = {}
+            for key in [30, 10, 20]:
+                tms[key] = np.full((len(G), len(G)), float(key))
+                np.fill_diagonal(tms[key], 0.0)
+                with open(
+                    os.path.join(
+                        tm_dir,
+                        "gravity",
+                        "B4.json_gravity_0_1.0_{}_False_traffic-matrix.pkl".format(key),
+                    ),
+                    "wb",
+                ) as w:
+                    pickle.dump(tms[key], w)
+
+            for prefetch in [True, False]:
+                stream = ProblemStream(
+                    ["B4.json"],
+                    ["gravity"],
+                    tm_dir=tm_dir,
+                    topologies_dir=topologies_dir,
+                    prefetch=prefetch,
+                )
+                problems = [problem for *_, problem in stream]
+                self.assert_equal(
+                    "prefetch {}, traffic matrices".format(prefetch),
+                    [problem.traffic_matrix.tm.tolist() for problem in problems],
+                    [tms[key].tolist() for key in [10, 20, 30]],
+                )
+                self.assert_equal(
+                    "prefetch {}, same topology".format(prefetch),
+                    all(
+                        problem.topology is problems[0].topology for problem in problems
+                    ),
+                    True,
+                )
+                problems[0].traffic_matrix.tm[0, 1] = 100.0
+                self.assert_equal(
+                    "prefetch {}, independent traffic matrices".format(prefetch),
+                    [problem.traffic_matrix.tm[0, 1] for problem in problems],
+                    [100.0, 20.0, 30.0],
+                )
+                self.assert_equal(
+                    "prefetch {}, slice".format(prefetch),
+                    [
+                        (os.path.basename(tm_fname), problem.traffic_matrix.tm.tolist())
+                        for _, _, tm_fname, problem in stream[1:]
+                    ],
+                    [
+                        (
+                            "B4.json_gravity_0_1.0_{}_False_traffic-matrix.pkl".format(
+                                key
+                            ),
+                            tms[key].tolist(),
+                        )
+                        for key in [20, 30]
+                    ],
+                )
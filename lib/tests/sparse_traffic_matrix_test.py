@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+import numpy as np
+
+from .abstract_test import AbstractTest
+from ..problems import OptGapC3
+from ..traffic_matrix import GravityTrafficMatrix, TrafficMatrix
+
+# A problem whose traffic matrix is stored sparse should have the same
+# commodities and demand totals as the dense one, and stay sparse when copied,
+# changed with set_demands and serialized.
+
+
+class SparseTrafficMatrixTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC3()
+
+    @property
+    def name(self):
+        return "sparse-traffic-matrix"
+
+    def run(self):
+        dense = self.problem
+        problem = dense.copy()
+        problem.traffic_matrix.sparsify()
+        problem._invalidate_commodity_lists()
+        tm = problem.traffic_matrix
+
+        self.assert_equal("is sparse", tm.is_sparse, True)
+        self.assert_equal("commodities", problem.commodity_list, dense.commodity_list)
+        self.assert_equal("total demand", problem.total_demand, dense.total_demand)
+        self.assert_equal("fullness", tm.fullness, dense.traffic_matrix.fullness)
+        self.assert_equal(
+            "is full", problem.is_traffic_matrix_full, dense.is_traffic_matrix_full
+        )
+        self.assert_equal(
+            "dense matrix unchanged", dense.traffic_matrix.is_sparse, False
+        )
+
+        # Copies share the sparse matrix until one of them changes it
+        copy = problem.copy()
+        copy.traffic_matrix.set_demands([0, 1], [5, 5], [1.0, 2.0])
+        self.assert_equal("copy is sparse", copy.traffic_matrix.is_sparse, True)
+        self.assert_equal(
+            "copy demand",
+            copy.traffic_matrix.tm[[0, 1], [5, 5]].tolist(),
+            [1.0, 2.0],
+        )
+        self.assert_equal("copy commodities", len(copy.commodity_list), 2)
+        self.assert_equal(
+            "original commodities", problem.commodity_list, dense.commodity_list
+        )
+
+        # Perturbing a sparse matrix only changes the stored demands
+        perturbed = tm.copy()
+        perturbed.perturb_matrix_mult(0, 0.5, tm.tm_view)
+        self.assert_equal("perturbed is sparse", perturbed.is_sparse, True)
+        self.assert_equal(
+            "perturbed support",
+            [sorted(zip(*m.tm.nonzero())) for m in [perturbed, tm]],
+            [sorted(zip(*tm.tm.nonzero()))] * 2,
+        )
+
+        # npz round trip
+        gravity_tm = GravityTrafficMatrix(problem, tm.tm_view, total_demand=None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            gravity_tm.serialize(tmp_dir, fmt="npz")
+            (fname,) = os.listdir(tmp_dir)
+            loaded = TrafficMatrix.from_file(os.path.join(tmp_dir, fname))
+        self.assert_equal(
+            "npz round trip",
+            (loaded.is_sparse, loaded.tm.toarray().tolist()),
+            (True, tm.tm.toarray().tolist()),
+        )
+
+        densified = tm.copy()
+        densified.densify()
+        self.assert_equal(
+            "densify", np.array_equal(densified.tm, dense.traffic_matrix.tm), True
+        )
@@ -13,6 +13,24 @@ from .single_edge_b import SingleEdgeBTest
 from .feasibility_test import FeasibilityTest
 from .flow_path_construction_test import FlowPathConstructionTest
 from .we_need_to_fix_this_test import WeNeedToFixThisTest
+from .path_formulation_test import PathFormulationTest
+from .path_formulation_resolve_test import PathFormulationResolveTest
+from .lp_backend_test import LpBackendTest
+from .path_computation_test import PathComputationTest
+from .path_store_test import PathStoreTest
+from .commodity_table_test import CommodityTableTest
+from .topology_test import TopologyTest
+from .problem_copy_test import ProblemCopyTest
+from .sparse_traffic_matrix_test import SparseTrafficMatrixTest
+from .problem_bundle_test import ProblemBundleTest
+from .traffic_matrix_generation_test import TrafficMatrixGenerationTest
+from .problem_sequence_test import ProblemSequenceTest
+from .problem_stream_test import ProblemStreamTest
+from .problem_fingerprint_test import ProblemFingerprintTest
+from .pop_parallel_test import POPParallelTest
+from .pop_splitter_test import POPSplitterTest
+from .entity_splitting_test import EntitySplittingTest
+from .precluster_cache_test import PreclusterCacheTest
 from .abstract_test import bcolors
 
 
@@ -30,6 +48,24 @@ ALL_TESTS = [
     OptGapC4Test(),
     # FeasibilityTest(), TODO
     FlowPathConstructionTest(),
+    PathFormulationTest(),
+    PathFormulationResolveTest(),
+    LpBackendTest(),
+    PathComputationTest(),
+    PathStoreTest(),
+    CommodityTableTest(),
+    TopologyTest(),
+    ProblemCopyTest(),
+    SparseTrafficMatrixTest(),
+    ProblemBundleTest(),
+    TrafficMatrixGenerationTest(),
+    ProblemSequenceTest(),
+    ProblemStreamTest(),
+    ProblemFingerprintTest(),
+    POPParallelTest(),
+    POPSplitterTest(),
+    EntitySplittingTest(),
+    PreclusterCacheTest(),
     # WeNeedToFixThisTest(), TODO
     # SingleEdgeBTest(), TODO
 ]
@@ -0,0 +1,84 @@
+from .abstract_test import AbstractTest, bcolors
+from ..graph_utils import compute_residual_problem
+from ..problems import OptGapC3
+
+# Problem's Topology and capacity vector should match G, and stay in sync with
+# it when the capacities change through the arrays.
+
+
+class TopologyTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC3()
+
+    @property
+    def name(self):
+        return "topology"
+
+    def run(self):
+        G = self.problem.G
+        topology = self.problem.topology
+        edges = list(G.edges)
+
+        self.assert_equal(
+            "edges",
+            list(zip(topology.src.tolist(), topology.dst.tolist())),
+            edges,
+        )
+        self.assert_equal(
+            "edge ids",
+            [topology.edge_id(u, v) for u, v in edges],
+            list(range(len(edges))),
+        )
+        self.assert_equal(
+            "out-edges",
+            [sorted(edges[e] for e in topology.out_edge_ids(u)) for u in G.nodes],
+            [sorted(G.out_edges(u)) for u in G.nodes],
+        )
+        self.assert_equal(
+            "in-edges",
+            [sorted(edges[e] for e in topology.in_edge_ids(u)) for u in G.nodes],
+            [sorted(G.in_edges(u)) for u in G.nodes],
+        )
+        self.assert_equal(
+            "capacities",
+            self.problem.capacities.tolist(),
+            [c_e for _, _, c_e in G.edges.data("capacity")],
+        )
+
+        # Subtracting a flow through the arrays updates G too
+        sol_dict = {
+            self.problem.commodity_list[0]: [((0, 1), 1.5), ((1, 3), 1.5)],
+            self.problem.commodity_list[1]: [((2, 3), 4.0), ((3, 4), 4.0)],
+        }
+        expected_caps = {edge: G.edges[edge]["capacity"] for edge in edges}
+        for flow_list in sol_dict.values():
+            for edge, l in flow_list:
+                expected_caps[edge] = max(expected_caps[edge] - l, 0.0)
+        residual_problem = compute_residual_problem(self.problem.copy(), sol_dict)
+        if residual_problem.topology is not topology:
+            self.has_error = True
+            print(bcolors.ERROR + "[ERROR] copy did not share topology" + bcolors.ENDC)
+        self.assert_equal(
+            "residual capacities in G",
+            {(u, v): c_e for u, v, c_e in residual_problem.G.edges.data("capacity")},
+            expected_caps,
+        )
+        self.assert_equal(
+            "residual capacities",
+            residual_problem.capacities.tolist(),
+            [expected_caps[edge] for edge in edges],
+        )
+        # ...and leaves the original problem alone
+        self.assert_equal(
+            "original capacities",
+            self.problem.capacities.tolist(),
+            [c_e for _, _, c_e in G.edges.data("capacity")],
+        )
+
+        try:
+            topology.edge_id(0, 6)
+            self.has_error = True
+            print(bcolors.ERROR + "[ERROR] (0, 6) is not an edge" + bcolors.ENDC)
+        except Exception:
+            pass
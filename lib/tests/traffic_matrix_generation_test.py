@@ -0,0 +1,55 @@
+import numpy as np
+
+from .abstract_test import AbstractTest
+from ..problems import OptGapC3
+from ..traffic_matrix import (
+    GravityTrafficMatrix,
+    PoissonTrafficMatrix,
+    UniformTrafficMatrix,
+)
+
+# Generated traffic matrices are deterministic given their seed, and matrix i
+# of a batch is the one generated with seed + i. Gravity-model demands add up
+# to the total demand.
+
+
+class TrafficMatrixGenerationTest(AbstractTest):
+    def __init__(self):
+        super().__init__()
+        self.problem = OptGapC3()
+
+    @property
+    def name(self):
+        return "traffic-matrix-generation"
+
+    def run(self):
+        problem = self.problem
+        models = {
+            "gravity": lambda seed: GravityTrafficMatrix(
+                problem, None, 100.0, random=True, seed=seed, scale_factor=2.0
+            ),
+            "uniform": lambda seed: UniformTrafficMatrix(problem, None, 5.0, seed=seed),
+            "poisson": lambda seed: PoissonTrafficMatrix(
+                problem, None, 4.0, 0.5, 2.0, seed=seed
+            ),
+        }
+        for model, new_tm in models.items():
+            self.assert_equal(
+                "{} determinism".format(model),
+                np.array_equal(new_tm(3).tm, new_tm(3).tm),
+                True,
+            )
+            batch = new_tm(3).generate_batch(4)
+            self.assert_equal(
+                "{} batch".format(model),
+                [np.array_equal(batch[i], new_tm(3 + i).tm) for i in range(4)],
+                [True] * 4,
+            )
+            self.assert_equal(
+                "{} zero diagonal".format(model),
+                np.any(np.diagonal(batch, axis1=1, axis2=2)),
+                False,
+            )
+
+        tm = GravityTrafficMatrix(problem, None, 100.0, random=False).tm
+        self.assert_equal("gravity total demand", round(float(tm.sum()), 3), 100.0)
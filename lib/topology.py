@@ -0,0 +1,133 @@
+import hashlib
+import numpy as np
+
+EDGE_DTYPE = np.int32
+OFFSET_DTYPE = np.int64
+
+
+# Immutable, array-based (CSR) view of the edges of a DiGraph whose nodes are
+# integers 0..num_nodes - 1. Edge e is the e-th edge in G.edges order and goes
+# from src[e] to dst[e]:
+#   - the ids of the out-edges of node u are
+#     out_edges[out_offsets[u]:out_offsets[u + 1]]
+#   - the ids of the in-edges of node u are
+#     in_edges[in_offsets[u]:in_offsets[u + 1]]
+# Edge capacities are kept separately (see Problem.capacities), since they
+# change far more often than the topology does.
+class Topology(object):
+    def __init__(self, num_nodes, src, dst):
+        self.num_nodes = num_nodes
+        self.src = src
+        self.dst = dst
+        self.out_edges = np.argsort(src, kind="stable").astype(EDGE_DTYPE)
+        self.out_offsets = self._offsets(src)
+        self.in_edges = np.argsort(dst, kind="stable").astype(EDGE_DTYPE)
+        self.in_offsets = self._offsets(dst)
+        # Edge keys (u * num_nodes + v) in sorted order, for edge id lookups
+        keys = src.astype(np.int64) * num_nodes + dst
+        self._key_order = np.argsort(keys, kind="stable").astype(EDGE_DTYPE)
+        self._sorted_keys = keys[self._key_order]
+        for arr in [
+            self.src,
+            self.dst,
+            self.out_edges,
+            self.out_offsets,
+            self.in_edges,
+            self.in_offsets,
+        ]:
+            arr.setflags(write=False)
+
+    @classmethod
+    def from_graph(cls, G):
+        num_edges = G.number_of_edges()
+        src = np.empty(num_edges, dtype=EDGE_DTYPE)
+        dst = np.empty(num_edges, dtype=EDGE_DTYPE)
+        for e, (u, v) in enumerate(G.edges):
+            src[e], dst[e] = u, v
+        num_nodes = max(G.nodes) + 1 if len(G) > 0 else 0
+        return cls(num_nodes, src, dst)
+
+    def _offsets(self, endpoints):
+        offsets = np.zeros(self.num_nodes + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(np.bincount(endpoints, minlength=self.num_nodes), out=offsets[1:])
+        return offsets
+
+    @property
+    def num_edges(self):
+        return len(self.src)
+
+    # Content fingerprint of the topology (its nodes and its edges, in edge id
+    # order), computed on first use; see array_fingerprint
+    @property
+    def fingerprint(self):
+        if not hasattr(self, "_fingerprint"):
+            self._fingerprint = array_fingerprint(
+                np.array([self.num_nodes], dtype=np.int64),
+                self.src.astype(np.int64),
+                self.dst.astype(np.int64),
+            )
+        return self._fingerprint
+
+    def has_same_edges(self, other):
+        return self is other or (
+            self.num_nodes == other.num_nodes
+            and np.array_equal(self.src, other.src)
+            and np.array_equal(self.dst, other.dst)
+        )
+
+    def out_edge_ids(self, u):
+        return self.out_edges[self.out_offsets[u] : self.out_offsets[u + 1]]
+
+    def in_edge_ids(self, u):
+        return self.in_edges[self.in_offsets[u] : self.in_offsets[u + 1]]
+
+    # Ids of the edges (us[i], vs[i]); raises if one of them is not an edge
+    def edge_ids(self, us, vs):
+        keys = np.asarray(us, dtype=np.int64) * self.num_nodes + np.asarray(
+            vs, dtype=np.int64
+        )
+        if len(self._sorted_keys) == 0:
+            if keys.size > 0:
+                raise Exception("topology has no edges")
+            return np.zeros(keys.shape, dtype=EDGE_DTYPE)
+        pos = np.minimum(
+            np.searchsorted(self._sorted_keys, keys), len(self._sorted_keys) - 1
+        )
+        missing = self._sorted_keys[pos] != keys
+        if np.any(missing):
+            i = np.flatnonzero(missing)[0]
+            raise Exception(
+                "({}, {}) is not an edge of the topology".format(
+                    np.ravel(us)[i], np.ravel(vs)[i]
+                )
+            )
+        return self._key_order[pos]
+
+    def edge_id(self, u, v):
+        return int(self.edge_ids([u], [v])[0])
+
+    # Total flow on every edge (indexed by edge id) of the [((u, v), l), ...]
+    # flow lists in flow_lists
+    def edge_flows(self, flow_lists):
+        us, vs, flows = [], [], []
+        for flow_list in flow_lists:
+            for (u, v), l in flow_list:
+                us.append(u)
+                vs.append(v)
+                flows.append(l)
+        if len(flows) == 0:
+            return np.zeros(self.num_edges)
+        return np.bincount(
+            self.edge_ids(us, vs), weights=flows, minlength=self.num_edges
+        )
+
+
+# Hex digest of the dtypes, shapes and contents of arrays. Equal arrays get
+# the same digest in every process, so it can be used in file names
+def array_fingerprint(*arrays):
+    h = hashlib.blake2b(digest_size=16)
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        h.update("{}{}".format(arr.dtype.str, arr.shape).encode("utf-8"))
+        h.update(arr.data)
+    return h.hexdigest()
@@ -1,29 +1,39 @@
-from .utils import uni_rand
-from collections import defaultdict
-
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
 
+import copy
 import pickle
 import os
 
 
+# A traffic matrix is either a dense num_nodes x num_nodes NumPy array or, in
+# sparse mode, a scipy.sparse CSR array that only stores the non-zero demands.
+# Both support the same element indexing (tm[s_k, t_k]), scaling and sums;
+# see sparsify and densify to switch between them.
 class TrafficMatrix(object):
     def __init__(self, problem, tm, seed, scale_factor):
         debug = False
         self._problem = problem
         self._seed = seed
         self._scale_factor = scale_factor
+        # True while _tm is shared with a copy of this traffic matrix
+        self._tm_is_shared = False
         if tm is not None:
-            self._tm = tm if isinstance(tm, np.ndarray) else np.array(tm)
+            if sp.issparse(tm):
+                self._tm = sp.csr_array(tm)
+                self._tm.sum_duplicates()
+            else:
+                self._tm = tm if isinstance(tm, np.ndarray) else np.array(tm)
             assert self._tm.shape[0] == self._tm.shape[1]  # Must be square
         else:
             self._init_traffic_matrix()
             self._tm *= self.scale_factor
 
         if debug:
-            print("% full:", np.count_nonzero(self._tm) / self._tm.size)
-            print("total demand:", np.sum(self._tm))
+            print("% full:", self.fullness)
+            print("total demand:", self.total_demand)
 
     @property
     def problem(self):
@@ -37,45 +47,134 @@ class TrafficMatrix(object):
     def scale_factor(self):
         return self._scale_factor
 
+    # Callers may write to the returned array, so if it is still shared with
+    # a copy, this traffic matrix gets its own copy of it first. In sparse
+    # mode, only write to entries that are already stored (e.g., commodities);
+    # use set_demands to change which entries are non-zero
     @property
     def tm(self):
+        self._own_tm()
         return self._tm
 
     @tm.setter
     def tm(self, other_tm):
-        self._tm = other_tm
-        np.fill_diagonal(self._tm, 0.0)
+        self._tm = _zero_diagonal(
+            sp.csr_array(other_tm) if sp.issparse(other_tm) else other_tm
+        )
+        self._tm_is_shared = False
         self._problem._invalidate_commodity_lists()
 
+    # Read-only view of the traffic matrix, which is never copied
+    @property
+    def tm_view(self):
+        if self.is_sparse:
+            return sp.csr_array(
+                (
+                    _read_only(self._tm.data),
+                    _read_only(self._tm.indices),
+                    _read_only(self._tm.indptr),
+                ),
+                shape=self._tm.shape,
+                copy=False,
+            )
+        return _read_only(self._tm)
+
+    @property
+    def is_sparse(self):
+        return sp.issparse(self._tm)
+
+    # Switch to sparse mode, dropping the zero entries
+    def sparsify(self):
+        if not self.is_sparse:
+            self._tm = sp.csr_array(self._tm)
+            self._tm_is_shared = False
+
+    # Switch to a dense array
+    def densify(self):
+        if self.is_sparse:
+            self._tm = self._tm.toarray()
+            self._tm_is_shared = False
+
+    # Replace the traffic matrix with one whose only non-zero entries are
+    # demand[i] from src[i] to dst[i] (repeated pairs are summed), in the same
+    # format (and dtype) as the current one
+    def set_demands(self, src, dst, demand):
+        num_nodes = self._tm.shape[0]
+        src = np.asarray(src, dtype=np.intp)
+        dst = np.asarray(dst, dtype=np.intp)
+        demand = np.asarray(demand, dtype=self._tm.dtype)
+        if self.is_sparse:
+            tm = sp.csr_array(
+                sp.coo_array((demand, (src, dst)), shape=(num_nodes, num_nodes))
+            )
+            tm.sum_duplicates()
+        else:
+            tm = np.zeros((num_nodes, num_nodes), dtype=self._tm.dtype)
+            np.add.at(tm, (src, dst), demand)
+        self.tm = tm
+
+    def _own_tm(self):
+        if self._tm_is_shared:
+            self._tm = self._tm.copy()
+            self._tm_is_shared = False
+
+    # Copy-on-write: copy_tm (a new traffic matrix built on this one's array)
+    # and this traffic matrix share the array until either accesses tm
+    def _share_tm(self, copy_tm):
+        self._tm_is_shared = True
+        copy_tm._tm_is_shared = True
+        return copy_tm
+
+    # Traffic matrix of the same model and parameters as this one, on tm,
+    # which it neither copies nor shares: writes to its tm go to tm
+    def with_tm(self, tm):
+        traffic_matrix = copy.copy(self)
+        traffic_matrix._tm = tm
+        traffic_matrix._tm_is_shared = False
+        return traffic_matrix
+
+    def _count_nonzero(self):
+        if self.is_sparse:
+            return self._tm.count_nonzero()
+        return np.count_nonzero(self._tm)
+
     @property
     def total_demand(self):
-        return np.sum(self._tm)
+        return self._tm.sum()
 
     @property
     def fullness(self):
-        return np.count_nonzero(self._tm) / self._tm.size
+        return self._count_nonzero() / (self._tm.shape[0] * self._tm.shape[1])
 
+    # Whether every off-diagonal entry is non-zero (and the diagonal is zero)
     @property
     def is_full(self):
-        return np.alltrue(
-            np.argwhere(self._tm == 0.0)
-            == np.array([[i, i] for i in range(self.tm.shape[0])])
-        )
+        if np.any(self._tm.diagonal()):
+            return False
+        num_nodes = self._tm.shape[0]
+        return self._count_nonzero() == num_nodes * (num_nodes - 1)
 
+    # "npz" saves the traffic matrix as a scipy.sparse .npz file (whether or
+    # not it is in sparse mode), which from_file loads in sparse mode
     def serialize(self, dir_path, fmt="pickle"):
         if fmt == "pickle":
             with open(
                 os.path.join(dir_path, "{}_traffic-matrix.pkl".format(self._fname)),
                 "wb",
             ) as w:
-                pickle.dump(self.tm, w)
+                pickle.dump(self._tm, w)
         elif fmt == "text":
             np.savetxt(
                 "{}_traffic-matrix.txt".format(self._fname),
-                self.tm,
+                self._tm.toarray() if self.is_sparse else self._tm,
                 fmt="%10.7f",
                 delimiter=" ",
             )
+        elif fmt == "npz":
+            sp.save_npz(
+                os.path.join(dir_path, "{}_traffic-matrix.npz".format(self._fname)),
+                sp.csr_array(self._tm),
+            )
         else:
             raise Exception('"{}" not a valid serialization format'.format(fmt))
 
@@ -86,14 +185,23 @@ class TrafficMatrix(object):
                 tm = pickle.load(f).astype('float64')
         elif fname.endswith(".txt"):
             tm = np.loadtxt(fname)
+        elif fname.endswith(".npz"):
+            tm = sp.load_npz(fname).astype("float64")
         else:
             raise Exception('"{}" not a valid file format'.format(fname))
+        return cls.from_array(tm, fname)
 
+    # Traffic matrix of the model and parameters that fname, the name of the
+    # file tm was read from, encodes
+    @classmethod
+    def from_array(cls, tm, fname):
         vals = os.path.basename(fname)[:-4].split("_")
         model, seed, scale_factor = vals[1], int(vals[2]), float(vals[3])
         vals = vals[4:]
 
-        if model == "gravity":
+        if model == "generic":
+            return GenericTrafficMatrix(problem=None, tm=tm, scale_factor=scale_factor)
+        elif model == "gravity":
             random = True if vals[0] == "True" else False
             return GravityTrafficMatrix(
                 problem=None,
@@ -161,23 +269,44 @@ class TrafficMatrix(object):
                 scale_factor=scale_factor,
             )
 
+    # In sparse mode, only the non-zero demands are perturbed
     def perturb_matrix(self, mean, stddev):
+        self._own_tm()
+        if self.is_sparse:
+            data = self._tm.data
+            data += np.random.normal(mean, stddev, data.shape)
+            data[data < 0.0] = 0.0  # demands can never be less than 0
+            self._tm.eliminate_zeros()
+            return
         self._tm += np.random.normal(mean, stddev, self._tm.shape)
         np.fill_diagonal(self._tm, 0.0)
         self._tm[self._tm < 0.0] = 0.0  # demands can never be less than 0
 
     def perturb_matrix_mult(self, mean, stdev, seed_prob_tm):
+        self._own_tm()
         self._tm *= 1 + np.random.choice([-1, 1]) * np.random.normal(mean, stdev)
+        if self.is_sparse:
+            seed_prob_tm = sp.csr_array(seed_prob_tm)
+            too_low = (0.1 * seed_prob_tm - self._tm) > 0.0
+            self._tm = self._tm - self._tm * too_low + seed_prob_tm * too_low
+            self._tm.eliminate_zeros()
+            return
         np.fill_diagonal(
             self._tm, 0.0
         )  # should not be needed if self._tm has a zero diagonal
         too_low_indexes = self._tm < 0.1 * seed_prob_tm
         self._tm[too_low_indexes] = seed_prob_tm[too_low_indexes]
 
+    # Traffic matrices in sparse mode stay sparse: if _update generates a
+    # new, dense matrix, it is sparsified again
     def update_matrix(self, scale_factor, type, **kwargs):
+        self._own_tm()
+        was_sparse = self.is_sparse
         self._seed += 1
         self._scale_factor = scale_factor
         self._update(type, **kwargs)
+        if was_sparse:
+            self.sparsify()
         self._tm *= self.scale_factor
         self.problem._invalidate_commodity_lists()
 
@@ -204,9 +333,41 @@ class TrafficMatrix(object):
             "copy needs to be implemented in the subclass: {}".format(self.__class__)
         )
 
+    # num_tms matrices of this traffic matrix's model and parameters, as a
+    # num_tms x num_nodes x num_nodes array: matrix i is the tm of the same
+    # traffic matrix with seed seed + i (this one's seed by default), e.g., for
+    # a time series. Whatever the matrices share (distances, gravity
+    # fractions) is only computed once
+    def generate_batch(self, num_tms, seed=None):
+        if seed is None:
+            seed = self.seed
+        shared = self._shared_generation_data()
+        tms = None
+        for i in range(num_tms):
+            np.random.seed(seed + i)
+            tm = self._generate(shared)
+            if tms is None:
+                tms = np.empty((num_tms,) + tm.shape, dtype=tm.dtype)
+            tms[i] = tm
+        if tms is None:
+            num_nodes = len(self.problem.G)
+            return np.empty((0, num_nodes, num_nodes), dtype=np.float32)
+        tms *= self.scale_factor
+        return tms
+
+    # Models that generate their matrix draw it as a whole in _generate, with
+    # np.random seeded with the matrix's seed, from the data that
+    # _shared_generation_data computes from the problem
     def _init_traffic_matrix(self):
+        np.random.seed(self.seed)
+        self._tm = self._generate(self._shared_generation_data())
+
+    def _shared_generation_data(self):
+        return None
+
+    def _generate(self, shared):
         raise NotImplementedError(
-            "_init_traffic_matrix needs to be implemented in the subclass: {}".format(
+            "_generate needs to be implemented in the subclass: {}".format(
                 self.__class__
             )
         )
@@ -237,7 +398,7 @@ class GenericTrafficMatrix(TrafficMatrix):
         return "generic"
 
     def copy(self):
-        return GenericTrafficMatrix(self.problem, self._tm.copy())
+        return self._share_tm(GenericTrafficMatrix(self.problem, self._tm))
 
     def _init_traffic_matrix(self):
         pass
@@ -270,46 +431,56 @@ class GravityTrafficMatrix(TrafficMatrix):
         return self._random
 
     def copy(self):
-        return GravityTrafficMatrix(
-            self.problem,
-            self._tm.copy(),
-            self.total_demand,
-            self.random,
-            self.seed,
-            self.scale_factor,
+        return self._share_tm(
+            GravityTrafficMatrix(
+                self.problem,
+                self._tm,
+                self.total_demand,
+                self.random,
+                self.seed,
+                self.scale_factor,
+            )
         )
 
-    def _init_traffic_matrix(self):
-        np.random.seed(self.seed)
+    # Fraction of the total demand from u to v, for every u != v in the same
+    # strongly connected component: u's share of the component's outgoing
+    # capacity times v's share of the incoming capacity of the component's
+    # other nodes. Returned as (us, vs, fractions), component by component,
+    # in row-major order within each one
+    def _shared_generation_data(self):
+        G = self.problem.G
+        topology, capacities = self.problem.topology, self.problem.capacities
+        num_nodes = len(G.nodes)
+        in_cap_sum = np.bincount(topology.dst, capacities, minlength=num_nodes)
+        out_cap_sum = np.bincount(topology.src, capacities, minlength=num_nodes)
+
+        us, vs, fracs = [], [], []
+        for scc in nx.strongly_connected_components(G):
+            if len(scc) == 1:
+                continue
+            nodes = np.fromiter(scc, dtype=np.intp, count=len(scc))
+            in_caps, out_caps = in_cap_sum[nodes], out_cap_sum[nodes]
+            norm = out_caps / out_caps.sum()
+            frac = np.outer(norm, in_caps) / (in_caps.sum() - in_caps)[:, None]
+            rows, cols = np.nonzero(~np.eye(len(nodes), dtype=bool))
+            us.append(nodes[rows])
+            vs.append(nodes[cols])
+            fracs.append(frac[rows, cols])
+        if len(us) == 0:
+            return (np.zeros(0, dtype=np.intp),) * 2 + (np.zeros(0),)
+        return np.concatenate(us), np.concatenate(vs), np.concatenate(fracs)
+
+    def _generate(self, shared):
+        us, vs, fracs = shared
         num_nodes = len(self.problem.G.nodes)
-        self._tm = np.zeros((num_nodes, num_nodes), dtype=np.float32)
-
-        sccs = nx.strongly_connected_components(self.problem.G)
-        for scc in sccs:
-            in_cap_sum, out_cap_sum = defaultdict(float), defaultdict(float)
-            for u in scc:
-                for v in self.problem.G.predecessors(u):
-                    in_cap_sum[u] += self.problem.G[v][u]["capacity"]
-                for v in self.problem.G.successors(u):
-                    out_cap_sum[u] += self.problem.G[u][v]["capacity"]
-            in_cap_sum, out_cap_sum = dict(in_cap_sum), dict(out_cap_sum)
-
-            in_total_cap = sum(in_cap_sum.values())
-            out_total_cap = sum(out_cap_sum.values())
-
-            for u in scc:
-                norm_u = out_cap_sum[u] / out_total_cap
-                for v in scc:
-                    if u == v:
-                        continue
-                    frac = norm_u * in_cap_sum[v] / (in_total_cap - in_cap_sum[u])
-                    if self.random:
-                        # sample from gaussian with mean = frac, stddev = frac / 4
-                        self._tm[u, v] = max(np.random.normal(frac, frac / 4), 0.0)
-                    else:
-                        self._tm[u, v] = frac
-
-        self._tm *= self._total_demand
+        tm = np.zeros((num_nodes, num_nodes), dtype=np.float32)
+        if self.random:
+            # sample from gaussian with mean = frac, stddev = frac / 4
+            tm[us, vs] = np.maximum(np.random.normal(fracs, fracs / 4), 0.0)
+        else:
+            tm[us, vs] = fracs
+        tm *= self._total_demand
+        return tm
 
     def _update(self, _=None):
         self._init_traffic_matrix()
@@ -336,17 +507,19 @@ class UniformTrafficMatrix(TrafficMatrix):
         return "uniform"
 
     def copy(self):
-        return UniformTrafficMatrix(
-            self.problem, self._tm.copy(), self.max_demand, self.seed, self.scale_factor
+        return self._share_tm(
+            UniformTrafficMatrix(
+                self.problem, self._tm, self.max_demand, self.seed, self.scale_factor
+            )
         )
 
-    def _init_traffic_matrix(self):
-        np.random.seed(self.seed)
+    def _generate(self, _):
         num_nodes = len(self.problem.G.nodes)
 
-        self._tm = np.random.rand(num_nodes, num_nodes) * self._max_demand
-        self._tm = self._tm.astype(np.float32)
-        np.fill_diagonal(self._tm, 0.0)
+        tm = np.random.rand(num_nodes, num_nodes) * self._max_demand
+        tm = tm.astype(np.float32)
+        np.fill_diagonal(tm, 0.0)
+        return tm
 
     def _update(self, _=None):
         self._init_traffic_matrix()
@@ -383,44 +556,33 @@ class ExponentialTrafficMatrix(TrafficMatrix):
         return "exponential"
 
     def copy(self):
-        return ExponentialTrafficMatrix(
-            self.problem,
-            self._tm.copy(),
-            self.beta,
-            self.decay,
-            self.const_factor,
-            self.seed,
-            self.scale_factor,
+        return self._share_tm(
+            ExponentialTrafficMatrix(
+                self.problem,
+                self._tm,
+                self.beta,
+                self.decay,
+                self.const_factor,
+                self.seed,
+                self.scale_factor,
+            )
         )
 
-    def _init_traffic_matrix(self):
-        G = self.problem.G
-        np.random.seed(self.seed)
-        num_nodes = len(G.nodes)
+    def _shared_generation_data(self):
+        return _hop_distances(self.problem)
 
-        distances = np.zeros((num_nodes, num_nodes), dtype=np.int)
-        dist_iter = nx.shortest_path_length(G)
-        for src, dist_dict in dist_iter:
-            for target, dist in dist_dict.items():
-                distances[src, target] = dist
-
-        self._tm = np.array(
-            [
-                [
-                    np.random.exponential(self._beta * (self._decay ** dist))
-                    for dist in row
-                ]
-                for row in distances
-            ],
-            dtype=np.float32,
+    def _generate(self, distances):
+        tm = np.random.exponential(self._beta * (self._decay**distances)).astype(
+            np.float32
         )
         # No traffic between node and itself
-        np.fill_diagonal(self._tm, 0.0)
+        np.fill_diagonal(tm, 0.0)
 
-        self._tm *= self._const_factor
+        tm *= self._const_factor
+        return tm
 
-    def _update(self, scale_factor, _=None):
-        self._init_traffic_matrix(scale_factor)
+    def _update(self, _=None):
+        self._init_traffic_matrix()
 
     @property
     def _fname_suffix(self):
@@ -452,38 +614,30 @@ class PoissonTrafficMatrix(TrafficMatrix):
         return "poisson"
 
     def copy(self):
-        return PoissonTrafficMatrix(
-            self.problem,
-            self._tm.copy(),
-            self.lam,
-            self._decay,
-            self._const_factor,
-            self.seed,
-            self.scale_factor,
+        return self._share_tm(
+            PoissonTrafficMatrix(
+                self.problem,
+                self._tm,
+                self.lam,
+                self._decay,
+                self._const_factor,
+                self.seed,
+                self.scale_factor,
+            )
         )
 
-    def _init_traffic_matrix(self):
-        G = self.problem.G
-        np.random.seed(self.seed)
-        num_nodes = len(G.nodes)
+    def _shared_generation_data(self):
+        return _hop_distances(self.problem)
 
-        distances = np.zeros((num_nodes, num_nodes), dtype=np.int)
-        dist_iter = nx.shortest_path_length(G)
-        for src, dist_dict in dist_iter:
-            for target, dist in dist_dict.items():
-                distances[src, target] = dist
-
-        self._tm = np.array(
-            [
-                [np.random.poisson(self._lam * (self._decay ** dist)) for dist in row]
-                for row in distances
-            ],
-            dtype=np.float32,
+    def _generate(self, distances):
+        tm = np.random.poisson(self._lam * (self._decay**distances)).astype(
+            np.float32
         )
         # No traffic between node and itself
-        np.fill_diagonal(self._tm, 0.0)
+        np.fill_diagonal(tm, 0.0)
 
-        self._tm *= self._const_factor
+        tm *= self._const_factor
+        return tm
 
     def _update(self, _=None):
         self._init_traffic_matrix()
@@ -512,24 +666,25 @@ class GaussianTrafficMatrix(TrafficMatrix):
         return "gaussian"
 
     def copy(self):
-        return GaussianTrafficMatrix(
-            self.problem,
-            self._tm.copy(),
-            self.mean,
-            self.stddev,
-            self.seed,
-            self.scale_factor,
+        return self._share_tm(
+            GaussianTrafficMatrix(
+                self.problem,
+                self._tm,
+                self.mean,
+                self.stddev,
+                self.seed,
+                self.scale_factor,
+            )
         )
 
-    def _init_traffic_matrix(self):
-        G = self.problem.G
-        np.random.seed(self.seed)
-        num_nodes = len(G.nodes)
+    def _generate(self, _):
+        num_nodes = len(self.problem.G.nodes)
 
-        self._tm = np.random.normal(self.mean, self.stddev, (num_nodes, num_nodes))
-        self._tm[self._tm < 0.0] = 0.0
+        tm = np.random.normal(self.mean, self.stddev, (num_nodes, num_nodes))
+        tm[tm < 0.0] = 0.0
         # No traffic between node and itself
-        np.fill_diagonal(self._tm, 0.0)
+        np.fill_diagonal(tm, 0.0)
+        return tm
 
     def _update(self, _=None):
         self._init_traffic_matrix()
@@ -574,36 +729,35 @@ class BimodalTrafficMatrix(TrafficMatrix):
         return "bimodal"
 
     def copy(self):
-        return BimodalTrafficMatrix(
-            self.problem,
-            self._tm.copy(),
-            self.fraction,
-            self.low_range,
-            self.high_range,
-            self.seed,
-            self.scale_factor,
+        return self._share_tm(
+            BimodalTrafficMatrix(
+                self.problem,
+                self._tm,
+                self.fraction,
+                self.low_range,
+                self.high_range,
+                self.seed,
+                self.scale_factor,
+            )
         )
 
-    def _init_traffic_matrix(self):
-        G = self.problem.G
-        np.random.seed(self.seed)
-        num_nodes = len(G.nodes)
+    def _generate(self, _):
+        num_nodes = len(self.problem.G.nodes)
 
-        self._tm = np.zeros((num_nodes, num_nodes))
+        tm = np.zeros((num_nodes, num_nodes))
         inds = np.random.choice(
             2, (num_nodes, num_nodes), p=[self.fraction, 1 - self.fraction]
         ).astype("bool")
-        self._tm[inds] = np.random.uniform(
-            self.low_range[0], self.low_range[1], np.sum(inds)
-        )
-        self._tm[~inds] = np.random.uniform(
+        tm[inds] = np.random.uniform(self.low_range[0], self.low_range[1], np.sum(inds))
+        tm[~inds] = np.random.uniform(
             self.high_range[0], self.high_range[1], np.sum(~inds)
         )
         # No traffic between node and itself
-        np.fill_diagonal(self._tm, 0.0)
+        np.fill_diagonal(tm, 0.0)
+        return tm
 
-    def _update(self, scale_factor, _=None):
-        self._init_traffic_matrix(scale_factor)
+    def _update(self, _=None):
+        self._init_traffic_matrix()
 
     @property
     def _fname_suffix(self):
@@ -635,46 +789,83 @@ class RealTrafficMatrix(TrafficMatrix):
         return self._time
 
     def copy(self):
-        return RealTrafficMatrix(
-            self.problem,
-            self._tm.copy(),
-            self.date,
-            self.time,
-            self.seed,
-            self.scale_factor,
+        return self._share_tm(
+            RealTrafficMatrix(
+                self.problem,
+                self._tm,
+                self.date,
+                self.time,
+                self.seed,
+                self.scale_factor,
+            )
         )
 
     def _init_traffic_matrix(self):
         pass
 
     def _update(self, scale_factor, type, **kwargs):
+        # In sparse mode, only the non-zero demands change, so only they are
+        # perturbed
+        vals = self._tm.data if self.is_sparse else self._tm
         if type == "uniform":
             alpha = kwargs["alpha"]
             assert alpha > 0.0
-
-            def new_val(val):
-                # w~Uni(-1, 1)
-                # perturb each demand by +/- alpha * |w|
-                return max(0, val * (1 + alpha * uni_rand(-1, 1)))
-
+            # w~Uni(-1, 1)
+            # perturb each demand by +/- alpha * |w|
+            w = 2 * np.random.rand(*vals.shape) - 1
+            new_vals = np.maximum(0, vals * (1 + alpha * w))
         elif type == "scale":
             assert scale_factor > 0.0
-
-            def new_val(val):
-                # scale each demand by `scale`
-                return val * scale_factor
-
+            # scale each demand by `scale`
+            new_vals = vals * scale_factor
         else:
             raise Exception(
                 '"{}" not a valid perturbation type for the traffic matrix'.format(type)
             )
 
-        mat = np.zeros_like(self.tm)
-        for i in range(mat.shape[0]):
-            for j in range(mat.shape[1]):
-                mat[i, j] = new_val(self._tm[i, j])
-        self._tm = mat
+        if self.is_sparse:
+            mat = self._tm.copy()
+            mat.data = new_vals.astype(mat.dtype)
+            mat.eliminate_zeros()
+            self._tm = mat
+            return
+        self._tm = new_vals.astype(self._tm.dtype)
 
     @property
     def _fname_suffix(self):
         return "{}_{}".format(self.date, self.time)
+
+
+# Number of hops from every node to every other one; 0 if there is no path
+def _hop_distances(problem):
+    topology = problem.topology
+    num_nodes = len(problem.G.nodes)
+    adjacency = sp.csr_array(
+        (np.ones(topology.num_edges), (topology.src, topology.dst)),
+        shape=(num_nodes, num_nodes),
+    )
+    distances = csgraph.shortest_path(adjacency, unweighted=True)
+    distances[np.isinf(distances)] = 0
+    return distances.astype(np.int64)
+
+
+def _read_only(arr):
+    view = arr.view()
+    view.setflags(write=False)
+    return view
+
+
+# tm with its diagonal zeroed: in place for a dense array; a sparse one loses
+# its diagonal entries
+def _zero_diagonal(tm):
+    if not sp.issparse(tm):
+        np.fill_diagonal(tm, 0.0)
+        return tm
+    coo = tm.tocoo()
+    off_diagonal = coo.row != coo.col
+    if np.all(off_diagonal):
+        return tm
+    return sp.csr_array(
+        (coo.data[off_diagonal], (coo.row[off_diagonal], coo.col[off_diagonal])),
+        shape=tm.shape,
+    )
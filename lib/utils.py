@@ -1,5 +1,7 @@
 import numpy as np
 from collections import defaultdict
+from .topology import Topology
+
 
 # sort commods from lowest demand to highest demand
 # flow_remaining = flow_val
@@ -89,20 +91,13 @@ def compute_max_link_util(G, sol_dict):
 
 
 def link_util_stats(G, sol_dict):
-    edge_flows = defaultdict(float)
-
-    for flow_list in sol_dict.values():
-        for (u, v), l in flow_list:
-            edge_flows[(u, v)] += l
-
-    edge_utils = {}
-    for u, v, c_e in G.edges.data("capacity"):
-        if c_e == 0.0:
-            assert edge_flows[(u, v)] == 0.0
-            edge_utils[(u, v)] = 0.0
-        else:
-            edge_utils[(u, v)] = edge_flows[(u, v)] / c_e
-
-    values = list(edge_utils.values())
+    edge_flows = Topology.from_graph(G).edge_flows(sol_dict.values())
+    capacities = np.array([c_e for _, _, c_e in G.edges.data("capacity")])
+
+    no_cap = capacities == 0.0
+    assert np.all(edge_flows[no_cap] == 0.0)
+    values = np.divide(
+        edge_flows, capacities, out=np.zeros(len(capacities)), where=~no_cap
+    )
 
     return np.min(values), np.median(values), np.mean(values), np.max(values)